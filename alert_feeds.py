@@ -0,0 +1,138 @@
+"""Alert feeds - The latest CTA service alert from @CTA on Twitter or the CTA Customer Alerts API"""
+from collections import namedtuple
+
+from http_transport import HttpTransport  # Used for API Calls
+
+# alert_id changes whenever there is a new alert, heading is shown at the top of the alert page
+Alert = namedtuple("Alert", ["alert_id", "text", "heading"])
+
+# The CTA's Twitter account
+CTA_TWITTER_USER_ID = "342782636"
+
+
+class TwitterAlertFeed:
+    """The newest @CTA tweet that starts with alert_prefix - Only asks for tweets newer than the last one seen
+
+    The first fetch reads back up to max_pages pages of max_results tweets looking
+    for an alert. After that only tweets after the newest one already seen are
+    requested (since_id), which is usually an empty response."""
+
+    def __init__(self,
+                 timeline_url,
+                 authorization,
+                 user_id=CTA_TWITTER_USER_ID,
+                 alert_prefix="[",
+                 max_results=10,
+                 max_pages=3,
+                 timeout=10,
+                 transport=None):
+        self.timeline_url = timeline_url.format(user_id)
+        self.authorization = authorization
+        self.alert_prefix = alert_prefix
+        self.max_results = max_results
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.transport = HttpTransport() if transport is None else transport
+        self.newest_id = None
+        self.latest_alert = None
+
+    def fetch(self):
+        """Returns (latest alert or None, True if it changed)"""
+        parameters = {"max_results": self.max_results}
+        if self.newest_id is not None:
+            parameters["since_id"] = self.newest_id
+        newest_id = self.newest_id
+        found_alert = None
+        for _ in range(self.max_pages):
+            api_response = self.transport.get(
+                self.timeline_url,
+                headers={"Authorization": self.authorization},
+                params=parameters,
+                timeout=self.timeout)
+            api_response.raise_for_status()
+            tweets_json = api_response.json()
+            # Newest first - A tweet at or before since_id is one we've already seen
+            for tweet in tweets_json.get("data", []):
+                if self.newest_id is not None and int(tweet["id"]) <= int(
+                        self.newest_id):
+                    continue
+                if newest_id is None or int(tweet["id"]) > int(newest_id):
+                    newest_id = tweet["id"]
+                # All status Tweets start with an Open Bracket - Hoping to filter out some of the other garbage
+                if found_alert is None and str(tweet["text"]).startswith(
+                        self.alert_prefix):
+                    found_alert = Alert(tweet["id"], tweet["text"],
+                                        "Latest Tweet from @CTA")
+            next_token = tweets_json.get("meta", {}).get("next_token")
+            if found_alert is not None or next_token is None:
+                break
+            parameters["pagination_token"] = next_token
+        self.newest_id = newest_id
+        if found_alert is None or found_alert == self.latest_alert:
+            return self.latest_alert, False
+        self.latest_alert = found_alert
+        return self.latest_alert, True
+
+
+class CtaAlertsFeed:
+    """The most severe active alert from the CTA Customer Alerts API (outputType=JSON)"""
+
+    def __init__(self, alerts_url, timeout=10, transport=None):
+        self.alerts_url = alerts_url
+        self.timeout = timeout
+        self.transport = HttpTransport() if transport is None else transport
+        self.latest_alert = None
+
+    def fetch(self):
+        """Returns (latest alert or None, True if it changed)"""
+        api_response = self.transport.get(self.alerts_url,
+                                          timeout=self.timeout)
+        api_response.raise_for_status()
+        alerts = api_response.json()["CTAAlerts"].get("Alert") or []
+        # A single alert comes back as an object rather than a list
+        if isinstance(alerts, dict):
+            alerts = [alerts]
+        found_alert = None
+        highest_severity = None
+        for alert in alerts:
+            severity = int(alert.get("SeverityScore") or 0)
+            if highest_severity is None or severity > highest_severity:
+                highest_severity = severity
+                found_alert = Alert(
+                    str(alert["AlertId"]), alert["Headline"] + ": " +
+                    (alert.get("ShortDescription") or ""), "CTA Service Alert")
+        changed = found_alert != self.latest_alert
+        self.latest_alert = found_alert
+        return self.latest_alert, changed
+
+
+ALERT_FEEDS = ("twitter", "cta-alerts")
+
+
+def create_alert_feed(feed_name,
+                      feed_settings,
+                      twitter_authorization,
+                      timeout=10,
+                      transport=None):
+    """Creates the alert feed named in settings.json (tweet-tracker.feed)"""
+    if feed_name == "twitter":
+        return TwitterAlertFeed(feed_settings["api-url"],
+                                twitter_authorization,
+                                timeout=timeout,
+                                transport=transport)
+    if feed_name == "cta-alerts":
+        return CtaAlertsFeed(feed_settings["cta-alerts-api-url"],
+                             timeout=timeout,
+                             transport=transport)
+    raise ValueError("Unknown alert feed " + feed_name + " - Use one of " +
+                     ", ".join(ALERT_FEEDS))
+
+
+def alert_to_dict(alert):
+    """An alert as plain JSON types - None stays None"""
+    return None if alert is None else alert._asdict()
+
+
+def alert_from_dict(alert_dict):
+    """Rebuilds an alert made by alert_to_dict"""
+    return None if alert_dict is None else Alert(**alert_dict)
@@ -0,0 +1,145 @@
+"""Local HTTP/JSON server so several displays can share one fetch loop"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from alert_feeds import alert_to_dict
+from arrivals_store import item_to_dict
+
+# Query parameter for the ids of each item type a display wants
+ITEM_ID_PARAMETERS = {
+    "train": "train-stop-ids",
+    "bus": "bus-stop-ids",
+    "bicycle": "divvy-station-ids"
+}
+
+
+def item_id(item):
+    """The stop or station id a display item is configured by"""
+    return item.station_id if item.item_type == "bicycle" else item.stop_id
+
+
+class ArrivalsServer:
+    """Serves the newest snapshot to display clients over long-polling
+
+    GET /snapshot?since=<version>&train-stop-ids=...&bus-stop-ids=...&divvy-station-ids=...
+    answers as soon as a snapshot newer than since is published (or straight away
+    if there already is one), or with 204 No Content after wait_seconds. An id
+    parameter that is left out means every item of that type, an empty one means
+    none. Responses are cached per snapshot and filter, so any number of displays
+    with the same configuration cost one serialization per snapshot."""
+
+    def __init__(self, snapshot_publisher, host="0.0.0.0", port=8750,
+                 wait_seconds=25):
+        self.snapshot_publisher = snapshot_publisher
+        self.host = host
+        self.port = port
+        self.wait_seconds = wait_seconds
+        self.http_server = None
+        self.cache_lock = threading.Lock()
+        self.cached_version = None
+        self.cached_bodies = {}  # filter -> JSON bytes for cached_version
+
+    def start(self):
+        """Starts serving on a background thread"""
+        self.http_server = ThreadingHTTPServer((self.host, self.port),
+                                               ArrivalsRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.arrivals_server = self
+        threading.Thread(target=self.http_server.serve_forever,
+                         name="arrivals-server",
+                         daemon=True).start()
+        print("Serving arrivals on http://" + self.host + ":" +
+              str(self.http_server.server_address[1]) + "/snapshot")
+
+    def stop(self):
+        """Stops serving"""
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+
+    def snapshot_body(self, snapshot, wanted_ids, include_tweet):
+        """The JSON for a snapshot filtered to the wanted ids - Built once per snapshot and filter"""
+        filter_key = (tuple(
+            (item_type, None if ids is None else tuple(ids))
+            for item_type, ids in sorted(wanted_ids.items())), include_tweet)
+        with self.cache_lock:
+            if self.cached_version != snapshot["version"]:
+                self.cached_version = snapshot["version"]
+                self.cached_bodies = {}
+            if filter_key in self.cached_bodies:
+                return self.cached_bodies[filter_key]
+
+        items_by_id = {}
+        for item in snapshot["items"]:
+            items_by_id.setdefault((item.item_type, item_id(item)),
+                                   []).append(item)
+        wanted_items = []
+        for item_type in ITEM_ID_PARAMETERS:
+            if wanted_ids[item_type] is None:
+                wanted_items.extend(item for item in snapshot["items"]
+                                    if item.item_type == item_type)
+                continue
+            # Each display gets its items in its own configured order
+            for wanted_id in dict.fromkeys(wanted_ids[item_type]):
+                wanted_items.extend(items_by_id.get((item_type, wanted_id),
+                                                    ()))
+        body = json.dumps({
+            "version": snapshot["version"],
+            "published_at": snapshot["published_at"],
+            "items": [item_to_dict(item) for item in wanted_items],
+            "latest_tweet":
+            alert_to_dict(snapshot["latest_tweet"]) if include_tweet else None
+        }).encode("utf-8")
+        with self.cache_lock:
+            if self.cached_version == snapshot["version"]:
+                self.cached_bodies[filter_key] = body
+        return body
+
+
+class ArrivalsRequestHandler(BaseHTTPRequestHandler):
+    """Answers GET /snapshot for ArrivalsServer - Clients keep their connection open between polls"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Long-polls for a snapshot newer than the client's"""
+        request_url = urlparse(self.path)
+        if request_url.path != "/snapshot":
+            self.send_error(404)
+            return
+        query = parse_qs(request_url.query, keep_blank_values=True)
+        try:
+            since_version = int(query.get("since", ["0"])[0])
+        except ValueError:
+            self.send_error(400, "since must be a snapshot version")
+            return
+        wanted_ids = {}
+        for item_type, parameter in ITEM_ID_PARAMETERS.items():
+            if parameter in query:
+                wanted_ids[item_type] = [
+                    wanted_id for wanted_id in query[parameter][0].split(",")
+                    if wanted_id
+                ]
+            else:
+                wanted_ids[item_type] = None
+        include_tweet = query.get("tweet", ["True"])[0] == "True"
+
+        arrivals_server = self.server.arrivals_server
+        snapshot = arrivals_server.snapshot_publisher.wait_for_newer(
+            since_version, timeout=arrivals_server.wait_seconds)
+        if snapshot is None:
+            self.send_response(204)
+            self.end_headers()
+            return
+        body = arrivals_server.snapshot_body(snapshot, wanted_ids,
+                                             include_tweet)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Long-polls would flood the console - Requests aren't logged"""
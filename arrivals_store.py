@@ -0,0 +1,312 @@
+"""Compact store for the trains, buses and Divvy stations shown on the display"""
+import time  # Used to Expire Old Entries
+
+
+class Arrival:
+    """One predicted arrival - Times are integer epoch seconds"""
+    __slots__ = ("arrival_epoch", "predicted_epoch", "is_scheduled",
+                 "is_approaching", "is_delayed")
+
+    def __init__(self, arrival_epoch, predicted_epoch, is_scheduled,
+                 is_approaching, is_delayed):
+        self.arrival_epoch = arrival_epoch
+        self.predicted_epoch = predicted_epoch
+        self.is_scheduled = is_scheduled
+        self.is_approaching = is_approaching
+        self.is_delayed = is_delayed
+
+
+class Record:
+    """A train stop, bus stop or Divvy station - Replaced with an updated copy, never changed, once stored
+
+    Snapshots hold the records themselves, so a record changed in place would
+    change under a display that is still drawing it."""
+    __slots__ = ()
+
+    def replaced(self, **changes):
+        """A copy of the record with the given fields changed"""
+        record = self.__class__.__new__(self.__class__)
+        for field in self.__slots__:
+            setattr(record, field, changes.get(field, getattr(self, field)))
+        return record
+
+
+class TrainStop(Record):
+    """Trains from one L stop (platform) toward one destination"""
+    __slots__ = ("stop_id", "station_name", "route", "destination_name",
+                 "arrivals", "updated_at", "stale_at")
+    item_type = "train"
+
+    def __init__(self, stop_id, station_name, route, destination_name):
+        self.stop_id = stop_id
+        self.station_name = station_name
+        self.route = route
+        self.destination_name = destination_name
+        self.arrivals = ()
+        self.updated_at = 0
+        self.stale_at = 0
+
+
+class BusStop(Record):
+    """Buses from one bus stop"""
+    __slots__ = ("stop_id", "stop_name", "route", "destination_name",
+                 "arrivals", "updated_at", "stale_at")
+    item_type = "bus"
+
+    def __init__(self, stop_id, stop_name, route, destination_name):
+        self.stop_id = stop_id
+        self.stop_name = stop_name
+        self.route = route
+        self.destination_name = destination_name
+        self.arrivals = ()
+        self.updated_at = 0
+        self.stale_at = 0
+
+
+class BikeStation(Record):
+    """Bikes available at one Divvy station"""
+    __slots__ = ("station_id", "station_name", "station_type",
+                 "distance_miles", "ebikes_available", "classic_available",
+                 "updated_at", "stale_at")
+    item_type = "bicycle"
+
+    def __init__(self, station_id, station_name, station_type,
+                 distance_miles):
+        self.station_id = station_id
+        self.station_name = station_name
+        self.station_type = station_type
+        self.distance_miles = distance_miles
+        self.ebikes_available = None
+        self.classic_available = None
+        self.updated_at = 0
+        self.stale_at = 0
+
+
+class ArrivalsStore:
+    """Every train stop, bus stop and Divvy station being tracked, indexed by stop/station id
+
+    A fresh response swaps in new records (see Record), so a snapshot holding a
+    record never sees half an update. evict() drops anything
+    that is no longer configured or hasn't been refreshed within ttl_seconds."""
+
+    def __init__(self, ttl_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self.trains = {}  # stop_id -> {destination_name: TrainStop}
+        self.buses = {}  # stop_id -> BusStop
+        self.bicycles = {}  # station_id -> BikeStation
+
+    def replace_train_arrivals(self, requested_stop_id, train_etas, now=None):
+        """Replaces the arrivals for a stop with a fresh Train Tracker response"""
+        now = time.time() if now is None else now
+        new_arrivals = {}
+        for eta in train_etas:
+            destinations = self.trains.setdefault(eta.stop_id, {})
+            if eta.destination_name not in destinations:
+                destinations[eta.destination_name] = TrainStop(
+                    eta.stop_id, eta.station_name, eta.route,
+                    eta.destination_name)
+            arrival = Arrival(epoch_seconds(eta.arrival_time),
+                              epoch_seconds(eta.prediction_time),
+                              eta.is_scheduled, eta.is_approaching,
+                              eta.is_delayed)
+            new_arrivals.setdefault((eta.stop_id, eta.destination_name),
+                                    []).append(arrival)
+        # Destinations with nothing in this response are kept, but empty
+        refreshed_stop_ids = {requested_stop_id}
+        refreshed_stop_ids.update(stop_id for stop_id, _ in new_arrivals)
+        for stop_id in refreshed_stop_ids:
+            destinations = self.trains.get(stop_id, {})
+            for destination_name, train_stop in list(destinations.items()):
+                destinations[destination_name] = train_stop.replaced(
+                    arrivals=tuple(
+                        new_arrivals.get((stop_id, destination_name), ())),
+                    updated_at=now)
+
+    def replace_bus_arrivals(self, requested_stop_ids, bus_predictions,
+                             now=None):
+        """Replaces the arrivals for the requested stops with a fresh Bus Tracker response"""
+        now = time.time() if now is None else now
+        new_arrivals = {stop_id: [] for stop_id in requested_stop_ids}
+        for prd in bus_predictions:
+            if prd.stop_id not in self.buses:
+                self.buses[prd.stop_id] = BusStop(prd.stop_id, prd.stop_name,
+                                                  prd.route,
+                                                  prd.destination_name)
+            if prd.countdown.isdigit():
+                # Counted down from Bus Tracker's own countdown, not prdtm - tmstmp (tmstmp is
+                # rounded to the minute) - It is rounded down, so it holds for its whole minute
+                predicted_epoch = int(now)
+                arrival_epoch = predicted_epoch + int(prd.countdown) * 60 + 59
+            elif prd.countdown == "DUE":
+                predicted_epoch = arrival_epoch = int(now)
+            else:
+                predicted_epoch = epoch_seconds(prd.timestamp)
+                arrival_epoch = epoch_seconds(prd.prediction_time)
+            new_arrivals.setdefault(prd.stop_id, []).append(
+                Arrival(arrival_epoch, predicted_epoch, False,
+                        prd.countdown == "DUE", prd.countdown == "DLY"
+                        or prd.is_delayed))
+        for stop_id, arrivals in new_arrivals.items():
+            if stop_id in self.buses:
+                self.buses[stop_id] = self.buses[stop_id].replaced(
+                    arrivals=tuple(arrivals), updated_at=now)
+
+    def update_bike_station(self, station_id, station_name, station_type,
+                            distance_miles):
+        """Adds a Divvy station or refreshes its name, type and distance"""
+        if station_id not in self.bicycles:
+            self.bicycles[station_id] = BikeStation(station_id, station_name,
+                                                    station_type,
+                                                    distance_miles)
+        else:
+            self.bicycles[station_id] = self.bicycles[station_id].replaced(
+                station_name=station_name,
+                station_type=station_type,
+                distance_miles=distance_miles)
+
+    def update_bike_counts(self, station_id, ebikes_available,
+                           classic_available, now=None):
+        """Records how many bikes a Divvy station has right now"""
+        if station_id in self.bicycles:
+            self.bicycles[station_id] = self.bicycles[station_id].replaced(
+                ebikes_available=ebikes_available,
+                classic_available=classic_available,
+                updated_at=time.time() if now is None else now)
+
+    def confirm_bike_counts(self, now=None):
+        """Marks every Divvy station fresh when the feed was checked and hadn't changed"""
+        now = time.time() if now is None else now
+        for station_id, bike_station in list(self.bicycles.items()):
+            self.bicycles[station_id] = bike_station.replaced(updated_at=now)
+
+    def evict(self,
+              train_stop_ids,
+              bus_stop_ids,
+              bike_station_ids,
+              do_not_persist_destinations=(),
+              now=None):
+        """Drops entries that are no longer configured, have expired, or are empty and shouldn't persist"""
+        now = time.time() if now is None else now
+        expired_before = now - self.ttl_seconds
+        for stop_id in list(self.trains):
+            if stop_id not in train_stop_ids:
+                print("No longer tracking Stop ID: " + stop_id + " - Removing")
+                del self.trains[stop_id]
+                continue
+            destinations = self.trains[stop_id]
+            for destination_name in list(destinations):
+                train_stop = destinations[destination_name]
+                if train_stop.updated_at < expired_before:
+                    del destinations[destination_name]
+                elif (not train_stop.arrivals and
+                      destination_name in do_not_persist_destinations):
+                    print(
+                        "No arrivals found - Deleting Non-Persistant Station: "
+                        + destination_name)
+                    del destinations[destination_name]
+        for stop_id in list(self.buses):
+            if (stop_id not in bus_stop_ids or
+                    self.buses[stop_id].updated_at < expired_before):
+                del self.buses[stop_id]
+        for station_id in list(self.bicycles):
+            if (station_id not in bike_station_ids or
+                    self.bicycles[station_id].updated_at < expired_before):
+                del self.bicycles[station_id]
+
+    def nearest_arrival_seconds(self, item_type, stop_ids):
+        """Seconds until the soonest predicted train or bus at any of stop_ids, None if nothing is predicted"""
+        if item_type == "train":
+            stops = [
+                train_stop for stop_id in stop_ids
+                for train_stop in self.trains.get(stop_id, {}).values()
+            ]
+        else:
+            stops = [
+                self.buses[stop_id] for stop_id in stop_ids
+                if stop_id in self.buses
+            ]
+        return min((arrival.arrival_epoch - arrival.predicted_epoch
+                    for stop in stops for arrival in stop.arrivals),
+                   default=None)
+
+    def expect_refresh(self, item_type, record_ids, seconds, now=None):
+        """Marks the given train stops, bus stops or Divvy stations stale if they aren't refreshed within seconds"""
+        stale_at = (time.time() if now is None else now) + seconds
+        for record_id in record_ids:
+            if item_type == "train":
+                destinations = self.trains.get(record_id, {})
+                for destination_name, train_stop in list(destinations.items()):
+                    destinations[destination_name] = train_stop.replaced(
+                        stale_at=stale_at)
+            else:
+                records = self.buses if item_type == "bus" else self.bicycles
+                if record_id in records:
+                    records[record_id] = records[record_id].replaced(
+                        stale_at=stale_at)
+
+    def train_stop_is_stale(self, stop_id, now=None):
+        """True if nothing at a train stop has been refreshed when it should have been (or ever)"""
+        now = time.time() if now is None else now
+        return all(train_stop.stale_at < now
+                   for train_stop in self.trains.get(stop_id, {}).values())
+
+    def restore(self, items):
+        """Puts back records saved before a restart - Fresh responses then update them as usual"""
+        for item in items:
+            if item.item_type == "train":
+                self.trains.setdefault(item.stop_id,
+                                       {})[item.destination_name] = item
+            elif item.item_type == "bus":
+                self.buses[item.stop_id] = item
+            else:
+                self.bicycles[item.station_id] = item
+
+    def display_items(self, train_stop_ids, bus_stop_ids, bike_station_ids):
+        """Every record to show, in configured order - Trains, then buses, then Divvy"""
+        display_items = []
+        for stop_id in train_stop_ids:
+            display_items.extend(self.trains.get(stop_id, {}).values())
+        # A bus stop can be configured more than once (one route each) but is shown once
+        for stop_id in dict.fromkeys(bus_stop_ids):
+            if stop_id in self.buses:
+                display_items.append(self.buses[stop_id])
+        for station_id in dict.fromkeys(bike_station_ids):
+            if station_id in self.bicycles:
+                display_items.append(self.bicycles[station_id])
+        return display_items
+
+
+ITEM_CLASSES = {
+    item_class.item_type: item_class
+    for item_class in (TrainStop, BusStop, BikeStation)
+}
+
+
+def item_to_dict(item):
+    """A train stop, bus stop or Divvy station as plain JSON types"""
+    item_dict = {"item_type": item.item_type}
+    for field in item.__slots__:
+        item_dict[field] = getattr(item, field)
+    if "arrivals" in item_dict:
+        item_dict["arrivals"] = [[
+            arrival.arrival_epoch, arrival.predicted_epoch,
+            arrival.is_scheduled, arrival.is_approaching, arrival.is_delayed
+        ] for arrival in item.arrivals]
+    return item_dict
+
+
+def item_from_dict(item_dict):
+    """Rebuilds a record made by item_to_dict"""
+    item_class = ITEM_CLASSES[item_dict["item_type"]]
+    item = item_class.__new__(item_class)
+    for field in item_class.__slots__:
+        setattr(item, field, item_dict[field])
+    if "arrivals" in item_class.__slots__:
+        item.arrivals = tuple(
+            Arrival(*arrival) for arrival in item_dict["arrivals"])
+    return item
+
+
+def epoch_seconds(local_datetime):
+    """CTA times are Chicago local time, as is the Pi's clock - Returns integer epoch seconds"""
+    return int(time.mktime(local_datetime.timetuple()))
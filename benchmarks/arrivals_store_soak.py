@@ -0,0 +1,95 @@
+"""Simulates 30 days of a board running against ArrivalsStore and reports memory per day
+
+The configured stops change every few days and some stops stop returning
+predictions, the way a long running board sees it. Memory should stay flat.
+Run from the repository root: python3 benchmarks/arrivals_store_soak.py"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arrivals_store import ArrivalsStore  # pylint: disable=wrong-import-position
+from cta_responses import BusPrediction, TrainEta  # pylint: disable=wrong-import-position
+
+SIMULATED_DAYS = 30
+CYCLE_SECONDS = 30
+SETTINGS_CHANGE_EVERY_DAYS = 3
+
+
+def configured_stops(day):
+    """Stop ids in use on a given day - A new set every SETTINGS_CHANGE_EVERY_DAYS"""
+    generation = day // SETTINGS_CHANGE_EVERY_DAYS
+    return ([str(30000 + generation * 10 + offset) for offset in range(2)],
+            [str(5000 + generation * 10 + offset) for offset in range(4)],
+            ["station-" + str(generation * 10 + offset) for offset in range(3)])
+
+
+def train_etas(stop_id, now):
+    """Three synthetic predictions for a train stop"""
+    prediction_time = datetime.fromtimestamp(now)
+    return [
+        TrainEta("Station " + stop_id, stop_id, "Blue", "Destination " +
+                 str(number % 2), prediction_time,
+                 prediction_time + timedelta(minutes=4 + number * 7), False,
+                 False, False) for number in range(3)
+    ]
+
+
+def bus_predictions(stop_id, now):
+    """Three synthetic predictions for a bus stop"""
+    prediction_time = datetime.fromtimestamp(now)
+    return [
+        BusPrediction(stop_id, "Stop " + stop_id, "82", "Kimball/Devon",
+                      prediction_time,
+                      prediction_time + timedelta(minutes=3 + number * 9),
+                      str(3 + number * 9), False) for number in range(3)
+    ]
+
+
+def main():
+    """Runs the simulation and prints traced memory at the end of each day"""
+    arrivals_store = ArrivalsStore(ttl_seconds=3600)
+    start = time.time()
+    cycles_per_day = 86400 // CYCLE_SECONDS
+    tracemalloc.start()
+    daily_memory = []
+    for day in range(SIMULATED_DAYS):
+        train_stop_ids, bus_stop_ids, bike_station_ids = configured_stops(day)
+        for cycle in range(cycles_per_day):
+            now = start + day * 86400 + cycle * CYCLE_SECONDS
+            for stop_id in train_stop_ids:
+                arrivals_store.replace_train_arrivals(stop_id,
+                                                      train_etas(stop_id, now),
+                                                      now=now)
+            # Overnight the last bus stop has no service and returns nothing
+            for stop_id in bus_stop_ids[:3 if cycle > cycles_per_day // 2 else
+                                        4]:
+                arrivals_store.replace_bus_arrivals([stop_id],
+                                                    bus_predictions(
+                                                        stop_id, now),
+                                                    now=now)
+            for station_number, station_id in enumerate(bike_station_ids):
+                arrivals_store.update_bike_station(station_id, station_id,
+                                                   "classic", 0.1)
+                arrivals_store.update_bike_counts(station_id, station_number,
+                                                  cycle % 15, now=now)
+            arrivals_store.evict(train_stop_ids, bus_stop_ids,
+                                 bike_station_ids, now=now)
+            arrivals_store.display_items(train_stop_ids, bus_stop_ids,
+                                         bike_station_ids)
+        current_memory = tracemalloc.get_traced_memory()[0]
+        daily_memory.append(current_memory)
+        print("Day {:>2}: {:>7.1f} KiB traced, {:>2} train / {} bus / {} Divvy entries"
+              .format(day + 1, current_memory / 1024,
+                      sum(len(destinations) for destinations in
+                          arrivals_store.trains.values()),
+                      len(arrivals_store.buses), len(arrivals_store.bicycles)))
+    tracemalloc.stop()
+    print("Growth from day 1 to day {}: {:.1f} KiB".format(
+        SIMULATED_DAYS, (daily_memory[-1] - daily_memory[0]) / 1024))
+
+
+if __name__ == "__main__":
+    main()
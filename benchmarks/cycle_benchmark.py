@@ -0,0 +1,188 @@
+"""Runs full ctapi cycles against the stub APIs and reports time per stage
+
+Each cycle fetches every enabled source from stub_apis.py, parses and aggregates
+the responses, lays out and renders every page and sends it to the in-memory
+display. Time spent in each stage is measured exclusively (a stage called from
+inside another isn't counted twice).
+
+Run from the repository root: python3 benchmarks/cycle_benchmark.py --cycles 20 --latency 0.05"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stub_apis import (DEFAULT_RECORDINGS_DIRECTORY, REPOSITORY_DIRECTORY,  # pylint: disable=wrong-import-position
+                       StubApiServer, stub_settings)
+
+STAGES = ("fetch", "parse", "aggregate", "layout", "render", "display")
+# main.py functions that belong to each stage, besides the fetch itself
+STAGE_FUNCTIONS = {
+    "parse": ("decode_train_etas", "decode_bus_predictions"),
+    "aggregate": ("train_arrival_times", "bus_eta_times",
+                  "divvy_process_station_stats",
+                  "information_output_to_display"),
+    "layout": ("layout_arrivals_page", ),
+    "render": ("render_arrivals_page", "tweet_output_to_display"),
+}
+
+
+class StageTimer:
+    """Adds up exclusive time per stage for functions wrapped with wrap()"""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self.stack = []  # [stage, start, time spent in nested stages]
+
+    def wrap(self, stage, function):
+        """function, timed as part of stage"""
+
+        def timed(*args, **kwargs):
+            self.stack.append([stage, time.perf_counter(), 0.0])
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _, start, nested_time = self.stack.pop()
+                elapsed = time.perf_counter() - start
+                self.totals[stage] += elapsed - nested_time
+                if self.stack:
+                    self.stack[-1][2] += elapsed
+
+        return timed
+
+    def take(self):
+        """The totals since the last take()"""
+        totals = self.totals
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        return totals
+
+
+def prepare_ctapi_directory(settings):
+    """A throwaway CTAPI_DIRECTORY holding settings and links to the icons and fonts"""
+    ctapi_directory = tempfile.mkdtemp(prefix="ctapi-benchmark-")
+    for asset_directory in ("icons", "fonts", "trainpi"):
+        if os.path.isdir(os.path.join(REPOSITORY_DIRECTORY, asset_directory)):
+            os.symlink(os.path.join(REPOSITORY_DIRECTORY, asset_directory),
+                       os.path.join(ctapi_directory, asset_directory))
+    with open(os.path.join(ctapi_directory, "settings.json"),
+              mode='w',
+              encoding='utf-8') as settings_file:
+        json.dump(settings, settings_file, indent=4)
+    return ctapi_directory
+
+
+def percentile(samples, fraction):
+    """The value fraction of the way through the sorted samples"""
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main():
+    """Runs the cycles and prints mean/p95 per stage and cycles per second"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--settings",
+                        default=os.path.join(REPOSITORY_DIRECTORY,
+                                             "settings.json"))
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS_DIRECTORY)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--latency-jitter", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--payload-scale", type=int, default=1)
+    parser.add_argument("--history",
+                        action="store_true",
+                        help="Also record every prediction to a throwaway history database")
+    arguments = parser.parse_args()
+    with open(arguments.settings, mode='r', encoding='utf-8') as settings_file:
+        settings = json.load(settings_file)
+
+    stub = StubApiServer(settings,
+                         recordings_directory=arguments.recordings,
+                         latency=arguments.latency,
+                         latency_jitter=arguments.latency_jitter,
+                         error_rate=arguments.error_rate,
+                         payload_scale=arguments.payload_scale)
+    benchmark_settings = stub_settings(settings, stub.start())
+    # main.py reads its environment at import, so it is imported once this is set
+    ctapi_directory = prepare_ctapi_directory(benchmark_settings)
+    os.environ.update({
+        "CTAPI_DIRECTORY": ctapi_directory,
+        "DISPLAY_BACKEND": "memory",
+        "DISPLAY_PAGE_HOLD_SECONDS": "0",
+        "HISTORY_DATABASE": os.path.join(ctapi_directory, "history.db")
+                            if arguments.history else ""
+    })
+    for variable, value in (("TRAIN_API_KEY", "benchmark"),
+                            ("BUS_API_KEY", "benchmark"),
+                            ("TWITTER_API_KEY", "Bearer benchmark"),
+                            ("HOME_LATITUDE", "41.9217"),
+                            ("HOME_LONGITUDE", "-87.7085")):
+        os.environ.setdefault(variable, value)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main as ctapi  # pylint: disable=import-outside-toplevel
+        ctapi.apply_settings(benchmark_settings)
+        ctapi.schedule_sources()
+        ctapi.start_display()
+        ctapi.start_history()
+
+    stage_timer = StageTimer()
+    for stage, function_names in STAGE_FUNCTIONS.items():
+        for function_name in function_names:
+            setattr(ctapi, function_name,
+                    stage_timer.wrap(stage, getattr(ctapi, function_name)))
+    ctapi.frame_pipeline.show = stage_timer.wrap("display",
+                                                 ctapi.frame_pipeline.show)
+    fetch_sources = stage_timer.wrap("fetch", ctapi.fetch_sources)
+    source_names = [fetch_job[0] for fetch_job in ctapi.plan_fetch_jobs()]
+
+    cycle_stages = []
+    cycle_times = []
+    for _ in range(arguments.cycles):
+        cycle_start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetch_sources(source_names)
+            ctapi.snapshot_publisher.publish(
+                ctapi.information_output_to_display(), ctapi.LATEST_CTA_TWEET)
+            ctapi.information_to_display()
+            if ctapi.LATEST_CTA_TWEET is not None:
+                ctapi.tweet_output_to_display(ctapi.LATEST_CTA_TWEET)
+        cycle_times.append(time.perf_counter() - cycle_start)
+        cycle_stages.append(stage_timer.take())
+    stub.stop()
+    if ctapi.prediction_history is not None:
+        ctapi.prediction_history.flush()
+
+    print("{} cycles | {} sources | latency {}s | errors {:.0%} | payload x{}".format(
+        arguments.cycles, len(source_names), arguments.latency,
+        arguments.error_rate, arguments.payload_scale))
+    print("  {:<10} {:>10} {:>10}".format("stage", "mean ms", "p95 ms"))
+    for stage in STAGES:
+        samples = [stages[stage] * 1000 for stages in cycle_stages]
+        print("  {:<10} {:>10.2f} {:>10.2f}".format(stage,
+                                                    statistics.mean(samples),
+                                                    percentile(samples, 0.95)))
+    print("  {:<10} {:>10.2f} {:>10.2f}".format(
+        "cycle", statistics.mean(cycle_times) * 1000,
+        percentile(cycle_times, 0.95) * 1000))
+    print("{:.1f} cycles per second | {} stub requests, {} errors | {} frames shown, {} skipped".format(
+        1 / statistics.mean(cycle_times), stub.request_count, stub.error_count,
+        ctapi.frame_pipeline.full_refresh_count +
+        ctapi.frame_pipeline.partial_refresh_count,
+        ctapi.frame_pipeline.skipped_frame_count))
+    for host, host_stats in sorted(ctapi.http_transport.snapshot().items()):
+        print("{}: {} requests over {} connections ({:.1f} ms connecting) | {:.1f} KiB received".format(
+            host, host_stats["requests"], host_stats["connections"],
+            host_stats["connect_seconds"] * 1000,
+            host_stats["wire_bytes"] / 1024))
+    if ctapi.prediction_history is not None:
+        print("{} history rows written".format(
+            ctapi.prediction_history.rows_written))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Times nearest-station discovery over a synthetic system-wide Divvy station_information feed
+
+Compares the old per-station geopy distance against one vectorized haversine pass
+and the grid index, and checks all three agree on the closest stations.
+
+Run from the repository root: python3 benchmarks/divvy_nearest_benchmark.py"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gbfs import parse_gbfs_feed  # pylint: disable=wrong-import-position
+import station_index  # pylint: disable=wrong-import-position
+from station_index import StationIndex, haversine_miles  # pylint: disable=wrong-import-position
+
+STATION_COUNT = 1600
+NEAREST_COUNT = 5
+RUNS = 50
+# Roughly the Divvy service area
+LATITUDE_RANGE = (41.65, 42.07)
+LONGITUDE_RANGE = (-87.84, -87.52)
+HOME = (41.9217, -87.7085)
+
+
+def build_synthetic_station_information(station_count):
+    """Builds a station_information.json shaped like Divvy's with station_count stations"""
+    random.seed(2022)
+    stations = []
+    for station_number in range(station_count):
+        stations.append({
+            "station_id": "a3a9607f-a135-11e9-9cda-" + str(station_number).zfill(12),
+            "name": "Station " + str(station_number),
+            "short_name": str(station_number),
+            "lat": random.uniform(*LATITUDE_RANGE),
+            "lon": random.uniform(*LONGITUDE_RANGE),
+            "capacity": 15,
+            "station_type": "classic",
+            "has_kiosk": True,
+            "rental_uris": {
+                "android": "https://chi.lft.to/lastmile_qr_scan",
+                "ios": "https://chi.lft.to/lastmile_qr_scan"
+            }
+        })
+    return json.dumps({
+        "last_updated": 1650000000,
+        "ttl": 5,
+        "version": "2.2",
+        "data": {
+            "stations": stations
+        }
+    }).encode('utf-8')
+
+
+def time_per_run(function):
+    """Average seconds per call over RUNS calls"""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        function()
+    return (time.perf_counter() - start) / RUNS
+
+
+def main():
+    """Prints how long each step of finding the closest stations takes"""
+    feed_bytes = build_synthetic_station_information(STATION_COUNT)
+    start = time.perf_counter()
+    all_stations = parse_gbfs_feed([feed_bytes], None, ("lat", "lon"))["stations"]
+    parse_time = time.perf_counter() - start
+    station_locations = {
+        station_id: (station["lat"], station["lon"])
+        for station_id, station in all_stations.items()
+    }
+    print(str(len(station_locations)) + " stations, numpy " +
+          ("available" if station_index.numpy is not None else "not installed"))
+    print("  {:<40} {:>8.2f} ms".format("parse lat/lon out of the feed",
+                                        parse_time * 1000))
+
+    timings = []
+    try:
+        from geopy import distance  # pylint: disable=import-outside-toplevel
+
+        def geopy_nearest():
+            return sorted(
+                (distance.distance(HOME, location).miles, station_id)
+                for station_id, location in station_locations.items())[:NEAREST_COUNT]
+
+        geopy_result = [station_id for _, station_id in geopy_nearest()]
+        timings.append(("geopy per station (previous)", time_per_run(geopy_nearest)))
+    except ImportError:
+        geopy_result = None
+
+    index = StationIndex(station_locations, *HOME)
+    timings.append(("build index + home distances", time_per_run(
+        lambda: StationIndex(station_locations, *HOME))))
+    timings.append(("one haversine pass over every station", time_per_run(
+        lambda: haversine_miles(HOME[0], HOME[1], index.latitudes,
+                                index.longitudes))))
+    timings.append(("nearest to home (cached distances)", time_per_run(
+        lambda: index.nearest_to_home(NEAREST_COUNT))))
+    query_point = (41.8789, -87.6359)
+    timings.append(("nearest to another point (grid rings)", time_per_run(
+        lambda: index.nearest(query_point[0], query_point[1], NEAREST_COUNT))))
+    for label, seconds in timings:
+        print("  {:<40} {:>8.2f} ms".format(label, seconds * 1000))
+
+    index_result = [station_id for station_id, _ in index.nearest_to_home(NEAREST_COUNT)]
+    brute_force = sorted(
+        zip(haversine_miles(query_point[0], query_point[1], index.latitudes,
+                            index.longitudes), index.station_ids))[:NEAREST_COUNT]
+    assert [station_id for station_id, _ in index.nearest(
+        query_point[0], query_point[1], NEAREST_COUNT)] == [
+            station_id for _, station_id in brute_force]
+    if geopy_result is not None:
+        assert index_result == geopy_result, (index_result, geopy_result)
+        print("Closest " + str(NEAREST_COUNT) + " stations match geopy")
+
+
+if __name__ == "__main__":
+    main()
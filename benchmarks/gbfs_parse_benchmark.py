@@ -0,0 +1,108 @@
+"""Compares full json.loads against the streaming GBFS parser on a synthetic Divvy feed
+
+Run from the repository root: python3 benchmarks/gbfs_parse_benchmark.py"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gbfs import STREAM_CHUNK_SIZE, parse_gbfs_feed  # pylint: disable=wrong-import-position
+
+STATION_COUNT = 2000
+CONFIGURED_STATION_COUNT = 3
+RUNS = 20
+
+
+def build_synthetic_station_status(station_count):
+    """Builds a station_status.json shaped like Divvy's with station_count stations"""
+    stations = []
+    for station_number in range(station_count):
+        stations.append({
+            "station_id": "a3a9607f-a135-11e9-9cda-" + str(station_number).zfill(12),
+            "num_bikes_available": station_number % 15,
+            "num_ebikes_available": station_number % 4,
+            "num_docks_available": 15 - station_number % 15,
+            "num_docks_disabled": 0,
+            "num_bikes_disabled": 0,
+            "is_installed": 1,
+            "is_renting": 1,
+            "is_returning": 1,
+            "last_reported": 1650000000 + station_number,
+            "station_status": "active",
+            "legacy_id": str(station_number),
+            "eightd_has_available_keys": False,
+            "rental_uris": {
+                "android": "https://chi.lft.to/lastmile_qr_scan",
+                "ios": "https://chi.lft.to/lastmile_qr_scan"
+            }
+        })
+    return json.dumps({
+        "last_updated": 1650000000,
+        "ttl": 5,
+        "version": "2.2",
+        "data": {
+            "stations": stations
+        }
+    }).encode('utf-8')
+
+
+def chunks_of(feed_bytes):
+    """Splits the feed the same way a streamed HTTP response would arrive"""
+    for start in range(0, len(feed_bytes), STREAM_CHUNK_SIZE):
+        yield feed_bytes[start:start + STREAM_CHUNK_SIZE]
+
+
+def full_parse(feed_bytes, station_ids):
+    """What divvy_process_station_stats used to do - Decode everything then scan a list"""
+    station_ids = list(station_ids)
+    feed = json.loads(feed_bytes)
+    return [
+        station for station in feed['data']['stations']
+        if station['station_id'] in station_ids
+    ]
+
+
+def streaming_parse(feed_bytes, station_ids):
+    """Streaming, filter-on-read parse of the same feed"""
+    return parse_gbfs_feed(chunks_of(feed_bytes), station_ids)["stations"]
+
+
+def measure(parse_function, feed_bytes, station_ids):
+    """Returns (average seconds per parse, peak bytes allocated during one parse)"""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        parse_function(feed_bytes, station_ids)
+    average_time = (time.perf_counter() - start) / RUNS
+    tracemalloc.start()
+    parse_function(feed_bytes, station_ids)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return average_time, peak_memory
+
+
+def main():
+    """Prints time and peak memory for both parse paths"""
+    for station_count in (STATION_COUNT // 2, STATION_COUNT, STATION_COUNT * 2):
+        feed_bytes = build_synthetic_station_status(station_count)
+        station_ids = [
+            "a3a9607f-a135-11e9-9cda-" + str(station_number).zfill(12)
+            for station_number in range(0, station_count,
+                                        station_count // CONFIGURED_STATION_COUNT)
+        ][:CONFIGURED_STATION_COUNT]
+        assert len(streaming_parse(feed_bytes, station_ids)) == len(
+            full_parse(feed_bytes, station_ids))
+        print(str(station_count) + " stations (" +
+              str(round(len(feed_bytes) / 1024)) + " KiB feed)")
+        for label, parse_function in (("json.loads + list scan", full_parse),
+                                      ("streaming filter-on-read",
+                                       streaming_parse)):
+            average_time, peak_memory = measure(parse_function, feed_bytes,
+                                                station_ids)
+            print("  {:<26} {:>8.2f} ms  peak {:>8.1f} KiB".format(
+                label, average_time * 1000, peak_memory / 1024))
+
+
+if __name__ == "__main__":
+    main()
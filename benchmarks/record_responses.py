@@ -0,0 +1,68 @@
+"""Records real CTA, Divvy and Twitter responses for stub_apis.py to replay
+
+Makes one round of the API calls main.py would make for the current
+settings.json and .env, saving every response under benchmarks/recordings.
+Run from the repository root: python3 benchmarks/record_responses.py"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main as ctapi  # pylint: disable=wrong-import-position
+from stub_apis import (DEFAULT_RECORDINGS_DIRECTORY, REPOSITORY_DIRECTORY,  # pylint: disable=wrong-import-position
+                       URL_TEMPLATE_KEYS, recording_name, save_recording,
+                       template_key)
+
+
+def recording_hook(recordings_directory, settings, recorded):
+    """A response hook for ctapi's HTTP session that saves every response it sees"""
+
+    def save_response(api_response, **_):
+        for section, key in URL_TEMPLATE_KEYS:
+            if key not in settings[section]:
+                continue
+            name = recording_name(settings[section][key], api_response.url)
+            if name is None:
+                continue
+            # Reads the whole body - A streamed response is then iterated from memory
+            save_recording(recordings_directory, template_key(section, key),
+                           name, api_response.content,
+                           api_response.headers.get("Content-Type",
+                                                    "application/octet-stream"))
+            recorded.append(template_key(section, key) + "/" + name + " (" +
+                            str(len(api_response.content)) + " bytes)")
+            break
+        return api_response
+
+    return save_response
+
+
+def main():
+    """Records one response from every enabled API"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--settings",
+                        default=os.path.join(REPOSITORY_DIRECTORY,
+                                             "settings.json"))
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS_DIRECTORY)
+    arguments = parser.parse_args()
+    with open(arguments.settings, mode='r', encoding='utf-8') as settings_file:
+        settings = json.load(settings_file)
+    ctapi.apply_settings(settings)
+    # Always download Station Information rather than trusting the copy on disk (and never get a 304)
+    ctapi.DIVVY_STATION_INFORMATION_CACHE_FILE = None
+
+    recorded = []
+    ctapi.http_transport.open_session().hooks["response"].append(
+        recording_hook(arguments.recordings, settings, recorded))
+    for source_name, _, api_call, args in ctapi.plan_fetch_jobs():
+        try:
+            api_call(*args)
+        except Exception as error:  # pylint: disable=broad-except
+            print("Error recording " + source_name + ": " + str(error))
+    for recording in recorded:
+        print("Recorded " + recording)
+
+
+if __name__ == "__main__":
+    main()
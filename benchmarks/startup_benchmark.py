@@ -0,0 +1,168 @@
+"""Measures how long ctapi takes to start - Import time and time to the first frame, cold and warm
+
+Each run is a fresh Python process starting main.py against the stub APIs with
+the in-memory display. A cold run has no saved warm state, so the first page
+waits for every API call. A warm run starts from the state the cold run saved,
+so the first page is drawn from what was on the board before the restart (on
+the e-Paper display the old frame also stays up the whole time, as it isn't
+cleared). Times are from the start of the process's import of main.py.
+
+Run from the repository root: python3 benchmarks/startup_benchmark.py --runs 5 --latency 0.2"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cycle_benchmark import prepare_ctapi_directory  # pylint: disable=wrong-import-position
+from stub_apis import (DEFAULT_RECORDINGS_DIRECTORY, REPOSITORY_DIRECTORY,  # pylint: disable=wrong-import-position
+                       StubApiServer, stub_settings)
+
+# Modules worth keeping out of startup - Listed if they were imported by the first frame
+HEAVY_MODULES = ("geopy", "numpy", "requests", "sqlite3", "waveshare_epd")
+# The child prints its measurements on a line starting with this
+RESULT_PREFIX = "STARTUP RESULT "
+
+
+def measure_startup(first_frame_timeout):
+    """Runs in the child process - Imports and starts ctapi, then reports when the first frame went out"""
+    import_start = time.perf_counter()
+    import main as ctapi  # pylint: disable=import-outside-toplevel
+    import_seconds = time.perf_counter() - import_start
+    imported_heavy_modules = [
+        module for module in HEAVY_MODULES if module in sys.modules
+    ]
+
+    first_frame_shown = threading.Event()
+    first_frame_times = []
+    show_frame = ctapi.show_frame
+
+    def timed_show_frame(image):
+        if not first_frame_shown.is_set():
+            first_frame_times.append(time.perf_counter() - import_start)
+            first_frame_modules.extend(module for module in HEAVY_MODULES
+                                       if module in sys.modules)
+            first_frame_shown.set()
+        show_frame(image)
+
+    first_frame_modules = []
+    ctapi.show_frame = timed_show_frame
+    threading.Thread(target=ctapi.main, name="ctapi", daemon=True).start()
+    first_frame_shown.wait(first_frame_timeout)
+    # Wait for the state ctapi saves after its first display pass, for the warm runs
+    saved_by = time.monotonic() + first_frame_timeout
+    while ctapi.warm_state_saved_at is None and time.monotonic() < saved_by:
+        time.sleep(0.05)
+    print(RESULT_PREFIX + json.dumps({
+        "import_seconds": import_seconds,
+        "first_frame_seconds": first_frame_times[0] if first_frame_times else None,
+        "imported_heavy_modules": imported_heavy_modules,
+        "first_frame_heavy_modules": first_frame_modules
+    }), flush=True)
+    # ctapi's threads never finish on their own
+    os._exit(0)  # pylint: disable=protected-access
+
+
+def run_child(child_environment, first_frame_timeout):
+    """Starts one fresh ctapi process and returns its measurements"""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child",
+         "--first-frame-timeout", str(first_frame_timeout)],
+        env=child_environment,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        timeout=first_frame_timeout * 3 + 30,
+        check=False)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError("ctapi didn't report its startup:\n" + completed.stdout)
+
+
+def print_results(label, results):
+    """Median and best import and first frame times for one kind of start"""
+    import_times = [result["import_seconds"] * 1000 for result in results]
+    first_frame_times = [
+        result["first_frame_seconds"] * 1000 for result in results
+        if result["first_frame_seconds"] is not None
+    ]
+    print("  {:<6} {:>10.1f} {:>10.1f} {:>14} {:>14}   {}".format(
+        label, statistics.median(import_times), min(import_times),
+        "{:.1f}".format(statistics.median(first_frame_times))
+        if first_frame_times else "none",
+        "{:.1f}".format(min(first_frame_times)) if first_frame_times else "none",
+        ", ".join(results[-1]["first_frame_heavy_modules"]) or "-"))
+
+
+def main():
+    """Runs cold and warm starts and prints import time and time to first frame"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--settings",
+                        default=os.path.join(REPOSITORY_DIRECTORY,
+                                             "settings.json"))
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS_DIRECTORY)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.2,
+                        help="Seconds the stub APIs take to answer")
+    parser.add_argument("--first-frame-timeout", type=float, default=30)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.child:
+        measure_startup(arguments.first_frame_timeout)
+        return
+    with open(arguments.settings, mode='r', encoding='utf-8') as settings_file:
+        settings = json.load(settings_file)
+
+    stub = StubApiServer(settings,
+                         recordings_directory=arguments.recordings,
+                         latency=arguments.latency)
+    benchmark_settings = stub_settings(settings, stub.start())
+    ctapi_directory = prepare_ctapi_directory(benchmark_settings)
+    warm_state_file_path = os.path.join(ctapi_directory, "warm_state.json")
+    child_environment = dict(os.environ)
+    child_environment.update({
+        "CTAPI_DIRECTORY": ctapi_directory,
+        "DISPLAY_BACKEND": "memory",
+        "DISPLAY_PAGE_HOLD_SECONDS": "0",
+        "HISTORY_DATABASE": "",
+        "WARM_STATE_FILE": warm_state_file_path
+    })
+    for variable, value in (("TRAIN_API_KEY", "benchmark"),
+                            ("BUS_API_KEY", "benchmark"),
+                            ("TWITTER_API_KEY", "Bearer benchmark"),
+                            ("HOME_LATITUDE", "41.9217"),
+                            ("HOME_LONGITUDE", "-87.7085")):
+        child_environment.setdefault(variable, value)
+
+    cold_results = []
+    warm_results = []
+    for _ in range(arguments.runs):
+        if os.path.exists(warm_state_file_path):
+            os.remove(warm_state_file_path)
+        cold_results.append(
+            run_child(child_environment, arguments.first_frame_timeout))
+        warm_results.append(
+            run_child(child_environment, arguments.first_frame_timeout))
+    stub.stop()
+
+    print("{} runs each | stub latency {}s | times from the start of import main".format(
+        arguments.runs, arguments.latency))
+    print("  {:<6} {:>10} {:>10} {:>14} {:>14}   {}".format(
+        "start", "import ms", "best", "first frame ms", "best",
+        "heavy modules by first frame"))
+    print_results("cold", cold_results)
+    print_results("warm", warm_results)
+    print("Imported by main.py itself: " +
+          (", ".join(cold_results[-1]["imported_heavy_modules"]) or "none of " +
+           ", ".join(HEAVY_MODULES)))
+
+
+if __name__ == "__main__":
+    main()
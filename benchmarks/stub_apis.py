@@ -0,0 +1,448 @@
+"""Local stand-in for the CTA, Divvy and Twitter APIs, replaying recorded responses
+
+Recordings live in benchmarks/recordings/<template key>/<name>.body, where the
+template key is the settings.json entry the URL came from (e.g.
+"train-tracker.api-url") and the name is the values filled into that template,
+minus the API key (e.g. "30197"). record_responses.py makes them from the real
+APIs. Anything without a recording is answered from example_docs or a
+synthetic Divvy feed, so the stub works on a fresh checkout.
+
+Run from the repository root to serve on its own:
+python3 benchmarks/stub_apis.py --port 8760 --latency 0.2 --error-rate 0.05"""
+import argparse
+import copy
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(BENCHMARKS_DIRECTORY)
+DEFAULT_RECORDINGS_DIRECTORY = os.path.join(BENCHMARKS_DIRECTORY, "recordings")
+
+# Every API URL template in settings.json - (section, key)
+URL_TEMPLATE_KEYS = (("train-tracker", "api-url"), ("bus-tracker", "api-url"),
+                     ("divvy-tracker", "api-station-information-url"),
+                     ("divvy-tracker", "api-station-status-url"),
+                     ("tweet-tracker", "api-url"),
+                     ("tweet-tracker", "cta-alerts-api-url"))
+# Query parameters holding an API key are left out of recording names
+API_KEY_PARAMETERS = frozenset(["key"])
+SYNTHETIC_STATION_COUNT = 1600
+SYNTHETIC_TWEETS = {
+    "data": [{
+        "id": "1",
+        "text": "Some Blue Line trains are being rerouted this weekend."
+    }, {
+        "id": "2",
+        "text": "[Blue Line] Trains are operating with residual delays after "
+                "an earlier signal problem at Clark/Lake. https://t.co/example"
+    }],
+    "meta": {
+        "result_count": 2,
+        "newest_id": "2",
+        "oldest_id": "1"
+    }
+}
+SYNTHETIC_CTA_ALERTS = {
+    "CTAAlerts": {
+        "TimeStamp": "2022-04-17T00:21:00",
+        "ErrorCode": "0",
+        "ErrorMessage": None,
+        "Alert": [{
+            "AlertId": "90001",
+            "Headline": "Elevator Status",
+            "ShortDescription": "The elevator at Logan Square is temporarily out of service.",
+            "SeverityScore": "5"
+        }, {
+            "AlertId": "90002",
+            "Headline": "Blue Line Delays",
+            "ShortDescription": "Trains are operating with residual delays after an earlier signal problem at Clark/Lake.",
+            "SeverityScore": "35"
+        }]
+    }
+}
+
+
+def template_key(section, key):
+    """The name a URL template is recorded under"""
+    return section + "." + key
+
+
+def template_pattern(url_template):
+    """Regex matching URLs made from url_template, and the query parameter name of each {}
+
+    Path placeholders have no parameter name (None). Anything appended after the
+    template (like Bus Tracker's &top=) is ignored."""
+    parameter_names = []
+    pattern = ""
+    for part_number, part in enumerate(url_template.split("{}")):
+        if part_number > 0:
+            pattern += "([^&/?]*)"
+        pattern += re.escape(part)
+        parameter_match = re.search(r"[?&]([^=&?]+)=$", part)
+        parameter_names.append(
+            parameter_match.group(1) if parameter_match else None)
+    return re.compile(pattern), parameter_names[:-1]
+
+
+def recording_name(url_template, url):
+    """The recording name for a URL made from url_template - None if it doesn't match"""
+    pattern, parameter_names = template_pattern(url_template)
+    url_match = pattern.match(url)
+    if url_match is None:
+        return None
+    values = [
+        value
+        for value, parameter_name in zip(url_match.groups(), parameter_names)
+        if parameter_name not in API_KEY_PARAMETERS
+    ]
+    name = re.sub(r"[^A-Za-z0-9,._-]", "-", "_".join(values))
+    return name or "default"
+
+
+def save_recording(recordings_directory, key, name, body, content_type):
+    """Writes one recorded response"""
+    recording_directory = os.path.join(recordings_directory, key)
+    os.makedirs(recording_directory, exist_ok=True)
+    with open(os.path.join(recording_directory, name + ".body"),
+              mode='wb') as body_file:
+        body_file.write(body)
+    with open(os.path.join(recording_directory, name + ".json"),
+              mode='w',
+              encoding='utf-8') as meta_file:
+        json.dump({"content_type": content_type}, meta_file)
+
+
+def load_recording(recordings_directory, key, name):
+    """(body, content type) for the closest recording - The exact name, else any for the template"""
+    recording_directory = os.path.join(recordings_directory, key)
+    try:
+        recorded_names = sorted(file_name[:-len(".body")]
+                                for file_name in os.listdir(recording_directory)
+                                if file_name.endswith(".body"))
+    except OSError:
+        return None
+    if not recorded_names:
+        return None
+    if name not in recorded_names:
+        name = "default" if "default" in recorded_names else recorded_names[0]
+    with open(os.path.join(recording_directory, name + ".body"),
+              mode='rb') as body_file:
+        body = body_file.read()
+    try:
+        with open(os.path.join(recording_directory, name + ".json"),
+                  mode='r',
+                  encoding='utf-8') as meta_file:
+            content_type = json.load(meta_file)["content_type"]
+    except (OSError, ValueError, KeyError):
+        content_type = "application/octet-stream"
+    return body, content_type
+
+
+def stub_settings(settings, base_url):
+    """A copy of settings.json with every API URL pointed at the stub server"""
+    settings = copy.deepcopy(settings)
+    for section, key in URL_TEMPLATE_KEYS:
+        if key not in settings[section]:
+            continue
+        original_url = urlsplit(settings[section][key])
+        stub_url = (base_url + "/" + template_key(section, key) +
+                    original_url.path)
+        if original_url.query:
+            stub_url += "?" + original_url.query
+        settings[section][key] = stub_url
+    return settings
+
+
+def synthetic_train_response(stop_id):
+    """traindemo.xml with every prediction moved to stop_id"""
+    with open(os.path.join(REPOSITORY_DIRECTORY, "example_docs",
+                           "traindemo.xml"),
+              mode='rb') as demo_file:
+        root = ET.fromstring(demo_file.read())
+    for stop_element in root.iter("stpId"):
+        stop_element.text = stop_id
+    return ET.tostring(root, encoding="utf-8")
+
+
+def synthetic_bus_response(stop_ids, route_ids):
+    """busdemo.xml's predictions copied to every requested stop and route"""
+    with open(os.path.join(REPOSITORY_DIRECTORY, "example_docs",
+                           "busdemo.xml"),
+              mode='rb') as demo_file:
+        root = ET.fromstring(demo_file.read())
+    demo_predictions = root.findall("prd")
+    for prd in demo_predictions:
+        root.remove(prd)
+    for stop_id in stop_ids:
+        for route_id in route_ids:
+            for demo_prd in demo_predictions:
+                prd = copy.deepcopy(demo_prd)
+                prd.find("stpid").text = stop_id
+                prd.find("rt").text = route_id
+                root.append(prd)
+    return ET.tostring(root, encoding="utf-8")
+
+
+def synthetic_station_ids(configured_station_ids, station_count):
+    """The configured Divvy stations first, then made up ones up to station_count"""
+    return list(configured_station_ids) + [
+        "a3a9607f-a135-11e9-9cda-" + str(station_number).zfill(12)
+        for station_number in range(station_count -
+                                    len(configured_station_ids))
+    ]
+
+
+def synthetic_station_information(station_ids):
+    """A station_information.json shaped like Divvy's, spread over Chicago"""
+    random_source = random.Random(2022)
+    return json.dumps({
+        "last_updated": int(time.time()),
+        "ttl": 5,
+        "version": "2.2",
+        "data": {
+            "stations": [{
+                "station_id": station_id,
+                "name": "Station " + str(station_number) + " Ave",
+                "short_name": str(station_number),
+                "lat": random_source.uniform(41.65, 42.07),
+                "lon": random_source.uniform(-87.84, -87.52),
+                "capacity": 15,
+                "station_type": "classic",
+                "has_kiosk": True
+            } for station_number, station_id in enumerate(station_ids)]
+        }
+    }).encode("utf-8")
+
+
+def synthetic_station_status(station_ids):
+    """A station_status.json shaped like Divvy's"""
+    return json.dumps({
+        "last_updated": int(time.time()),
+        "ttl": 5,
+        "version": "2.2",
+        "data": {
+            "stations": [{
+                "station_id": station_id,
+                "num_bikes_available": station_number % 15,
+                "num_ebikes_available": station_number % 4,
+                "num_docks_available": 15 - station_number % 15,
+                "is_installed": 1,
+                "is_renting": 1,
+                "is_returning": 1,
+                "last_reported": int(time.time())
+            } for station_number, station_id in enumerate(station_ids)]
+        }
+    }).encode("utf-8")
+
+
+def scale_payload(body, content_type, payload_scale):
+    """Repeats every prediction or station payload_scale times to stand in for a bigger response"""
+    if payload_scale <= 1:
+        return body
+    if "xml" in content_type:
+        root = ET.fromstring(body)
+        for record in root.findall("eta") + root.findall("prd"):
+            for _ in range(payload_scale - 1):
+                root.append(copy.deepcopy(record))
+        return ET.tostring(root, encoding="utf-8")
+    document = json.loads(body)
+    stations = document.get("data") if isinstance(document, dict) else None
+    if not isinstance(stations, dict) or "stations" not in stations:
+        return body
+    stations = stations["stations"]
+    if not stations:
+        return body
+    # Copies get new ids so the configured stations still appear once
+    document["data"]["stations"] = stations + [
+        dict(station, station_id=station["station_id"] + "-" + str(copy_number))
+        for copy_number in range(1, payload_scale) for station in stations
+    ]
+    return json.dumps(document).encode("utf-8")
+
+
+class StubApiServer:
+    """Serves recorded API responses with configurable latency, errors and payload size
+
+    latency and latency_jitter are seconds added to every response, error_rate
+    is the fraction of requests answered with a 503, and payload_scale repeats
+    every prediction/station that many times."""
+
+    def __init__(self,
+                 settings,
+                 recordings_directory=DEFAULT_RECORDINGS_DIRECTORY,
+                 host="127.0.0.1",
+                 port=0,
+                 latency=0,
+                 latency_jitter=0,
+                 error_rate=0,
+                 payload_scale=1):
+        self.settings = settings
+        self.recordings_directory = recordings_directory
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.payload_scale = payload_scale
+        self.http_server = None
+        self.request_count = 0
+        self.error_count = 0
+        self.responses = {}  # (key, name, path) -> (body, content type)
+        self.responses_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        """Where the stub is listening"""
+        return "http://" + self.host + ":" + str(
+            self.http_server.server_address[1])
+
+    def start(self):
+        """Starts serving on a background thread"""
+        self.http_server = ThreadingHTTPServer((self.host, self.port),
+                                               StubRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.stub = self
+        threading.Thread(target=self.http_server.serve_forever,
+                         name="stub-apis",
+                         daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        """Stops serving"""
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def response_for(self, request_path):
+        """(status, body, content type) for a request to the stub"""
+        key = request_path.lstrip("/").split("/", 1)[0].split("?", 1)[0]
+        templates = {
+            template_key(section, setting_key): self.settings[section][setting_key]
+            for section, setting_key in URL_TEMPLATE_KEYS
+            if setting_key in self.settings[section]
+        }
+        if key not in templates:
+            return 404, b"Unknown API", "text/plain"
+        original_url = urlsplit(templates[key])
+        original_template = original_url.path + (
+            "?" + original_url.query if original_url.query else "")
+        name = recording_name(original_template,
+                              request_path[len("/" + key):]) or "default"
+        with self.responses_lock:
+            if (key, name, request_path) not in self.responses:
+                body, content_type = self.recorded_or_synthetic(
+                    key, name, original_template, request_path[len("/" + key):])
+                self.responses[(key, name, request_path)] = (scale_payload(
+                    body, content_type, self.payload_scale), content_type)
+            return (200, ) + self.responses[(key, name, request_path)]
+
+    def recorded_or_synthetic(self, key, name, original_template, request_url):
+        """A recording for the request if there is one, otherwise a made up response"""
+        recording = load_recording(self.recordings_directory, key, name)
+        if recording is not None:
+            return recording
+        pattern, parameter_names = template_pattern(original_template)
+        values = dict(zip(parameter_names, pattern.match(request_url).groups()))
+        if key == "train-tracker.api-url":
+            return synthetic_train_response(values.get("stpid", "")), "text/xml"
+        if key == "bus-tracker.api-url":
+            return synthetic_bus_response(
+                values.get("stpid", "").split(","),
+                values.get("rt", "").split(",")), "text/xml"
+        station_ids = synthetic_station_ids(
+            self.settings["divvy-tracker"]["station-ids"],
+            SYNTHETIC_STATION_COUNT)
+        if key == "divvy-tracker.api-station-information-url":
+            return synthetic_station_information(
+                station_ids), "application/json"
+        if key == "divvy-tracker.api-station-status-url":
+            return synthetic_station_status(station_ids), "application/json"
+        if key == "tweet-tracker.cta-alerts-api-url":
+            return json.dumps(SYNTHETIC_CTA_ALERTS).encode(
+                "utf-8"), "application/json"
+        return json.dumps(SYNTHETIC_TWEETS).encode("utf-8"), "application/json"
+
+
+@lru_cache(maxsize=64)
+def gzip_body(body):
+    """body gzipped - The same few bodies are served over and over"""
+    return gzip.compress(body, compresslevel=6)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Answers API requests for StubApiServer - Keeps connections open and gzips when asked, like the real APIs"""
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes - Nagle would hold the body for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Replays the response for the request after the configured latency"""
+        stub = self.server.stub
+        stub.request_count += 1
+        time.sleep(stub.latency + random.uniform(0, stub.latency_jitter))
+        if random.random() < stub.error_rate:
+            stub.error_count += 1
+            status, body, content_type = 503, b"Stub error", "text/plain"
+        else:
+            status, body, content_type = stub.response_for(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if status == 200 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip_body(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        try:
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client went away mid-request (startup_benchmark.py ends ctapi that way)
+            self.close_connection = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Requests aren't logged - Benchmarks make a lot of them"""
+
+
+def main():
+    """Serves the stub APIs until interrupted and prints a settings.json pointed at them"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--settings",
+                        default=os.path.join(REPOSITORY_DIRECTORY,
+                                             "settings.json"))
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS_DIRECTORY)
+    parser.add_argument("--port", type=int, default=8760)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--latency-jitter", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--payload-scale", type=int, default=1)
+    arguments = parser.parse_args()
+    with open(arguments.settings, mode='r', encoding='utf-8') as settings_file:
+        settings = json.load(settings_file)
+    stub = StubApiServer(settings,
+                         recordings_directory=arguments.recordings,
+                         port=arguments.port,
+                         latency=arguments.latency,
+                         latency_jitter=arguments.latency_jitter,
+                         error_rate=arguments.error_rate,
+                         payload_scale=arguments.payload_scale)
+    base_url = stub.start()
+    print("Stub APIs on " + base_url + " - Point ctapi at them with:",
+          file=sys.stderr)
+    print(json.dumps(stub_settings(settings, base_url), indent=4))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Times Train Tracker and Bus Tracker response decoding per prediction
+
+Scales example_docs/traindemo.xml and busdemo.xml up by repeating their
+<eta>/<prd> elements and compares the old ElementTree + find() + strptime
+path against cta_responses, with the bare tree build as a floor. Run from the repository root:
+python3 benchmarks/xml_parse_benchmark.py"""
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+from cta_responses import decode_bus_predictions, decode_train_etas, parse_cta_timestamp  # pylint: disable=wrong-import-position
+
+SCALES = (1, 10, 100)
+RUNS = 50
+
+
+def scale_response(file_name, record_tag, scale):
+    """Repeats every record element in an example response scale times"""
+    with open(os.path.join(REPOSITORY_DIRECTORY, "example_docs", file_name),
+              mode='rb') as example_file:
+        document = example_file.read()
+    records = re.findall(
+        b"<" + record_tag + b">.*?</" + record_tag + b">", document, re.S)
+    first_record = document.index(records[0])
+    last_record = document.index(records[-1]) + len(records[-1])
+    return (document[:first_record] + b"".join(records) * scale +
+            document[last_record:]), len(records) * scale
+
+
+def element_tree_train(response_content):
+    """What main.py used to do for each Train Tracker response"""
+    minutes = []
+    for eta in ET.fromstring(response_content).iter('eta'):
+        eta.find('destNm').text, eta.find('staNm').text  # pylint: disable=expression-not-assigned
+        eta.find('rt').text, eta.find('stpId').text  # pylint: disable=expression-not-assigned
+        if eta.find('isSch').text == "0" and eta.find('isApp').text == "0":
+            prediction = datetime.strptime(eta.find('prdt').text,
+                                           "%Y%m%d %H:%M:%S")
+            arrival = datetime.strptime(eta.find('arrT').text,
+                                        "%Y%m%d %H:%M:%S")
+            minutes.append(arrival - prediction)
+    return minutes
+
+
+def element_tree_bus(response_content):
+    """What main.py used to do for each Bus Tracker response"""
+    countdowns = []
+    for prd in ET.fromstring(response_content).iter('prd'):
+        prd.find('stpid').text, prd.find('des').text  # pylint: disable=expression-not-assigned
+        prd.find('rt').text, prd.find('stpnm').text  # pylint: disable=expression-not-assigned
+        countdowns.append(prd.find('prdctdn').text)
+    return countdowns
+
+
+def tokenize_only(response_content):
+    """Lower bound - Just building the tree, no fields read"""
+    return ET.fromstring(response_content)
+
+
+def time_per_prediction(decode_function, response_content, prediction_count):
+    """Average microseconds spent per prediction over RUNS decodes"""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        decode_function(response_content)
+    return (time.perf_counter() - start) / RUNS / prediction_count * 1000000
+
+
+def main():
+    """Prints per prediction decode time for both paths at each scale"""
+    for label, file_name, record_tag, old_decode, new_decode in (
+        ("Train Tracker", "traindemo.xml", b"eta", element_tree_train,
+         decode_train_etas),
+        ("Bus Tracker", "busdemo.xml", b"prd", element_tree_bus,
+         decode_bus_predictions)):
+        print(label)
+        for scale in SCALES:
+            response_content, prediction_count = scale_response(
+                file_name, record_tag, scale)
+            parse_cta_timestamp.cache_clear()
+            old_time = time_per_prediction(old_decode, response_content,
+                                           prediction_count)
+            new_time = time_per_prediction(new_decode, response_content,
+                                           prediction_count)
+            floor_time = time_per_prediction(tokenize_only, response_content,
+                                             prediction_count)
+            print("  {:>5} predictions  ElementTree+find {:>7.2f} us  "
+                  "cta_responses {:>7.2f} us  (tree build alone {:>7.2f} us)".
+                  format(prediction_count, old_time, new_time, floor_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Exponential backoff and a circuit breaker for each upstream API"""
+import random
+import time  # Used to Track When an Endpoint Can Be Tried Again
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures per endpoint and decides when it is worth trying again
+
+    Every failure doubles the retry delay (base_delay up to max_delay, with jitter).
+    After failure_threshold failures in a row the circuit opens and the endpoint is
+    left alone for open_seconds, then a single probe is allowed through. A success
+    closes the circuit and resets the delay."""
+
+    def __init__(self,
+                 failure_threshold=5,
+                 base_delay=5,
+                 max_delay=600,
+                 open_seconds=300):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.open_seconds = open_seconds
+        self.failures = {}
+        self.open_until = {}
+
+    def allow(self, endpoint, now=None):
+        """False while the endpoint's circuit is open"""
+        now = time.monotonic() if now is None else now
+        return self.open_until.get(endpoint, 0) <= now
+
+    def seconds_until_allowed(self, endpoint, now=None):
+        """How long until the endpoint's circuit lets a probe through"""
+        now = time.monotonic() if now is None else now
+        return max(0, self.open_until.get(endpoint, 0) - now)
+
+    def record_success(self, endpoint):
+        """Closes the circuit and resets the backoff"""
+        if self.failures.get(endpoint):
+            print(endpoint + " API is responding again")
+        self.failures[endpoint] = 0
+        self.open_until.pop(endpoint, None)
+
+    def record_failure(self, endpoint, now=None):
+        """Counts a failure - Returns how many seconds to wait before retrying"""
+        now = time.monotonic() if now is None else now
+        failure_count = self.failures.get(endpoint, 0) + 1
+        self.failures[endpoint] = failure_count
+        if failure_count >= self.failure_threshold:
+            self.open_until[endpoint] = now + self.open_seconds
+            print(endpoint + " API failed " + str(failure_count) +
+                  " times in a row - Pausing for " + str(self.open_seconds) +
+                  " Seconds")
+            return self.open_seconds
+        retry_delay = min(self.base_delay * 2**(failure_count - 1),
+                          self.max_delay)
+        return retry_delay + random.uniform(0, retry_delay * 0.1)
+
+    def is_failing(self, endpoint):
+        """True if the last attempt at the endpoint failed"""
+        return self.failures.get(endpoint, 0) > 0
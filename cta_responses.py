@@ -0,0 +1,79 @@
+"""Decoders for CTA Train Tracker and Bus Tracker API responses"""
+import xml.etree.ElementTree as ET  # Used to Parse API Response
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# Only the tags the display uses are kept from each <eta>/<prd>
+# (plus the run number/vehicle id, so the prediction history can follow each trip)
+TrainEta = namedtuple("TrainEta", [
+    "station_name", "stop_id", "route", "destination_name", "prediction_time",
+    "arrival_time", "is_approaching", "is_scheduled", "is_delayed",
+    "run_number"
+],
+                      defaults=[None])
+BusPrediction = namedtuple("BusPrediction", [
+    "stop_id", "stop_name", "route", "destination_name", "timestamp",
+    "prediction_time", "countdown", "is_delayed", "vehicle_id"
+],
+                           defaults=[None])
+
+TRAIN_ETA_TAGS = frozenset([
+    "staNm", "stpId", "rt", "destNm", "prdt", "arrT", "isApp", "isSch",
+    "isDly", "rn"
+])
+BUS_PREDICTION_TAGS = frozenset(
+    ["stpid", "stpnm", "rt", "des", "tmstmp", "prdtm", "prdctdn", "dly", "vid"])
+
+
+@lru_cache(maxsize=512)
+def parse_cta_timestamp(timestamp):
+    """Turns "20220416 22:11:22" (Train) or "20220417 00:21" (Bus) into a datetime
+
+    The same arrival times come back cycle after cycle, so results are cached."""
+    return datetime(int(timestamp[0:4]), int(timestamp[4:6]),
+                    int(timestamp[6:8]), int(timestamp[9:11]),
+                    int(timestamp[12:14]),
+                    int(timestamp[15:17]) if len(timestamp) > 14 else 0)
+
+
+def iterate_records(response_content, record_tag, wanted_tags):
+    """Yields a {tag: text} dict per record_tag element, reading each child exactly once
+
+    Bus Tracker <error> elements are direct children of the root too, so only
+    record_tag elements are visited and errors never leak into a record."""
+    for record in ET.fromstring(response_content).iterfind(record_tag):
+        fields = {}
+        for child in record:
+            if child.tag in wanted_tags:
+                fields[child.tag] = child.text
+        yield fields
+
+
+def decode_train_etas(response_content):
+    """Reads every <eta> from a Train Tracker response into a TrainEta"""
+    train_etas = []
+    for fields in iterate_records(response_content, "eta", TRAIN_ETA_TAGS):
+        train_etas.append(
+            TrainEta(fields["staNm"], fields["stpId"], fields["rt"],
+                     fields["destNm"], parse_cta_timestamp(fields["prdt"]),
+                     parse_cta_timestamp(fields["arrT"]),
+                     fields["isApp"] == "1", fields["isSch"] == "1",
+                     fields.get("isDly") == "1", fields.get("rn")))
+    return train_etas
+
+
+def decode_bus_predictions(response_content):
+    """Reads every <prd> from a Bus Tracker response into a BusPrediction
+
+    Stops with no service come back as <error> elements and are skipped."""
+    bus_predictions = []
+    for fields in iterate_records(response_content, "prd",
+                                  BUS_PREDICTION_TAGS):
+        bus_predictions.append(
+            BusPrediction(fields["stpid"], fields["stpnm"], fields["rt"],
+                          fields["des"], parse_cta_timestamp(fields["tmstmp"]),
+                          parse_cta_timestamp(fields["prdtm"]),
+                          fields["prdctdn"], fields.get("dly") == "true",
+                          fields.get("vid")))
+    return bus_predictions
@@ -0,0 +1,93 @@
+"""Display backends - The Waveshare e-Paper HAT, or headless frame sinks for testing off the Pi"""
+import os
+from collections import deque
+
+# Size of the 2.13" panel in landscape, which is how every page is drawn
+DEFAULT_DISPLAY_SIZE = (250, 122)
+
+
+class WaveshareBackend:
+    """The Waveshare 2.13inch e-Paper HAT (V3) - The driver is only imported when this is created"""
+
+    def __init__(self):
+        from waveshare_epd import epd2in13_V3  # pylint: disable=import-outside-toplevel
+        self.epd = epd2in13_V3.EPD()
+        self.size = (self.epd.height, self.epd.width)
+
+    def start(self, clear=True):
+        """Wakes the panel and clears it - Unless it still shows a frame worth keeping from before a restart"""
+        self.epd.init()
+        if clear:
+            self.epd.Clear(0xFF)
+
+    def full_refresh(self, image):
+        """Full waveform refresh - Also becomes the base image partial refreshes diff against"""
+        self.epd.init()
+        self.epd.displayPartBaseImage(self.epd.getbuffer(image))
+
+    def partial_refresh(self, image):
+        """Partial refresh - Only pixels that differ from the base image are driven"""
+        self.epd.displayPartial(self.epd.getbuffer(image))
+
+
+class FileFrameBackend:
+    """Writes every frame to output_directory - png for viewing, pbm for the raw 1-bit frame"""
+
+    def __init__(self, output_directory, file_extension="png", max_files=500):
+        self.output_directory = output_directory
+        self.file_extension = file_extension
+        self.max_files = max_files
+        self.size = DEFAULT_DISPLAY_SIZE
+        self.frame_count = 0
+
+    def start(self, clear=True):  # pylint: disable=unused-argument
+        """Makes sure the output directory exists"""
+        os.makedirs(self.output_directory, exist_ok=True)
+
+    def full_refresh(self, image):
+        """Saves the frame, marked as a full refresh"""
+        self.save_frame(image, "full")
+
+    def partial_refresh(self, image):
+        """Saves the frame, marked as a partial refresh"""
+        self.save_frame(image, "partial")
+
+    def save_frame(self, image, refresh_type):
+        """Saves the frame, reusing file numbers so the directory never grows past max_files"""
+        frame_path = os.path.join(
+            self.output_directory, "frame-" +
+            str(self.frame_count % self.max_files).zfill(4) + "-" +
+            refresh_type + "." + self.file_extension)
+        image.save(frame_path,
+                   format="PPM" if self.file_extension == "pbm" else None)
+        self.frame_count += 1
+
+
+class MemoryFrameBackend:
+    """Keeps the most recent frames in memory - Used for benchmarks and load tests"""
+
+    def __init__(self, max_frames=100):
+        self.size = DEFAULT_DISPLAY_SIZE
+        self.frames = deque(maxlen=max_frames)
+
+    def start(self, clear=True):  # pylint: disable=unused-argument
+        """Nothing to set up"""
+
+    def full_refresh(self, image):
+        """Keeps a copy of the frame, marked as a full refresh"""
+        self.frames.append(("full", image.copy()))
+
+    def partial_refresh(self, image):
+        """Keeps a copy of the frame, marked as a partial refresh"""
+        self.frames.append(("partial", image.copy()))
+
+
+def create_display_backend(backend_name, output_directory=None):
+    """Builds the backend named in DISPLAY_BACKEND - waveshare, png, pbm or memory"""
+    if backend_name == "waveshare":
+        return WaveshareBackend()
+    if backend_name in ("png", "pbm"):
+        return FileFrameBackend(output_directory, file_extension=backend_name)
+    if backend_name == "memory":
+        return MemoryFrameBackend()
+    raise ValueError("Unknown display backend: " + str(backend_name))
@@ -0,0 +1,82 @@
+"""Frame diffing and partial refresh for the e-Paper display"""
+import hashlib
+import time  # Used to Hold Each Page on Screen
+
+from PIL import ImageChops
+
+
+class FramePipeline:
+    """Sends frames to the display, skipping repeats and preferring partial refreshes
+
+    Identical frames are dropped by hash without touching the panel. Changed frames
+    go out as a partial refresh, which only drives the pixels that differ, and
+    every full_refresh_every partials a full refresh clears any ghosting."""
+
+    def __init__(self, backend, full_refresh_every=10, page_hold_seconds=4):
+        self.backend = backend
+        self.full_refresh_every = full_refresh_every
+        self.page_hold_seconds = page_hold_seconds
+        self.last_frame = None
+        self.last_frame_hash = None
+        self.partials_since_full_refresh = 0
+        self.full_refresh_count = 0
+        self.partial_refresh_count = 0
+        self.skipped_frame_count = 0
+        # What the last show() did - "full", "partial" or "skipped" - and how long the panel took
+        self.last_refresh_type = None
+        self.last_refresh_seconds = 0
+
+    def show(self, image):
+        """Puts image on the display if it changed, then holds it long enough to be read"""
+        frame_hash = hash_frame(image)
+        if frame_hash == self.last_frame_hash:
+            self.skipped_frame_count += 1
+            self.last_refresh_type = "skipped"
+            self.last_refresh_seconds = 0
+            print("Frame unchanged - Skipping display refresh")
+            return False
+
+        refresh_start = time.monotonic()
+        if (self.last_frame is None or
+                self.partials_since_full_refresh >= self.full_refresh_every):
+            self.full_refresh(image)
+            self.last_refresh_type = "full"
+        else:
+            changed_region = ImageChops.difference(self.last_frame,
+                                                   image).getbbox()
+            print("Partial refresh of changed region " + str(changed_region))
+            self.backend.partial_refresh(image)
+            self.partials_since_full_refresh += 1
+            self.partial_refresh_count += 1
+            self.last_refresh_type = "partial"
+        self.last_refresh_seconds = time.monotonic() - refresh_start
+
+        self.last_frame = image.copy()
+        self.last_frame_hash = frame_hash
+
+        # Wait a respectable amount of time so the page can be read
+        if self.page_hold_seconds > 0:
+            print("Sleeping " + str(self.page_hold_seconds) + " Seconds")
+            time.sleep(self.page_hold_seconds)
+        return True
+
+    def restore(self, image):
+        """Picks up from image, left on the panel from before a restart
+
+        A page identical to it isn't drawn again, but the panel lost the base image
+        partial refreshes diff against, so the next change is a full refresh."""
+        self.last_frame = image.copy()
+        self.last_frame_hash = hash_frame(image)
+        self.partials_since_full_refresh = self.full_refresh_every
+
+    def full_refresh(self, image):
+        """Full refresh - Also becomes the base image partial refreshes diff against"""
+        print("Full display refresh")
+        self.backend.full_refresh(image)
+        self.partials_since_full_refresh = 0
+        self.full_refresh_count += 1
+
+
+def hash_frame(image):
+    """Short digest of a frame's pixels, used to spot repeats"""
+    return hashlib.blake2b(image.tobytes(), digest_size=16).digest()
@@ -0,0 +1,241 @@
+"""GBFS feed helpers for the Divvy Tracker portion of ctapi"""
+import codecs
+import json
+import os
+import re
+import time  # Used to Track Feed Expiration
+
+from http_transport import HttpTransport  # Used for API Calls
+
+STREAM_CHUNK_SIZE = 16384
+stations_array_start = re.compile(r'"stations"\s*:\s*\[')
+top_level_number_fields = {
+    "last_updated": re.compile(r'"last_updated"\s*:\s*(\d+)'),
+    "ttl": re.compile(r'"ttl"\s*:\s*(\d+)')
+}
+json_decoder = json.JSONDecoder()
+
+
+def parse_gbfs_feed(chunks, station_ids, fields=None):
+    """Reads a GBFS station feed chunk by chunk and keeps only the requested stations
+
+    Stations are decoded one at a time straight out of the "stations" array and
+    dropped unless their station_id is in station_ids, so peak memory is one chunk
+    plus the kept stations no matter how big the whole system is. station_ids=None
+    keeps every station, and fields trims each kept station down to those keys.
+    Returns {"last_updated": int, "ttl": int, "stations": {station_id: station}}"""
+    station_ids = None if station_ids is None else set(station_ids)
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunk_iterator = iter(chunks)
+    buffer = ""
+    outside_text = ""  # Everything that isn't a station - Holds last_updated/ttl
+    stations = {}
+    finished_chunks = False
+
+    def read_more():
+        nonlocal buffer, finished_chunks
+        try:
+            buffer += text_decoder.decode(next(chunk_iterator))
+        except StopIteration:
+            buffer += text_decoder.decode(b'', final=True)
+            finished_chunks = True
+
+    # Find the start of the stations array
+    while True:
+        array_match = stations_array_start.search(buffer)
+        if array_match:
+            break
+        if finished_chunks:
+            raise ValueError("GBFS feed has no stations array")
+        read_more()
+    outside_text += buffer[:array_match.end()]
+    position = array_match.end()
+
+    # Decode one station at a time until the array closes
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(buffer):
+            if finished_chunks:
+                raise ValueError("GBFS feed ended inside the stations array")
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+        if buffer[position] == ']':
+            position += 1
+            break
+        try:
+            station, position = json_decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if finished_chunks:
+                raise
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+        station_id = station.get("station_id")
+        if station_ids is None or station_id in station_ids:
+            if fields is not None:
+                station = {field: station.get(field) for field in fields}
+            stations[station_id] = station
+
+    # The rest of the document is small - Keep it for the top level fields
+    outside_text += buffer[position:]
+    while not finished_chunks:
+        buffer = ""
+        read_more()
+        outside_text += buffer
+
+    feed = {"stations": stations}
+    for field_name, field_pattern in top_level_number_fields.items():
+        field_match = field_pattern.search(outside_text)
+        feed[field_name] = int(field_match.group(1)) if field_match else None
+    return feed
+
+
+def read_file_in_chunks(file_path):
+    """Yields a file's bytes in chunks suitable for parse_gbfs_feed"""
+    with open(file_path, mode='rb') as feed_file:
+        while True:
+            chunk = feed_file.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class GbfsFeedCache:
+    """Keeps the configured stations from a GBFS feed and only downloads it again when it may have changed
+
+    The feed's own ttl/last_updated fields decide when it is worth asking again, and
+    the request is made conditional with If-None-Match/If-Modified-Since so an
+    unchanged feed costs a 304 instead of the whole document. With a cache_file the
+    raw feed is streamed to disk as it is parsed, so it survives a restart and can
+    be re-filtered when the configured stations change without another download."""
+
+    def __init__(self, url, cache_file=None, timeout=10, transport=None):
+        self.url = url
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self.transport = HttpTransport() if transport is None else transport
+        self.feed = None
+        self.station_ids = None
+        self.etag = None
+        self.last_modified = None
+        self.expires_at = 0
+        if cache_file is not None:
+            self.load_headers_from_disk()
+
+    def fetch(self, station_ids):
+        """Returns the feed filtered to station_ids and whether it changed since the previous fetch"""
+        station_ids = set(station_ids)
+        if self.feed is not None and self.station_ids != station_ids:
+            self.refilter(station_ids)
+        if self.feed is not None and time.time() < self.expires_at:
+            return self.feed, False
+        headers = {}
+        if self.feed is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        with self.transport.stream(self.url,
+                                   headers=headers,
+                                   timeout=self.timeout) as api_response:
+            if api_response.status_code == 304:
+                self.set_expiration(self.feed)
+                return self.feed, False
+            api_response.raise_for_status()
+            chunks = api_response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if self.cache_file is not None:
+                feed = self.parse_and_save(chunks, station_ids)
+            else:
+                feed = parse_gbfs_feed(chunks, station_ids)
+            self.etag = api_response.headers.get("ETag")
+            self.last_modified = api_response.headers.get("Last-Modified")
+        changed = (self.feed is None or
+                   feed["last_updated"] != self.feed["last_updated"] or
+                   feed["stations"] != self.feed["stations"])
+        self.feed = feed
+        self.station_ids = station_ids
+        self.set_expiration(feed)
+        if self.cache_file is not None:
+            self.save_headers_to_disk()
+        return self.feed, changed
+
+    def refilter(self, station_ids):
+        """Re-reads the saved feed for a new set of stations, or forgets it if there is none"""
+        self.station_ids = station_ids
+        try:
+            self.feed = parse_gbfs_feed(read_file_in_chunks(self.cache_file),
+                                        station_ids)
+        except (OSError, TypeError, ValueError):
+            self.feed = None
+
+    def read_all_stations(self, fields):
+        """Every station in the saved feed, trimmed to fields - None if nothing is saved"""
+        if self.cache_file is None:
+            return None
+        try:
+            return parse_gbfs_feed(read_file_in_chunks(self.cache_file), None,
+                                   fields)["stations"]
+        except (OSError, ValueError):
+            return None
+
+    def parse_and_save(self, chunks, station_ids):
+        """Parses the feed while writing the raw bytes to disk, replacing the old copy atomically"""
+        cache_directory = os.path.dirname(self.cache_file)
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+        temporary_file_path = self.cache_file + ".tmp"
+        with open(temporary_file_path, mode='wb') as temporary_file:
+
+            def chunks_written_to_disk():
+                for chunk in chunks:
+                    temporary_file.write(chunk)
+                    yield chunk
+
+            feed = parse_gbfs_feed(chunks_written_to_disk(), station_ids)
+        os.replace(temporary_file_path, self.cache_file)
+        return feed
+
+    def set_expiration(self, feed):
+        """Works out when the feed should be checked again from its ttl"""
+        ttl = feed["ttl"] or 0
+        last_updated = feed["last_updated"]
+        now = time.time()
+        if last_updated is not None and last_updated + ttl > now:
+            self.expires_at = last_updated + ttl
+        else:
+            self.expires_at = now + ttl
+
+    def load_headers_from_disk(self):
+        """Restores a previously saved copy of the feed so a restart doesn't re-download it"""
+        try:
+            with open(self.cache_file + ".headers",
+                      mode='r',
+                      encoding='utf-8') as headers_file:
+                cached_headers = json.load(headers_file)
+        except (OSError, ValueError):
+            return
+        if cached_headers.get("url") != self.url:
+            return
+        self.etag = cached_headers.get("etag")
+        self.last_modified = cached_headers.get("last_modified")
+        # The stations are filtered on the first fetch, once the configured ids are known
+        self.refilter(set())
+        if self.feed is not None:
+            self.set_expiration(self.feed)
+
+    def save_headers_to_disk(self):
+        """Saves the validators needed to make the next request conditional"""
+        temporary_file_path = self.cache_file + ".headers.tmp"
+        with open(temporary_file_path, mode='w',
+                  encoding='utf-8') as headers_file:
+            json.dump(
+                {
+                    "url": self.url,
+                    "etag": self.etag,
+                    "last_modified": self.last_modified
+                }, headers_file)
+        os.replace(temporary_file_path, self.cache_file + ".headers")
@@ -0,0 +1,620 @@
+"""Local index of the CTA's GTFS schedule - Stop search, the routes at each stop and scheduled departures
+
+build turns the CTA's GTFS static zip into one compact file. The file is
+memory-mapped rather than read in, so a lookup only touches the pages it needs
+and the full feed is never held in memory.
+
+Run from the repository root:
+python3 gtfs_index.py build
+python3 gtfs_index.py search "logan square"
+python3 gtfs_index.py nearest --count 10 --type bus
+python3 gtfs_index.py departures 30197"""
+import argparse
+import bisect
+import csv
+import io
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time  # Used to Work Out Departure Times
+import zipfile
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+CTA_GTFS_URL = "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
+
+# A stop with its routes - station_name is the parent station's name for an L platform
+Stop = namedtuple("Stop", [
+    "stop_id", "name", "station_name", "latitude", "longitude", "route_ids",
+    "is_rail"
+])
+ScheduledDeparture = namedtuple("ScheduledDeparture",
+                                ["departure_time", "route_id", "headsign"])
+
+INDEX_MAGIC = b"CTAGTFS1"
+# Each section is a flat array - Records are runs of ints, strings are numbered
+SECTIONS = (("string_offsets", "I"), ("string_data", "B"), ("stops", "i"),
+            ("stop_routes", "H"), ("routes", "i"), ("services", "i"),
+            ("service_exceptions", "i"), ("departures", "q"))
+# magic, 1 if built little endian, when it was built, then (offset, bytes) per section
+HEADER = struct.Struct("=8sB7xd" + "QQ" * len(SECTIONS))
+STOP_FIELDS = ("stop_id", "name", "latitude", "longitude", "parent",
+               "first_departure", "departure_count", "first_route",
+               "route_count")
+ROUTE_FIELDS = ("route_id", "short_name", "long_name", "route_type")
+SERVICE_FIELDS = ("service_id", "start_date", "end_date", "weekdays")
+EXCEPTION_FIELDS = ("date", "service", "exception_type")
+STOP_ID, STOP_NAME, STOP_LATITUDE, STOP_LONGITUDE, STOP_PARENT, FIRST_DEPARTURE, DEPARTURE_COUNT, FIRST_ROUTE, ROUTE_COUNT = range(
+    len(STOP_FIELDS))
+# Latitude and longitude are kept as millionths of a degree
+COORDINATE_SCALE = 1000000
+
+# A departure is one int64 - Seconds after the start of the service day in the top
+# bits, so sorting by the number sorts by time, then service, route and headsign
+DEPARTURE_SHIFT = 45
+SERVICE_SHIFT = 30
+ROUTE_SHIFT = 18
+HEADSIGN_MASK = (1 << ROUTE_SHIFT) - 1
+ROUTE_MASK = (1 << (SERVICE_SHIFT - ROUTE_SHIFT)) - 1
+SERVICE_MASK = (1 << (DEPARTURE_SHIFT - SERVICE_SHIFT)) - 1
+MAX_DEPARTURE_SECONDS = (1 << (63 - DEPARTURE_SHIFT)) - 1
+# GTFS route_type - Tram, subway/metro and rail count as the L, anything else is a bus
+RAIL_ROUTE_TYPES = frozenset([0, 1, 2])
+# calendar.txt weekday columns, in datetime.weekday() order
+WEEKDAY_COLUMNS = ("monday", "tuesday", "wednesday", "thursday", "friday",
+                   "saturday", "sunday")
+
+
+def default_index_path():
+    """GTFS_INDEX, or cache/gtfs.idx under CTAPI_DIRECTORY"""
+    return os.getenv(
+        'GTFS_INDEX',
+        os.path.join(os.getenv('CTAPI_DIRECTORY', '.'), 'cache', 'gtfs.idx'))
+
+
+class StringTable:
+    """Every distinct string in the index, numbered in the order first seen"""
+
+    def __init__(self):
+        self.numbers = {}
+        self.offsets = array("I", [0])
+        self.data = bytearray()
+
+    def add(self, text):
+        """The number for text, adding it if it is new"""
+        if text not in self.numbers:
+            self.numbers[text] = len(self.numbers)
+            self.data += text.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return self.numbers[text]
+
+
+def read_gtfs_table(gtfs_zip, table_name, columns):
+    """Yields the given columns of each row of table_name.txt as a tuple - Streamed from the zip
+
+    Missing optional columns come back as "", and a missing table yields nothing."""
+    if table_name + ".txt" not in gtfs_zip.namelist():
+        return
+    with gtfs_zip.open(table_name + ".txt") as table_file:
+        rows = csv.reader(
+            io.TextIOWrapper(table_file, encoding="utf-8-sig", newline=""))
+        header = [column.strip() for column in next(rows, [])]
+        positions = [
+            header.index(column) if column in header else None
+            for column in columns
+        ]
+        for row in rows:
+            yield tuple(row[position].strip()
+                        if position is not None and position < len(row) else ""
+                        for position in positions)
+
+
+def gtfs_seconds(gtfs_time):
+    """Seconds after the start of the service day for "25:04:00" - Past midnight runs over 24 hours"""
+    return (int(gtfs_time[:-6]) * 3600 + int(gtfs_time[-5:-3]) * 60 +
+            int(gtfs_time[-2:]))
+
+
+def build_gtfs_index(gtfs_zip_path, index_path, report_every=1000000):
+    """Reads a GTFS static zip into a new index at index_path - Returns the number of departures
+
+    stop_times.txt is streamed one row at a time, and each stop's departures are
+    kept as a packed array until they are sorted and written. The new index
+    replaces the old one atomically, so a running ctapi never sees half of it."""
+    strings = StringTable()
+    with zipfile.ZipFile(gtfs_zip_path) as gtfs_zip:
+        route_numbers = {}
+        routes = array("i")
+        for route_id, short_name, long_name, route_type in read_gtfs_table(
+                gtfs_zip, "routes", ("route_id", "route_short_name",
+                                     "route_long_name", "route_type")):
+            route_numbers[route_id] = len(route_numbers)
+            routes.extend((strings.add(route_id), strings.add(short_name),
+                           strings.add(long_name), int(route_type or 3)))
+
+        service_numbers = {}
+        services = array("i")
+
+        def service_number(service_id):
+            if service_id not in service_numbers:
+                service_numbers[service_id] = len(service_numbers)
+                # Services only in calendar_dates.txt run on their added dates alone
+                services.extend((strings.add(service_id), 0, 0, 0))
+            return service_numbers[service_id]
+
+        for calendar_row in read_gtfs_table(
+                gtfs_zip, "calendar",
+                ("service_id", "start_date", "end_date") + WEEKDAY_COLUMNS):
+            service_start = service_number(calendar_row[0]) * len(
+                SERVICE_FIELDS)
+            services[service_start + 1] = int(calendar_row[1])
+            services[service_start + 2] = int(calendar_row[2])
+            services[service_start + 3] = sum(
+                1 << weekday
+                for weekday, runs in enumerate(calendar_row[3:])
+                if runs == "1")
+        service_exceptions = sorted(
+            (int(exception_date), service_number(service_id),
+             int(exception_type))
+            for service_id, exception_date, exception_type in read_gtfs_table(
+                gtfs_zip, "calendar_dates",
+                ("service_id", "date", "exception_type")))
+
+        stop_ids = []
+        stop_rows = []
+        for stop_row in read_gtfs_table(
+                gtfs_zip, "stops",
+            ("stop_id", "stop_name", "stop_lat", "stop_lon", "parent_station")):
+            stop_ids.append(stop_row[0])
+            stop_rows.append(stop_row)
+        stop_numbers = {
+            stop_id: stop_number
+            for stop_number, stop_id in enumerate(stop_ids)
+        }
+
+        # Each trip's service, route and headsign, already packed as a departure's low bits
+        trip_bits = {}
+        for trip_id, route_id, service_id, headsign in read_gtfs_table(
+                gtfs_zip, "trips",
+            ("trip_id", "route_id", "service_id", "trip_headsign")):
+            if route_id not in route_numbers:
+                continue
+            trip_bits[trip_id] = (
+                service_number(service_id) << SERVICE_SHIFT
+                | route_numbers[route_id] << ROUTE_SHIFT
+                | strings.add(headsign))
+        if (len(service_numbers) > SERVICE_MASK + 1
+                or len(route_numbers) > ROUTE_MASK + 1):
+            raise ValueError("Too many services or routes to pack")
+
+        stop_departures = [array("q") for _ in stop_ids]
+        departure_count = 0
+        for trip_id, departure_time, stop_id, pickup_type, stop_headsign in read_gtfs_table(
+                gtfs_zip, "stop_times", ("trip_id", "departure_time",
+                                         "stop_id", "pickup_type",
+                                         "stop_headsign")):
+            # Stops that can't be boarded (like the end of the line) aren't departures
+            if (pickup_type == "1" or not departure_time
+                    or trip_id not in trip_bits or stop_id not in stop_numbers):
+                continue
+            departure_bits = trip_bits[trip_id]
+            if stop_headsign:
+                departure_bits = (departure_bits & ~HEADSIGN_MASK
+                                  | strings.add(stop_headsign))
+            stop_departures[stop_numbers[stop_id]].append(
+                min(gtfs_seconds(departure_time), MAX_DEPARTURE_SECONDS) <<
+                DEPARTURE_SHIFT | departure_bits)
+            departure_count += 1
+            if report_every and departure_count % report_every == 0:
+                print("Read " + str(departure_count) + " departures")
+        if len(strings.numbers) > HEADSIGN_MASK + 1:
+            raise ValueError("Too many distinct names to pack")
+
+    # Stops are written in stop_id order so a stop can be found by binary search
+    stop_order = sorted(range(len(stop_ids)), key=stop_ids.__getitem__)
+    stop_positions = {
+        stop_ids[stop_number]: position
+        for position, stop_number in enumerate(stop_order)
+    }
+    stops = array("i")
+    stop_routes = array("H")
+    departures = array("q")
+    for stop_number in stop_order:
+        stop_id, stop_name, latitude, longitude, parent_id = stop_rows[
+            stop_number]
+        sorted_departures = sorted(stop_departures[stop_number])
+        stop_departures[stop_number] = None
+        route_numbers_at_stop = sorted(
+            {departure >> ROUTE_SHIFT & ROUTE_MASK
+             for departure in sorted_departures})
+        stops.extend(
+            (strings.add(stop_id), strings.add(stop_name),
+             round(float(latitude or 0) * COORDINATE_SCALE),
+             round(float(longitude or 0) * COORDINATE_SCALE),
+             stop_positions.get(parent_id, -1), len(departures),
+             len(sorted_departures), len(stop_routes),
+             len(route_numbers_at_stop)))
+        departures.extend(sorted_departures)
+        stop_routes.extend(route_numbers_at_stop)
+
+    write_index(
+        index_path, {
+            "string_offsets": strings.offsets,
+            "string_data": strings.data,
+            "stops": stops,
+            "stop_routes": stop_routes,
+            "routes": routes,
+            "services": services,
+            "service_exceptions": array(
+                "i", [field for exception in service_exceptions
+                      for field in exception]),
+            "departures": departures
+        })
+    return departure_count
+
+
+def write_index(index_path, section_data):
+    """Writes the header and every section (8 byte aligned), replacing index_path atomically"""
+    index_directory = os.path.dirname(index_path)
+    if index_directory:
+        os.makedirs(index_directory, exist_ok=True)
+    section_bytes = [
+        bytes(section_data[section_name]) for section_name, _ in SECTIONS
+    ]
+    section_bounds = []
+    offset = HEADER.size
+    for data in section_bytes:
+        offset += -offset % 8
+        section_bounds.extend((offset, len(data)))
+        offset += len(data)
+    temporary_file_path = index_path + ".tmp"
+    with open(temporary_file_path, mode='wb') as index_file:
+        index_file.write(
+            HEADER.pack(INDEX_MAGIC, sys.byteorder == "little", time.time(),
+                        *section_bounds))
+        for section_number, data in enumerate(section_bytes):
+            index_file.write(b"\0" *
+                             (section_bounds[section_number * 2] -
+                              index_file.tell()))
+            index_file.write(data)
+    os.replace(temporary_file_path, index_path)
+
+
+class GtfsIndex:
+    """A built index, memory-mapped - Stops are found by binary search and departures by bisect
+
+    Nothing is read up front besides the header. The only thing kept is the set
+    of services running on each date looked up."""
+
+    def __init__(self, index_path):
+        with open(index_path, mode='rb') as index_file:
+            self.index_map = mmap.mmap(index_file.fileno(),
+                                       0,
+                                       access=mmap.ACCESS_READ)
+        if len(self.index_map) < HEADER.size:
+            raise ValueError(index_path + " is too short to be a GTFS index")
+        magic, little_endian, self.built_at, *section_bounds = HEADER.unpack_from(
+            self.index_map)
+        if magic != INDEX_MAGIC:
+            raise ValueError(index_path +
+                             " isn't a GTFS index - Build it with gtfs_index.py build")
+        if bool(little_endian) != (sys.byteorder == "little"):
+            raise ValueError(index_path +
+                             " was built on a machine with a different byte order - Build it again here")
+        index_view = memoryview(self.index_map)
+        self.sections = {}
+        for section_number, (section_name, typecode) in enumerate(SECTIONS):
+            offset, length = section_bounds[section_number *
+                                            2:section_number * 2 + 2]
+            self.sections[section_name] = index_view[offset:offset +
+                                                     length].cast(typecode)
+        self.stop_count = len(self.sections["stops"]) // len(STOP_FIELDS)
+        self.services_by_date = {}  # date -> frozenset of service numbers
+
+    def string(self, string_number):
+        """The string numbered string_number"""
+        string_offsets = self.sections["string_offsets"]
+        return bytes(self.sections["string_data"][
+            string_offsets[string_number]:string_offsets[string_number +
+                                                         1]]).decode("utf-8")
+
+    def stop_record(self, position):
+        """The raw fields of the stop at position"""
+        record_start = position * len(STOP_FIELDS)
+        return self.sections["stops"][record_start:record_start +
+                                      len(STOP_FIELDS)]
+
+    def stop_id_bytes(self, position):
+        """The UTF-8 stop_id of the stop at position - Compared without decoding it"""
+        string_number = self.sections["stops"][position * len(STOP_FIELDS) +
+                                               STOP_ID]
+        string_offsets = self.sections["string_offsets"]
+        return bytes(self.sections["string_data"]
+                     [string_offsets[string_number]:string_offsets[string_number
+                                                                   + 1]])
+
+    def stop_position(self, stop_id):
+        """Where stop_id is in the stop table, None if it isn't in the schedule"""
+        wanted = str(stop_id).encode("utf-8")
+        position = first_at_least(self.stop_count, wanted, self.stop_id_bytes)
+        if position < self.stop_count and self.stop_id_bytes(position) == wanted:
+            return position
+        return None
+
+    def route_fields(self, route_number):
+        """(route_id, short name, long name, route_type) for a route"""
+        route_start = route_number * len(ROUTE_FIELDS)
+        route_id, short_name, long_name, route_type = self.sections["routes"][
+            route_start:route_start + len(ROUTE_FIELDS)]
+        return (self.string(route_id), self.string(short_name),
+                self.string(long_name), route_type)
+
+    def stop_at(self, position):
+        """The Stop at position in the stop table"""
+        stop_record = self.stop_record(position)
+        route_numbers = self.sections["stop_routes"][
+            stop_record[FIRST_ROUTE]:stop_record[FIRST_ROUTE] +
+            stop_record[ROUTE_COUNT]]
+        routes = [self.route_fields(route_number) for route_number in route_numbers]
+        name = self.string(stop_record[STOP_NAME])
+        station_name = name
+        if stop_record[STOP_PARENT] >= 0:
+            station_name = self.string(
+                self.stop_record(stop_record[STOP_PARENT])[STOP_NAME])
+        return Stop(self.string(stop_record[STOP_ID]), name, station_name,
+                    stop_record[STOP_LATITUDE] / COORDINATE_SCALE,
+                    stop_record[STOP_LONGITUDE] / COORDINATE_SCALE,
+                    [route[0] for route in routes],
+                    any(route[3] in RAIL_ROUTE_TYPES for route in routes))
+
+    def stop(self, stop_id):
+        """The Stop for stop_id, None if it isn't in the schedule"""
+        position = self.stop_position(stop_id)
+        return None if position is None else self.stop_at(position)
+
+    def stop_is_rail(self, position):
+        """True if an L route stops at position - Read from the route table without decoding names"""
+        stop_record = self.stop_record(position)
+        routes = self.sections["routes"]
+        return any(
+            routes[route_number * len(ROUTE_FIELDS) + 3] in RAIL_ROUTE_TYPES
+            for route_number in self.sections["stop_routes"]
+            [stop_record[FIRST_ROUTE]:stop_record[FIRST_ROUTE] +
+             stop_record[ROUTE_COUNT]])
+
+    def served_positions(self, rail=None):
+        """Positions of every stop with at least one departure - rail=True/False for L/bus only"""
+        for position in range(self.stop_count):
+            if self.stop_record(position)[DEPARTURE_COUNT] and (
+                    rail is None or self.stop_is_rail(position) == rail):
+                yield position
+
+    def search(self, query, rail=None):
+        """Stops whose name (or station name) has every word in query"""
+        words = query.lower().split()
+        stops = []
+        for position in self.served_positions(rail):
+            stop_record = self.stop_record(position)
+            name = self.string(stop_record[STOP_NAME])
+            if stop_record[STOP_PARENT] >= 0:
+                name += " " + self.string(
+                    self.stop_record(stop_record[STOP_PARENT])[STOP_NAME])
+            if all(word in name.lower() for word in words):
+                stops.append(self.stop_at(position))
+        return stops
+
+    def nearest(self, latitude, longitude, count, rail=None):
+        """The count closest stops with departures to a point as [(Stop, miles)]"""
+        from station_index import StationIndex  # pylint: disable=import-outside-toplevel
+        stop_locations = {}
+        for position in self.served_positions(rail):
+            stop_record = self.stop_record(position)
+            stop_locations[position] = (
+                stop_record[STOP_LATITUDE] / COORDINATE_SCALE,
+                stop_record[STOP_LONGITUDE] / COORDINATE_SCALE)
+        if not stop_locations:
+            return []
+        return [(self.stop_at(position), miles)
+                for position, miles in StationIndex(
+                    stop_locations, latitude, longitude).nearest_to_home(count)]
+
+    def services_on(self, service_date):
+        """The services running on a date (calendar.txt plus calendar_dates.txt exceptions)"""
+        if service_date not in self.services_by_date:
+            date_number = int(service_date.strftime("%Y%m%d"))
+            weekday_bit = 1 << service_date.weekday()
+            services = self.sections["services"]
+            running = {
+                service_number
+                for service_number in range(
+                    len(services) // len(SERVICE_FIELDS))
+                if services[service_number * len(SERVICE_FIELDS) + 3] & weekday_bit and
+                services[service_number * len(SERVICE_FIELDS) + 1] <= date_number <=
+                services[service_number * len(SERVICE_FIELDS) + 2]
+            }
+            service_exceptions = self.sections["service_exceptions"]
+            exception_count = len(service_exceptions) // len(EXCEPTION_FIELDS)
+            first_exception = first_at_least(
+                exception_count, date_number,
+                lambda exception_number: service_exceptions[
+                    exception_number * len(EXCEPTION_FIELDS)])
+            for exception_number in range(first_exception, exception_count):
+                exception_date, service_number, exception_type = service_exceptions[
+                    exception_number * len(EXCEPTION_FIELDS):(exception_number + 1) *
+                    len(EXCEPTION_FIELDS)]
+                if exception_date != date_number:
+                    break
+                if exception_type == 1:
+                    running.add(service_number)
+                else:
+                    running.discard(service_number)
+            # Only a few dates are ever looked up at once
+            if len(self.services_by_date) > 8:
+                self.services_by_date.clear()
+            self.services_by_date[service_date] = frozenset(running)
+        return self.services_by_date[service_date]
+
+    def scheduled_departures(self,
+                             stop_id,
+                             after=None,
+                             count=3,
+                             within_seconds=7200,
+                             route_id=None):
+        """The next count departures from a stop after a local datetime (default now) as ScheduledDeparture
+
+        Departures are looked up on yesterday's service day too, as its trips run
+        past midnight, and on tomorrow's. Service days start at local midnight."""
+        position = self.stop_position(stop_id)
+        if position is None:
+            return []
+        after = datetime.now() if after is None else after
+        stop_record = self.stop_record(position)
+        departures = self.sections["departures"]
+        first_departure = stop_record[FIRST_DEPARTURE]
+        last_departure = first_departure + stop_record[DEPARTURE_COUNT]
+        found = []
+        for day_offset in (-1, 0, 1):
+            service_date = after.date() + timedelta(days=day_offset)
+            service_day_start = datetime.combine(service_date,
+                                                 datetime.min.time())
+            start_seconds = max(
+                int((after - service_day_start).total_seconds()), 0)
+            end_seconds = start_seconds + within_seconds
+            if (after - service_day_start).total_seconds() + within_seconds < 0:
+                continue
+            running = self.services_on(service_date)
+            found_on_day = 0
+            departure_number = bisect.bisect_left(
+                departures, start_seconds << DEPARTURE_SHIFT, first_departure,
+                last_departure)
+            while departure_number < last_departure and found_on_day < count:
+                departure = departures[departure_number]
+                departure_number += 1
+                departure_seconds = departure >> DEPARTURE_SHIFT
+                if departure_seconds >= end_seconds:
+                    break
+                if departure >> SERVICE_SHIFT & SERVICE_MASK not in running:
+                    continue
+                departure_route_id = self.string(
+                    self.sections["routes"][(departure >> ROUTE_SHIFT
+                                             & ROUTE_MASK) *
+                                            len(ROUTE_FIELDS)])
+                if route_id is not None and departure_route_id != route_id:
+                    continue
+                found.append(
+                    ScheduledDeparture(
+                        service_day_start +
+                        timedelta(seconds=departure_seconds),
+                        departure_route_id,
+                        self.string(departure & HEADSIGN_MASK)))
+                found_on_day += 1
+        found.sort()
+        return found[:count]
+
+
+def first_at_least(record_count, wanted, record_key):
+    """Binary search - The first record number whose key isn't below wanted (record_count if none)"""
+    low, high = 0, record_count
+    while low < high:
+        middle = (low + high) // 2
+        if record_key(middle) < wanted:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def download_gtfs(url, zip_path):
+    """Saves the GTFS zip at url to zip_path"""
+    from http_transport import HttpTransport  # pylint: disable=import-outside-toplevel
+    with HttpTransport().stream(url, timeout=60) as api_response:
+        api_response.raise_for_status()
+        with open(zip_path, mode='wb') as zip_file:
+            for chunk in api_response.iter_content(chunk_size=1048576):
+                zip_file.write(chunk)
+
+
+def print_stops(stops_with_miles):
+    """One line per stop - id, L or bus, name, routes and (if known) miles away"""
+    for stop, miles in stops_with_miles:
+        print("{:<8} {:<5} {:<45} {:<20}{}".format(
+            stop.stop_id, "train" if stop.is_rail else "bus", stop.name,
+            ", ".join(stop.route_ids),
+            "" if miles is None else " {:.2f}mi".format(miles)))
+    if stops_with_miles:
+        print("\nAdd train stops to train-tracker station-ids. Add a bus stop to "
+              "bus-tracker stop-ids once per route, with the route at the same "
+              "position in route-ids")
+
+
+def main():
+    """Builds the index, searches it for stops or lists a stop's next departures"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command",
+                        choices=("build", "search", "nearest", "departures"))
+    parser.add_argument(
+        "argument",
+        nargs="?",
+        help="GTFS zip path or URL to build from, name to search for, or stop id")
+    parser.add_argument("--index", default=default_index_path())
+    parser.add_argument("--type", choices=("train", "bus"))
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--latitude", type=float)
+    parser.add_argument("--longitude", type=float)
+    arguments = parser.parse_args()
+    rail = None if arguments.type is None else arguments.type == "train"
+
+    if arguments.command == "build":
+        gtfs_source = arguments.argument or CTA_GTFS_URL
+        build_start = time.monotonic()
+        if gtfs_source.startswith(("http://", "https://")):
+            with tempfile.TemporaryDirectory() as download_directory:
+                zip_path = os.path.join(download_directory, "gtfs.zip")
+                print("Downloading " + gtfs_source)
+                download_gtfs(gtfs_source, zip_path)
+                departure_count = build_gtfs_index(zip_path, arguments.index)
+        else:
+            departure_count = build_gtfs_index(gtfs_source, arguments.index)
+        print("Indexed " + str(departure_count) + " departures into " +
+              arguments.index + " (" +
+              str(round(os.path.getsize(arguments.index) / 1048576, 1)) +
+              " MiB) in " + str(round(time.monotonic() - build_start, 1)) + "s")
+        return
+
+    gtfs_index = GtfsIndex(arguments.index)
+    if arguments.command == "search":
+        if not arguments.argument:
+            parser.error("search needs a name")
+        print_stops([(stop, None)
+                     for stop in gtfs_index.search(arguments.argument, rail)
+                     [:arguments.count]])
+    elif arguments.command == "nearest":
+        from dotenv import load_dotenv  # pylint: disable=import-outside-toplevel
+        load_dotenv()
+        latitude = arguments.latitude or os.getenv('HOME_LATITUDE')
+        longitude = arguments.longitude or os.getenv('HOME_LONGITUDE')
+        if latitude is None or longitude is None:
+            parser.error("nearest needs HOME_LATITUDE/HOME_LONGITUDE in .env "
+                         "or --latitude and --longitude")
+        print_stops(
+            gtfs_index.nearest(float(latitude), float(longitude),
+                               arguments.count, rail))
+    else:
+        if not arguments.argument:
+            parser.error("departures needs a stop id")
+        stop = gtfs_index.stop(arguments.argument)
+        if stop is None:
+            parser.error(arguments.argument + " isn't in the schedule")
+        print(stop.stop_id + " - " + stop.name)
+        for departure in gtfs_index.scheduled_departures(
+                arguments.argument, count=arguments.count):
+            print("{}  {} to {}".format(
+                departure.departure_time.strftime("%H:%M"), departure.route_id,
+                departure.headsign))
+
+
+if __name__ == "__main__":
+    main()
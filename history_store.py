@@ -0,0 +1,435 @@
+"""Append-only history of every prediction ctapi fetches, for headway and reliability analysis
+
+Run from the repository root to query it:
+python3 history_store.py headways 30197 --days 7
+python3 history_store.py delays --days 7
+python3 history_store.py bikes 13089 --days 28"""
+import argparse
+import os
+import sqlite3  # Used to Keep the History on Disk
+import threading
+import time  # Used to Stamp Each Observation
+from collections import deque
+from contextlib import closing
+from datetime import datetime
+
+from arrivals_store import epoch_seconds
+
+# Flag bits stored with each prediction
+SCHEDULED_FLAG = 1
+APPROACHING_FLAG = 2
+DELAYED_FLAG = 4
+# The same vehicle predicted this much later than before is on its next trip past the stop
+TRIP_GAP_SECONDS = 1800
+# A vehicle that drops out of the response within this long of its predicted arrival has arrived
+ARRIVAL_WINDOW_SECONDS = 180
+# Gaps longer than this (overnight, service changes) aren't counted as headways
+MAX_HEADWAY_SECONDS = 7200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    observed_at INTEGER NOT NULL,
+    item_type TEXT NOT NULL,
+    stop_id TEXT NOT NULL,
+    route TEXT,
+    destination_name TEXT,
+    vehicle_id TEXT,
+    arrival_epoch INTEGER NOT NULL,
+    predicted_epoch INTEGER NOT NULL,
+    flags INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_by_time ON predictions (observed_at);
+CREATE TABLE IF NOT EXISTS arrivals (
+    item_type TEXT NOT NULL,
+    stop_id TEXT NOT NULL,
+    route TEXT,
+    destination_name TEXT,
+    vehicle_id TEXT,
+    arrival_epoch INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    flags INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS arrivals_by_stop ON arrivals (stop_id, arrival_epoch);
+CREATE TABLE IF NOT EXISTS bike_counts (
+    observed_at INTEGER NOT NULL,
+    station_id TEXT NOT NULL,
+    ebikes_available INTEGER,
+    classic_available INTEGER
+);
+CREATE INDEX IF NOT EXISTS bike_counts_by_station ON bike_counts (station_id, observed_at);
+"""
+
+
+class PredictionHistory:
+    """Records every train and bus prediction and Divvy count to SQLite on a background thread
+
+    The fetch thread only appends what it fetched to a queue. Every flush_seconds
+    the writer turns the queue into rows and writes them in one transaction, so
+    the SD card sees one write per flush rather than one per row (WAL mode with
+    synchronous=NORMAL only syncs at checkpoints). Only changes are stored - A
+    prediction is written when its arrival time or flags move, a Divvy count
+    when it changes.
+
+    Each vehicle is followed from its first prediction at a stop until it drops
+    out of the response, when one row is added to arrivals. Raw predictions are
+    kept for raw_retention_days, arrivals and Divvy counts for
+    rollup_retention_days, and old rows are cleared once a day."""
+
+    def __init__(self,
+                 database_path,
+                 flush_seconds=60,
+                 raw_retention_days=14,
+                 rollup_retention_days=365,
+                 max_pending=5000):
+        self.database_path = database_path
+        self.flush_seconds = flush_seconds
+        self.raw_retention_days = raw_retention_days
+        self.rollup_retention_days = rollup_retention_days
+        # Oldest observations are dropped if the writer ever falls this far behind
+        self.pending = deque(maxlen=max_pending)
+        self.open_trips = {}  # (item_type, stop_id, vehicle_id) -> trip
+        self.bike_counts = {}  # station_id -> (ebikes, classic) last written
+        self.flush_requested = threading.Event()
+        self.flushed = threading.Condition()
+        self.flushes_started = 0
+        self.flush_count = 0
+        self.last_compacted_day = None
+        self.connection = None
+        self.rows_written = 0
+
+    def start(self):
+        """Opens the database and starts the writer thread"""
+        database_directory = os.path.dirname(self.database_path)
+        if database_directory:
+            os.makedirs(database_directory, exist_ok=True)
+        # The writer thread opens its own connection, this one only checks it can be opened
+        open_database(self.database_path).close()
+        threading.Thread(target=self.writer_loop,
+                         name="history-writer",
+                         daemon=True).start()
+
+    def record_train_etas(self, requested_stop_id, train_etas, observed_at=None):
+        """Queues a Train Tracker response - Only a deque append, the writer does the rest"""
+        self.pending.append(("train", (requested_stop_id, ), train_etas,
+                             time.time() if observed_at is None else observed_at))
+
+    def record_bus_predictions(self, requested_stop_ids, bus_predictions,
+                               observed_at=None):
+        """Queues a Bus Tracker response for the requested stops"""
+        self.pending.append(("bus", tuple(requested_stop_ids), bus_predictions,
+                             time.time() if observed_at is None else observed_at))
+
+    def record_bike_counts(self, station_stats, observed_at=None):
+        """Queues {station_id: station} from the Divvy Station Status feed"""
+        self.pending.append(("bicycle", (), station_stats,
+                             time.time() if observed_at is None else observed_at))
+
+    def flush(self, timeout=None):
+        """Wakes the writer and waits until everything queued so far is on disk"""
+        with self.flushed:
+            # A flush already under way may have missed what was just queued
+            flush_target = self.flushes_started + 1
+            self.flush_requested.set()
+            return self.flushed.wait_for(
+                lambda: self.flush_count >= flush_target, timeout=timeout)
+
+    def writer_loop(self):
+        """Writer thread - Writes whatever is queued every flush_seconds"""
+        self.connection = open_database(self.database_path)
+        while True:
+            self.flush_requested.wait(self.flush_seconds)
+            self.flush_requested.clear()
+            with self.flushed:
+                self.flushes_started += 1
+            try:
+                self.write_pending()
+                self.compact()
+            except Exception as error:  # pylint: disable=broad-except
+                print("Error writing prediction history: " + str(error))
+            with self.flushed:
+                self.flush_count += 1
+                self.flushed.notify_all()
+
+    def write_pending(self):
+        """Turns every queued observation into rows and writes them in one transaction"""
+        prediction_rows = []
+        arrival_rows = []
+        bike_rows = []
+        while self.pending:
+            item_type, stop_ids, records, observed_at = self.pending.popleft()
+            observed_at = int(observed_at)
+            if item_type == "bicycle":
+                bike_rows.extend(self.changed_bike_counts(records, observed_at))
+            else:
+                self.follow_trips(item_type, stop_ids, records, observed_at,
+                                  prediction_rows, arrival_rows)
+        if not (prediction_rows or arrival_rows or bike_rows):
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                prediction_rows)
+            self.connection.executemany(
+                "INSERT INTO arrivals VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                arrival_rows)
+            self.connection.executemany(
+                "INSERT INTO bike_counts VALUES (?, ?, ?, ?)", bike_rows)
+        self.rows_written += len(prediction_rows) + len(arrival_rows) + len(
+            bike_rows)
+
+    def follow_trips(self, item_type, stop_ids, records, observed_at,
+                     prediction_rows, arrival_rows):
+        """Adds a row for each changed prediction and an arrival for each vehicle that has come and gone"""
+        seen_trips = set()
+        for record in records:
+            if item_type == "train":
+                vehicle_id = record.run_number
+                arrival_epoch = epoch_seconds(record.arrival_time)
+                predicted_epoch = epoch_seconds(record.prediction_time)
+                flags = ((SCHEDULED_FLAG if record.is_scheduled else 0) |
+                         (APPROACHING_FLAG if record.is_approaching else 0) |
+                         (DELAYED_FLAG if record.is_delayed else 0))
+            else:
+                vehicle_id = record.vehicle_id
+                arrival_epoch = epoch_seconds(record.prediction_time)
+                predicted_epoch = epoch_seconds(record.timestamp)
+                flags = ((APPROACHING_FLAG if record.countdown == "DUE" else 0)
+                         | (DELAYED_FLAG if record.countdown == "DLY"
+                            or record.is_delayed else 0))
+            trip_key = (item_type, record.stop_id, vehicle_id)
+            trip = self.open_trips.get(trip_key)
+            if trip is not None and abs(arrival_epoch -
+                                        trip["arrival_epoch"]) > TRIP_GAP_SECONDS:
+                # The vehicle is already on its next trip past the stop
+                self.close_trip(trip_key, trip, observed_at, arrival_rows)
+                trip = None
+            if trip is None:
+                trip = {
+                    "route": record.route,
+                    "destination_name": record.destination_name,
+                    "first_seen": observed_at,
+                    "arrival_epoch": None,
+                    "flags": 0,
+                    "flags_seen": 0
+                }
+                self.open_trips[trip_key] = trip
+            seen_trips.add(trip_key)
+            if (arrival_epoch, flags) != (trip["arrival_epoch"], trip["flags"]):
+                prediction_rows.append(
+                    (observed_at, item_type, record.stop_id, record.route,
+                     record.destination_name, vehicle_id, arrival_epoch,
+                     predicted_epoch, flags))
+                trip["arrival_epoch"] = arrival_epoch
+                trip["flags"] = flags
+                trip["flags_seen"] |= flags
+        for trip_key in list(self.open_trips):
+            trip = self.open_trips[trip_key]
+            if trip_key[0] == item_type and trip_key[
+                    1] in stop_ids and trip_key not in seen_trips:
+                self.close_trip(trip_key, trip, observed_at, arrival_rows)
+            elif trip["arrival_epoch"] < observed_at - TRIP_GAP_SECONDS:
+                # The stop is no longer being polled
+                del self.open_trips[trip_key]
+
+    def close_trip(self, trip_key, trip, observed_at, arrival_rows):
+        """Records an arrival if the vehicle was due - One that vanished early is dropped"""
+        del self.open_trips[trip_key]
+        if trip["arrival_epoch"] - observed_at <= ARRIVAL_WINDOW_SECONDS:
+            item_type, stop_id, vehicle_id = trip_key
+            arrival_rows.append(
+                (item_type, stop_id, trip["route"], trip["destination_name"],
+                 vehicle_id, trip["arrival_epoch"], trip["first_seen"],
+                 trip["flags_seen"]))
+
+    def changed_bike_counts(self, station_stats, observed_at):
+        """Rows for the Divvy stations whose counts moved since they were last written"""
+        bike_rows = []
+        for station_id, station in station_stats.items():
+            counts = (station['num_ebikes_available'],
+                      station['num_bikes_available'])
+            if self.bike_counts.get(station_id) != counts:
+                self.bike_counts[station_id] = counts
+                bike_rows.append((observed_at, station_id) + counts)
+        return bike_rows
+
+    def compact(self, now=None):
+        """Once a day, deletes rows past their retention and gives the space back"""
+        now = time.time() if now is None else now
+        today = time.localtime(now)[:3]
+        if today == self.last_compacted_day:
+            return
+        self.last_compacted_day = today
+        raw_cutoff = int(now - self.raw_retention_days * 86400)
+        rollup_cutoff = int(now - self.rollup_retention_days * 86400)
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM predictions WHERE observed_at < ?", (raw_cutoff, ))
+            self.connection.execute(
+                "DELETE FROM arrivals WHERE arrival_epoch < ?",
+                (rollup_cutoff, ))
+            self.connection.execute(
+                "DELETE FROM bike_counts WHERE observed_at < ?",
+                (rollup_cutoff, ))
+        self.connection.execute("PRAGMA incremental_vacuum")
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def open_database(database_path, read_only=False):
+    """A connection to the history database, creating the tables if needed"""
+    if read_only:
+        return sqlite3.connect("file:" + database_path + "?mode=ro", uri=True)
+    connection = sqlite3.connect(database_path)
+    # Must be set before the first table is created to take effect
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    connection.execute("PRAGMA journal_mode = WAL")
+    # In WAL mode NORMAL only syncs at checkpoints - A power cut can lose the last flush, not the database
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def summarize(samples):
+    """Count, mean and percentiles of a list of seconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "min": ordered[0],
+        "p10": percentile(0.1),
+        "median": percentile(0.5),
+        "p90": percentile(0.9),
+        "max": ordered[-1]
+    }
+
+
+def headway_distribution(database_path, stop_id, since=None, until=None):
+    """{(route, destination_name): summary of seconds between consecutive arrivals} at a stop
+
+    Only gaps up to MAX_HEADWAY_SECONDS count, so the overnight gap isn't a headway."""
+    since = 0 if since is None else since
+    until = time.time() if until is None else until
+    with closing(open_database(database_path,
+                               read_only=True)) as connection:
+        arrival_rows = connection.execute(
+            "SELECT route, destination_name, arrival_epoch FROM arrivals"
+            " WHERE stop_id = ? AND arrival_epoch BETWEEN ? AND ?"
+            " ORDER BY route, destination_name, arrival_epoch",
+            (stop_id, since, until)).fetchall()
+    headways = {}
+    previous_arrivals = {}
+    for route, destination_name, arrival_epoch in arrival_rows:
+        direction = (route, destination_name)
+        headways.setdefault(direction, [])
+        if direction in previous_arrivals:
+            headway = arrival_epoch - previous_arrivals[direction]
+            if 0 < headway <= MAX_HEADWAY_SECONDS:
+                headways[direction].append(headway)
+        previous_arrivals[direction] = arrival_epoch
+    return {
+        direction: summarize(samples)
+        for direction, samples in headways.items()
+    }
+
+
+def delay_rates(database_path, since=None, until=None):
+    """{(item_type, stop_id, route): (arrivals, arrivals flagged delayed at any point)}"""
+    since = 0 if since is None else since
+    until = time.time() if until is None else until
+    with closing(open_database(database_path,
+                               read_only=True)) as connection:
+        delay_rows = connection.execute(
+            "SELECT item_type, stop_id, route, COUNT(*),"
+            " SUM((flags & ?) != 0) FROM arrivals"
+            " WHERE arrival_epoch BETWEEN ? AND ?"
+            " GROUP BY item_type, stop_id, route",
+            (DELAYED_FLAG, since, until)).fetchall()
+    return {(item_type, stop_id, route): (arrival_count, delayed_count)
+            for item_type, stop_id, route, arrival_count, delayed_count in
+            delay_rows}
+
+
+def bike_availability(database_path, station_id, since=None, until=None):
+    """{hour of day: (average ebikes, average classic bikes, fraction of time empty)} at a Divvy station
+
+    Counts are weighted by how long they lasted, each holding until the next change."""
+    since = 0 if since is None else since
+    until = time.time() if until is None else until
+    with closing(open_database(database_path,
+                               read_only=True)) as connection:
+        count_rows = connection.execute(
+            "SELECT observed_at, ebikes_available, classic_available"
+            " FROM bike_counts WHERE station_id = ? AND observed_at BETWEEN ? AND ?"
+            " ORDER BY observed_at", (station_id, since, until)).fetchall()
+    hours = {}  # hour -> [seconds, ebike seconds, classic seconds, empty seconds]
+    for (observed_at, ebikes, classic), (next_observed_at, _, _) in zip(
+            count_rows, count_rows[1:] + [(until, None, None)]):
+        # Split each count at the hour boundaries it spans
+        while observed_at < next_observed_at:
+            hour_end = (observed_at // 3600 + 1) * 3600
+            seconds = min(hour_end, next_observed_at) - observed_at
+            hour_totals = hours.setdefault(
+                datetime.fromtimestamp(observed_at).hour, [0, 0, 0, 0])
+            hour_totals[0] += seconds
+            hour_totals[1] += seconds * (ebikes or 0)
+            hour_totals[2] += seconds * (classic or 0)
+            if not ebikes and not classic:
+                hour_totals[3] += seconds
+            observed_at += seconds
+    return {
+        hour: (ebike_seconds / seconds, classic_seconds / seconds,
+               empty_seconds / seconds)
+        for hour, (seconds, ebike_seconds, classic_seconds,
+                   empty_seconds) in sorted(hours.items())
+    }
+
+
+def main():
+    """Prints headways, delay rates or Divvy availability from the history"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("report", choices=("headways", "delays", "bikes"))
+    parser.add_argument("id", nargs="?", help="Stop id or Divvy station id")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--database",
+                        default=os.getenv(
+                            'HISTORY_DATABASE',
+                            os.path.join(os.getenv('CTAPI_DIRECTORY', '.'),
+                                         'history', 'predictions.db')))
+    arguments = parser.parse_args()
+    since = time.time() - arguments.days * 86400
+    if arguments.report != "delays" and arguments.id is None:
+        parser.error(arguments.report + " needs a stop or station id")
+
+    if arguments.report == "headways":
+        for (route, destination_name), summary in headway_distribution(
+                arguments.database, arguments.id, since).items():
+            if not summary["count"]:
+                continue
+            print("{} to {} - {} headways | mean {:.1f} min | median {:.1f} | "
+                  "p10 {:.1f} | p90 {:.1f} | max {:.1f}".format(
+                      route, destination_name, summary["count"],
+                      summary["mean"] / 60, summary["median"] / 60,
+                      summary["p10"] / 60, summary["p90"] / 60,
+                      summary["max"] / 60))
+    elif arguments.report == "delays":
+        for (item_type, stop_id, route), (arrival_count,
+                                          delayed_count) in delay_rates(
+                                              arguments.database,
+                                              since).items():
+            print("{} {} route {} - {} arrivals, {} delayed ({:.1%})".format(
+                item_type, stop_id, route, arrival_count, delayed_count,
+                delayed_count / arrival_count))
+    else:
+        for hour, (ebikes, classic, empty_fraction) in bike_availability(
+                arguments.database, arguments.id, since).items():
+            print("{:02d}:00 - {:.1f} ebikes | {:.1f} classic | empty {:.0%}".
+                  format(hour, ebikes, classic, empty_fraction))
+
+
+if __name__ == "__main__":
+    main()
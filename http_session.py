@@ -0,0 +1,62 @@
+"""The requests session behind HttpTransport - Keep-alive pools that time every new connection"""
+import time  # Used to Time Connection Setup
+
+import requests  # Used for API Calls
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+def timed_connection_class(connection_class, record_connection):
+    """connection_class, calling record_connection(host, seconds) after each TCP (and TLS) handshake"""
+
+    class TimedConnection(connection_class):
+        """A urllib3 connection that reports how long it took to connect"""
+
+        def connect(self):
+            connect_start = time.monotonic()
+            super().connect()
+            record_connection(self.host, time.monotonic() - connect_start)
+
+    return TimedConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools time every new connection"""
+
+    def __init__(self, record_connection, **kwargs):
+        # Set before HTTPAdapter.__init__, which builds the pool manager
+        self.record_connection = record_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http":
+            type(
+                "TimedHTTPConnectionPool", (HTTPConnectionPool, ), {
+                    "ConnectionCls":
+                    timed_connection_class(HTTPConnection,
+                                           self.record_connection)
+                }),
+            "https":
+            type(
+                "TimedHTTPSConnectionPool", (HTTPSConnectionPool, ), {
+                    "ConnectionCls":
+                    timed_connection_class(HTTPSConnection,
+                                           self.record_connection)
+                })
+        }
+
+
+def create_session(record_connection, pool_maxsize=8):
+    """A gzip-accepting session whose pools call record_connection(host, seconds) for each new connection"""
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    # One pool per host, each holding as many connections as there are fetch threads
+    adapter = TimedHTTPAdapter(record_connection,
+                               pool_connections=16,
+                               pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
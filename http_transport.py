@@ -0,0 +1,113 @@
+"""One pooled, keep-alive HTTP session for every upstream API, with per-host traffic counters"""
+import threading
+import time  # Used to Time Requests
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+HOST_STAT_FIELDS = ("requests", "connections", "connect_seconds",
+                    "request_seconds", "wire_bytes", "decoded_bytes")
+
+
+class HttpTransport:
+    """Every API call goes through here so connections to each host are kept open and reused
+
+    Responses are requested gzipped, and each request gets connect_timeout to
+    connect plus its own read timeout. Per host it counts requests, new
+    connections (each one a TCP and, for https, TLS handshake) and the time
+    spent setting them up, time spent on requests, and bytes over the wire
+    (compressed) and after decoding. requests itself isn't imported until the
+    first call, so it isn't paid for before the display is up."""
+
+    def __init__(self, connect_timeout=3.05, pool_maxsize=8):
+        self.connect_timeout = connect_timeout
+        self.pool_maxsize = pool_maxsize
+        self.stats_lock = threading.Lock()
+        self.host_stats = {}  # host -> {field: total}
+        self.session_lock = threading.Lock()
+        self.session = None
+
+    def open_session(self):
+        """The shared requests session, created on first use"""
+        with self.session_lock:
+            if self.session is None:
+                from http_session import create_session  # pylint: disable=import-outside-toplevel
+                self.session = create_session(self.record_connection,
+                                              self.pool_maxsize)
+            return self.session
+
+    def get(self, url, timeout=10, **kwargs):
+        """requests.get through the shared session - The whole body is read before returning"""
+        session = self.open_session()
+        request_start = time.monotonic()
+        api_response = session.get(url,
+                                   timeout=self.timeouts(timeout),
+                                   **kwargs)
+        self.record_response(url, api_response,
+                             time.monotonic() - request_start,
+                             len(api_response.content))
+        return api_response
+
+    @contextmanager
+    def stream(self, url, timeout=10, **kwargs):
+        """Like get(stream=True) as a with block - Counted once the body has been read and closed"""
+        session = self.open_session()
+        request_start = time.monotonic()
+        api_response = session.get(url,
+                                   timeout=self.timeouts(timeout),
+                                   stream=True,
+                                   **kwargs)
+        try:
+            yield api_response
+        finally:
+            api_response.close()
+            self.record_response(url, api_response,
+                                 time.monotonic() - request_start, None)
+
+    def timeouts(self, read_timeout):
+        """(connect, read) timeouts - A tuple passed in is used as is"""
+        if isinstance(read_timeout, tuple):
+            return read_timeout
+        return (min(self.connect_timeout, read_timeout), read_timeout)
+
+    def record_connection(self, host, connect_seconds):
+        """Counts one new connection to host"""
+        with self.stats_lock:
+            host_stats = self.stats_for(host)
+            host_stats["connections"] += 1
+            host_stats["connect_seconds"] += connect_seconds
+
+    def record_response(self, url, api_response, request_seconds,
+                        decoded_bytes):
+        """Counts one request to url's host - decoded_bytes is None for a stream"""
+        with self.stats_lock:
+            host_stats = self.stats_for(urlsplit(url).hostname)
+            host_stats["requests"] += 1
+            host_stats["request_seconds"] += request_seconds
+            # What came over the wire, before gzip was undone
+            host_stats["wire_bytes"] += api_response.raw.tell()
+            if decoded_bytes is not None:
+                host_stats["decoded_bytes"] += decoded_bytes
+
+    def stats_for(self, host):
+        """The counters for host, created the first time it is seen - Call with stats_lock held"""
+        if host not in self.host_stats:
+            self.host_stats[host] = dict.fromkeys(HOST_STAT_FIELDS, 0)
+        return self.host_stats[host]
+
+    def snapshot(self):
+        """{host: {field: total}} so far"""
+        with self.stats_lock:
+            return {
+                host: dict(host_stats)
+                for host, host_stats in self.host_stats.items()
+            }
+
+    def print_report(self):
+        """Prints requests, handshakes and bytes per host since ctapi started"""
+        for host, host_stats in sorted(self.snapshot().items()):
+            print("  " + host + " - Requests: " + str(host_stats["requests"]) +
+                  " | New Connections: " + str(host_stats["connections"]) +
+                  " (" + str(round(host_stats["connect_seconds"], 2)) +
+                  "s of " + str(round(host_stats["request_seconds"], 2)) +
+                  "s) | Received: " +
+                  str(round(host_stats["wire_bytes"] / 1024, 1)) + " KiB")
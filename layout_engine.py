@@ -0,0 +1,194 @@
+"""Fits display text to the panel - Abbreviates, shrinks or scrolls each line so nothing runs off the edge or under an icon"""
+import re
+from collections import OrderedDict, namedtuple
+
+# A line ready to draw - marquee lines scroll through text a window at a time
+FittedLine = namedtuple("FittedLine",
+                        ["position", "font", "text", "max_width", "marquee"])
+
+# Put between the end and the start of a scrolling line
+MARQUEE_SEPARATOR = "   "
+
+
+class AbbreviationRules:
+    """Every {text: replacement} rule compiled into one regex, applied in a single pass
+
+    Each rule matches whole words only, the same as r"\\b" + text + r"\\b". Longer
+    rules win over shorter ones that start at the same place, and the pass is
+    repeated (up to max_passes) so a rule can tidy up after another - like
+    "  " -> " " after " Ave" is removed. Results are remembered per input."""
+
+    def __init__(self, replacements, max_passes=3, max_cached=2048):
+        self.replacements = dict(replacements)
+        self.max_passes = max_passes
+        self.max_cached = max_cached
+        self.normalized = {}
+        if self.replacements:
+            self.pattern = re.compile(r"\b(?:" + "|".join(
+                re.escape(text)
+                for text in sorted(self.replacements, key=len, reverse=True)) +
+                                      r")\b")
+        else:
+            self.pattern = None
+
+    def apply(self, text):
+        """text with every rule applied"""
+        if self.pattern is None:
+            return text
+        if text in self.normalized:
+            return self.normalized[text]
+        normalized_text = text
+        for _ in range(self.max_passes):
+            replaced_text = self.pattern.sub(
+                lambda rule_match: self.replacements[rule_match.group(0)],
+                normalized_text)
+            if replaced_text == normalized_text:
+                break
+            normalized_text = replaced_text
+        if len(self.normalized) >= self.max_cached:
+            self.normalized.clear()
+        self.normalized[text] = normalized_text
+        return normalized_text
+
+
+class LayoutEngine:
+    """Works out how each line of a page is drawn so it fits the panel
+
+    A line that is too wide is first abbreviated, then drawn in a smaller size of
+    the same font (no smaller than min_font_size), and if it still doesn't fit it
+    becomes a marquee that moves along each time the page is shown. Widths are
+    measured once per font and text, and the plan for an item is only worked
+    out again when one of its lines changes."""
+
+    def __init__(self,
+                 display_size,
+                 abbreviations=None,
+                 min_font_size=12,
+                 margin=2,
+                 max_plans=256,
+                 max_measured=4096):
+        self.display_size = display_size
+        self.abbreviations = abbreviations
+        self.min_font_size = min_font_size
+        self.margin = margin
+        self.max_plans = max_plans
+        self.max_measured = max_measured
+        self.widths = {}  # (font, text) -> pixels
+        self.smaller_fonts = {}  # font -> [same font, smaller sizes]
+        self.plans = OrderedDict()  # (slot, obstacles, lines) -> (FittedLine, ...)
+        self.marquee_windows = {}  # (FittedLine, offset) -> visible text
+        self.plan_hits = 0
+        self.plan_misses = 0
+
+    def text_width(self, font, text):
+        """How far text reaches to the right when drawn at x=0, in pixels"""
+        width_key = (font, text)
+        if width_key not in self.widths:
+            if len(self.widths) >= self.max_measured:
+                self.widths.clear()
+            self.widths[width_key] = font.getbbox(text)[2] if text else 0
+        return self.widths[width_key]
+
+    def available_width(self, position, font, obstacles=()):
+        """How wide a line starting at position can be before it hits the edge or an obstacle
+
+        obstacles are (left, top, right, bottom) areas text must stay clear of, like icons."""
+        ascent, descent = font.getmetrics()
+        line_top, line_bottom = position[1], position[1] + ascent + descent
+        right_edge = self.display_size[0]
+        for left, top, right, bottom in obstacles:
+            if (line_top < bottom and line_bottom > top and right > position[0]
+                    and left < right_edge):
+                right_edge = left
+        return right_edge - self.margin - position[0]
+
+    def font_sizes(self, font):
+        """font, then the same face a point smaller each step down to min_font_size"""
+        if font not in self.smaller_fonts:
+            fonts = [font]
+            # The built-in bitmap font only comes in one size
+            if hasattr(font, "font_variant") and hasattr(font, "size"):
+                fonts.extend(
+                    font.font_variant(size=font_size)
+                    for font_size in range(font.size - 1, self.min_font_size -
+                                           1, -1))
+            self.smaller_fonts[font] = fonts
+        return self.smaller_fonts[font]
+
+    def fit_line(self, position, font, text, obstacles=()):
+        """The FittedLine for text drawn at position in font"""
+        max_width = self.available_width(position, font, obstacles)
+        if self.text_width(font, text) <= max_width:
+            return FittedLine(position, font, text, max_width, False)
+        if self.abbreviations is not None:
+            text = self.abbreviations.apply(text)
+        for smaller_font in self.font_sizes(font):
+            smaller_width = self.available_width(position, smaller_font,
+                                                 obstacles)
+            if self.text_width(smaller_font, text) <= smaller_width:
+                return FittedLine(position, smaller_font, text, smaller_width,
+                                  False)
+        return FittedLine(position, font, text, max_width, True)
+
+    def plan_item(self, slot, lines, obstacles=()):
+        """(FittedLine, ...) for one item's lines, drawn at the slot's (position, font) pairs"""
+        plan_key = (slot, obstacles, tuple(lines))
+        if plan_key in self.plans:
+            self.plans.move_to_end(plan_key)
+            self.plan_hits += 1
+            return self.plans[plan_key]
+        self.plan_misses += 1
+        item_plan = tuple(
+            self.fit_line(position, font, text, obstacles)
+            for (position, font), text in zip(slot, lines))
+        self.plans[plan_key] = item_plan
+        if len(self.plans) > self.max_plans:
+            self.plans.popitem(last=False)
+        return item_plan
+
+    def visible_text(self, fitted_line, step):
+        """What to draw for a line - A marquee shows the window step characters along"""
+        if not fitted_line.marquee:
+            return fitted_line.text
+        loop_text = fitted_line.text + MARQUEE_SEPARATOR
+        offset = step % len(loop_text)
+        window_key = (fitted_line, offset)
+        if window_key not in self.marquee_windows:
+            if len(self.marquee_windows) >= self.max_measured:
+                self.marquee_windows.clear()
+            scrolled_text = (loop_text[offset:] + loop_text[:offset]).lstrip()
+            window_length = len(scrolled_text)
+            while window_length > 1 and self.text_width(
+                    fitted_line.font, scrolled_text[:window_length]
+            ) > fitted_line.max_width:
+                window_length -= 1
+            self.marquee_windows[window_key] = scrolled_text[:window_length]
+        return self.marquee_windows[window_key]
+
+    def wrap(self, text, font, widths):
+        """Splits text into lines on spaces, line n fitting in widths[n % len(widths)] pixels
+
+        A single word wider than its line is broken where it stops fitting."""
+        lines = []
+        current_line = ""
+        for word in text.split():
+            max_width = widths[len(lines) % len(widths)]
+            candidate = word if not current_line else current_line + " " + word
+            if self.text_width(font, candidate) <= max_width:
+                current_line = candidate
+                continue
+            if current_line:
+                lines.append(current_line)
+                max_width = widths[len(lines) % len(widths)]
+            while self.text_width(font, word) > max_width and len(word) > 1:
+                split_at = len(word) - 1
+                while split_at > 1 and self.text_width(
+                        font, word[:split_at]) > max_width:
+                    split_at -= 1
+                lines.append(word[:split_at])
+                word = word[split_at:]
+                max_width = widths[len(lines) % len(widths)]
+            current_line = word
+        if current_line:
+            lines.append(current_line)
+        return lines
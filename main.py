@@ -1,37 +1,30 @@
 """ctapi by Brandon McFadden - Github: https://github.com/brandonmcfadd/ctapi"""
 import math
 import os
-import json
-import textwrap
 import time  # Used to Get Current Time
-import xml.etree.ElementTree as ET  # Used to Parse API Response
 import re
+import threading  # Used to Fetch While the Display Pages
+from concurrent.futures import ThreadPoolExecutor, wait  # Used for Concurrent API Calls
 # Used for converting Prediction from Current Time
-from datetime import datetime, timedelta
-from geopy import distance
+from datetime import datetime
 from dotenv import load_dotenv  # Used to Load Env Var
-import requests  # Used for API Calls
-from waveshare_epd import epd2in13_V3
 from PIL import Image, ImageDraw, ImageFont
-
-epd = epd2in13_V3.EPD()
-epd.init()
-epd.Clear(0xFF)
-
-bold_font = ImageFont.truetype(
-    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 18)
-standard_font = ImageFont.truetype(
-    "/usr/share/fonts/truetype/dejavu/DejaVuSans-New.ttf", 16)
-standard_font_small = ImageFont.truetype(
-    "/usr/share/fonts/truetype/dejavu/DejaVuSans-New.ttf", 16)
-tweet_font = ImageFont.truetype(
-    "/usr/share/fonts/truetype/dejavu/DejaVuSerifCondensed-Bold.ttf", 17)
-icon_font = ImageFont.truetype(
-    "/usr/share/fonts/truetype/ctapi/Ctapi-Regular.ttf", 17)
-icon_bus = Image.open("/home/pi/ctapi/icons/bus_live.png")
-icon_train = Image.open("/home/pi/ctapi/icons/train_live.png")
-icon_bicycle = Image.open("/home/pi/ctapi/icons/bicycle.png")
-corner_image_size = (25, 25)
+from alert_feeds import ALERT_FEEDS, alert_from_dict, create_alert_feed  # Used to Get the Latest Service Alert
+from arrivals_server import ArrivalsServer  # Used to Share One Fetch Loop Between Displays
+from arrivals_store import ArrivalsStore, item_from_dict  # Used to Keep Track of Each Stop
+from circuit_breaker import CircuitBreaker  # Used to Back Off Failing APIs
+from cta_responses import TrainEta, decode_bus_predictions, decode_train_etas  # Used to Parse API Response
+from display_backends import create_display_backend  # Used to Pick the Display (or a Headless Sink)
+from display_pipeline import FramePipeline  # Used to Skip Unchanged Frames
+from metrics import DATA_AGE_BUCKETS, MetricsRegistry, MetricsServer  # Used to Monitor Each Board
+from polling_policy import PollingPolicy  # Used to Stay Within Each API Key's Daily Limit
+from render_cache import RenderCache  # Used to Avoid Re-Rendering Icons and Text
+from http_transport import HttpTransport  # Used to Keep Connections Open Between Calls
+from layout_engine import AbbreviationRules, LayoutEngine  # Used to Fit Each Line on the Display
+from gbfs import GbfsFeedCache  # Used to Avoid Re-Downloading Unchanged Divvy Feeds
+from snapshots import DataAgeTracker, SnapshotPublisher  # Used to Hand Fresh Data to the Display
+from scheduler import RefreshScheduler, SettingsWatcher  # Used to Refresh Each Source on its Own Interval
+from warm_state import load_warm_state, save_warm_state  # Used to Pick Up Where a Restart Left Off
 
 # Load .env variables
 load_dotenv()
@@ -43,223 +36,438 @@ twitter_api_key = os.getenv('TWITTER_API_KEY')
 home_latitude = os.getenv('HOME_LATITUDE')
 home_longitude = os.getenv('HOME_LONGITUDE')
 
-# Setting Up Variable for Storing Station Information - Will keep stations long turn
-arrival_information = json.loads('{"trains":{},"buses":{},"bicycles":{}}')
-REFRESH_DISPLAY = None
+# Where ctapi and its assets live - Override in .env to run somewhere other than the Pi
+ctapi_directory = os.getenv('CTAPI_DIRECTORY', '/home/pi/ctapi')
+fonts_directory = os.getenv('FONTS_DIRECTORY', '/usr/share/fonts/truetype')
+settings_file_path = os.path.join(ctapi_directory, 'settings.json')
+# waveshare for the e-Paper HAT, or png/pbm/memory to run headless
+display_backend_name = os.getenv('DISPLAY_BACKEND', 'waveshare')
+display_output_directory = os.getenv('DISPLAY_OUTPUT_DIRECTORY',
+                                     os.path.join(ctapi_directory, 'frames'))
+page_hold_seconds = float(os.getenv('DISPLAY_PAGE_HOLD_SECONDS', '4'))
+# standalone fetches and displays, server only fetches (and serves displays), client only displays
+ctapi_mode = os.getenv('CTAPI_MODE', 'standalone')
+arrivals_server_url = os.getenv('ARRIVALS_SERVER_URL', 'http://localhost:8750')
+arrivals_server_port = int(os.getenv('ARRIVALS_SERVER_PORT', '8750'))
+
+# Prometheus text on /metrics and JSON on /metrics.json - Off unless METRICS_PORT is set
+metrics_port = os.getenv('METRICS_PORT', '')
+# One JSON line per event, rotated at 1 MiB with 5 old files kept
+log_file_path = os.getenv('CTAPI_LOG_FILE',
+                          os.path.join(ctapi_directory, 'logs', 'ctapi.log'))
+metrics = MetricsRegistry()
+# Every prediction and Divvy count is kept here for headway/delay analysis - Set to '' to turn it off
+history_database_path = os.getenv(
+    'HISTORY_DATABASE',
+    os.path.join(ctapi_directory, 'history', 'predictions.db'))
+prediction_history = None
+# What was on the board, saved every WARM_STATE_SAVE_SECONDS and put back on boot - Set to '' to turn it off
+warm_state_file_path = os.getenv(
+    'WARM_STATE_FILE', os.path.join(ctapi_directory, 'cache', 'warm_state.json'))
+WARM_STATE_SAVE_SECONDS = 60
+warm_state_saved_at = None
+# Timetable shown when Train Tracker can't be reached - Built by gtfs_index.py build, set to '' to turn it off
+gtfs_index_path = os.getenv('GTFS_INDEX',
+                            os.path.join(ctapi_directory, 'cache', 'gtfs.idx'))
+gtfs_index = None
+
+# A full refresh is forced after this many partial refreshes to clear ghosting
+FULL_REFRESH_EVERY = 10
+# Set up by start_display() so nothing touches the hardware at import
+display_backend = None
+frame_pipeline = None
+
+
+def load_font(font_path, font_size):
+    """Loads a font from fonts_directory, falling back to the copies shipped with ctapi"""
+    for candidate_path in (os.path.join(fonts_directory, font_path),
+                           os.path.join(ctapi_directory, "fonts",
+                                        os.path.basename(font_path)),
+                           os.path.join(ctapi_directory, "trainpi",
+                                        os.path.basename(font_path))):
+        if os.path.exists(candidate_path):
+            return ImageFont.truetype(candidate_path, font_size)
+    print("Font " + font_path + " not found - Using the default font")
+    return ImageFont.load_default()
+
+
+bold_font = load_font("dejavu/DejaVuSans-Bold.ttf", 18)
+standard_font = load_font("dejavu/DejaVuSans-New.ttf", 16)
+standard_font_small = load_font("dejavu/DejaVuSans-New.ttf", 16)
+tweet_font = load_font("dejavu/DejaVuSerifCondensed-Bold.ttf", 17)
+icon_font = load_font("ctapi/Ctapi-Regular.ttf", 17)
+icon_bus = os.path.join(ctapi_directory, "icons/bus_live.png")
+icon_train = os.path.join(ctapi_directory, "icons/train_live.png")
+icon_bicycle = os.path.join(ctapi_directory, "icons/bicycle.png")
+icon_twitter = os.path.join(ctapi_directory, "icons/twitter.png")
+corner_image_size = (25, 25)
+# Pre-scaled icons, static page templates and rendered text are reused between pages
+render_cache = RenderCache(max_text_bitmaps=256)
+# Lines too wide for the display are abbreviated with these first, then shrunk, then scrolled
+DISPLAY_ABBREVIATIONS = {
+    "Avenue": "Ave",
+    "Street": "St",
+    "Road": "Rd",
+    "Boulevard": "Blvd",
+    "Parkway": "Pkwy",
+    "Center": "Ctr",
+    "Station": "Sta",
+    "Square": "Sq",
+    "North": "N",
+    "South": "S",
+    "East": "E",
+    "West": "W",
+    "Line to": "to",
+    "Distance": "Dist"
+}
+# Set up with the display, as the page size comes from the display backend
+layout_engine = None
+# How many characters a scrolling line moves along each display pass
+MARQUEE_STEP_CHARACTERS = 8
+marquee_step = 0
+# Street names dropped from bus destinations
+BUS_DESTINATION_RULES = AbbreviationRules({
+    " St": "",
+    " Rd": "",
+    " Ave": "",
+    "Town Center": "Twn Ctr"
+})
+# Built from divvy-tracker.street-names-to-remove whenever settings are applied
+divvy_name_rules = None
+
+# Setting Up Variable for Storing Station Information - Entries expire if not refreshed within the TTL
+ARRIVALS_TTL_SECONDS = 3600
+arrivals_store = ArrivalsStore(ttl_seconds=ARRIVALS_TTL_SECONDS)
+
+# Concurrent Fetch Stage - Every API call is fired at once, each source gets its own timeout (seconds)
+FETCH_TIMEOUTS = {"train": 5, "bus": 5, "divvy": 10, "twitter": 10}
+fetch_executor = ThreadPoolExecutor(max_workers=8)
+# Calls still running after fetch_sources stopped waiting on them - Never started twice at once
+running_fetches = {}
+# Every upstream shares one keep-alive session - Enough pooled connections per host for every fetch thread
+http_transport = HttpTransport(connect_timeout=3.05, pool_maxsize=8)
+# Failing APIs are retried with exponential backoff, and paused entirely after repeated failures
+api_circuit_breaker = CircuitBreaker(failure_threshold=5,
+                                     base_delay=5,
+                                     max_delay=600,
+                                     open_seconds=300)
+API_ENDPOINTS = {
+    "train": "Train Tracker",
+    "bus": "Bus Tracker",
+    "divvy-status": "Divvy",
+    "divvy-information": "Divvy",
+    "twitter": "Twitter"
+}
+# Arrivals and bike counts are marked with ~ once their source is this late refreshing them
+# (still shown, counted down locally) - Adaptive polling can leave a healthy stop for 10 minutes
+STALE_GRACE_SECONDS = 60
+
+# Bus Tracker getpredictions accepts up to 10 stop ids and 10 routes per call
+BUS_BATCH_MAX_STOPS = 10
+BUS_BATCH_MAX_ROUTES = 10
+# Divvy GBFS feeds are cached between cycles - Station Information is also kept on disk
+DIVVY_STATION_INFORMATION_CACHE_FILE = os.path.join(
+    ctapi_directory, "cache/divvy_station_information.json")
+divvy_feed_caches = {}
+divvy_feeds = {}
+DIVVY_PROCESSED_STATION_IDS = None
+# Every Divvy station's location - Rebuilt only when the feed's set of stations changes
+divvy_station_index = None
+LATEST_CTA_TWEET = None
+# Replaced by tweet-tracker.enabled once settings are applied - Lets a restored alert show before then
+enable_twitter_lookup = "True"
+# Where alerts come from (tweet-tracker.feed) - Kept between cycles so only new tweets are requested
+alert_feed = None
+ALERT_FEED_SETTINGS = None
+# The alert pages are wrapped and rendered once per alert, then reused every display pass
+alert_pages_cache = {"alert": None, "pages": []}
+TWEET_CLEANUP_PATTERN = re.compile(
+    r'http\S+|( |(?<![a-zA-Z]))[M][o][r][e][:]( |(?![a-zA-Z]))')
+
+# The fetch thread publishes snapshots, the display pages through the newest one
+snapshot_publisher = SnapshotPublisher()
+data_age_tracker = DataAgeTracker()
+
+# Default refresh intervals (seconds) - Each can be overridden with refresh-seconds in settings.json
+DEFAULT_REFRESH_SECONDS = {
+    "train": 60,
+    "bus": 60,
+    "divvy-status": 60,
+    "divvy-information": 3600,
+    "twitter": 300
+}
+# Each refresh is pushed back by up to this fraction of its interval so sources don't line up
+REFRESH_JITTER = 0.1
+# How long after a display pass finishes before the pages are shown again
+DISPLAY_REFRESH_SECONDS = 2
+# Longest the loop sleeps before checking settings.json for changes
+SETTINGS_CHECK_SECONDS = 5
+# How long the arrivals server holds a client's request open waiting for a new snapshot
+ARRIVALS_LONG_POLL_SECONDS = 25
+refresh_scheduler = RefreshScheduler()
+
+# Train and Bus Tracker poll faster when the next arrival is close and slower when it isn't
+ADAPTIVE_SOURCE_TYPES = ("train", "bus")
+# Daily request limits per API key - Each can be overridden with daily-request-budget in settings.json
+DEFAULT_DAILY_REQUEST_BUDGETS = {"train": 100000, "bus": 10000}
+polling_policy = PollingPolicy(min_interval=20,
+                               max_interval=600,
+                               lead_fraction=0.25)
+
+# Only this many ETA's are ever shown per item on the display
+MAX_ETAS_SHOWN = 3
 
 
 def train_api_call_to_cta(stop_id):
     """Gotta talk to the CTA and get Train Times"""
     print("Making CTA Train API Call...")
-    api_response = requests.get(
-        train_tracker_url.format(train_api_key, stop_id))
-    train_arrival_times(parse_api_response(api_response))
+    api_response = http_transport.get(train_tracker_url.format(
+        train_api_key, stop_id),
+                                      timeout=FETCH_TIMEOUTS["train"])
+    api_response.raise_for_status()
     return api_response
 
 
-def bus_api_call_to_cta(stop_code, route_code):
-    """Gotta talk to the CTA and get Bus Times"""
+def bus_api_call_to_cta(stop_codes, route_codes, prediction_limit=None):
+    """Gotta talk to the CTA and get Bus Times - Accepts comma separated stops/routes"""
     print("Making CTA Bus API Call...")
-    api_response = requests.get(
-        bus_tracker_url.format(bus_api_key, stop_code, route_code))
-    bus_eta_times(parse_api_response(api_response))
+    bus_url = bus_tracker_url.format(bus_api_key, stop_codes, route_codes)
+    if prediction_limit is not None:
+        bus_url += "&top=" + str(prediction_limit)
+    api_response = http_transport.get(bus_url, timeout=FETCH_TIMEOUTS["bus"])
+    api_response.raise_for_status()
     return api_response
 
 
+def plan_bus_api_calls(stop_ids, route_ids):
+    """Groups the configured (stop, route) pairs into as few getpredictions calls as possible"""
+    # Each call replaces the arrivals of every stop in it, so all of a stop's pairs go in one call
+    stop_routes = {}
+    for stop_id, route_id in zip(stop_ids, route_ids):
+        if route_id not in stop_routes.setdefault(stop_id, []):
+            stop_routes[stop_id].append(route_id)
+    planned_calls = []
+    for stop_id, routes_at_stop in stop_routes.items():
+        for planned_call in planned_calls:
+            if (len(planned_call["stops"]) < BUS_BATCH_MAX_STOPS
+                    and len(set(planned_call["routes"] + routes_at_stop)) <=
+                    BUS_BATCH_MAX_ROUTES):
+                break
+        else:
+            planned_call = {"stops": [], "routes": [], "pairs": []}
+            planned_calls.append(planned_call)
+        planned_call["stops"].append(stop_id)
+        for route_id in routes_at_stop:
+            if route_id not in planned_call["routes"]:
+                planned_call["routes"].append(route_id)
+            planned_call["pairs"].append((stop_id, route_id))
+    for planned_call in planned_calls:
+        # The response covers every stop x route in the call, and top is applied before
+        # unconfigured pairs are dropped - Only cap it when nothing unconfigured comes back
+        planned_call["top"] = None
+        if len(planned_call["stops"]) * len(planned_call["routes"]) == len(
+                set(planned_call["pairs"])):
+            planned_call["top"] = MAX_ETAS_SHOWN * len(planned_call["pairs"])
+    return planned_calls
+
+
+def get_divvy_feed_cache(feed_url, cache_file=None):
+    """Returns the cache for a Divvy feed, creating it the first time the URL is seen"""
+    if feed_url not in divvy_feed_caches:
+        divvy_feed_caches[feed_url] = GbfsFeedCache(
+            feed_url,
+            cache_file=cache_file,
+            timeout=FETCH_TIMEOUTS["divvy"],
+            transport=http_transport)
+    return divvy_feed_caches[feed_url]
+
+
 def divvy_api_call_station_information():
-    """Gotta talk to the Divvy and get Station Status"""
+    """Gotta talk to the Divvy and get Station Information - Returns (feed, changed)"""
     print("Making Divvy Station Information API Call...")
-    api_response = requests.get(divvy_station_information_url)
-    station_json = json.loads(api_response.content)
-    return station_json
+    return get_divvy_feed_cache(
+        divvy_station_information_url,
+        DIVVY_STATION_INFORMATION_CACHE_FILE).fetch(divvy_station_ids)
 
 
 def divvy_api_call_station_status():
-    """Gotta talk to the Divvy and get Station Status"""
+    """Gotta talk to the Divvy and get Station Status - Returns (feed, changed)"""
     print("Making Divvy Station Stats API Call...")
-    api_response = requests.get(divvy_station_status_url)
-    station_json = json.loads(api_response.content)
-    return station_json
+    return get_divvy_feed_cache(divvy_station_status_url).fetch(
+        divvy_station_ids)
 
 
 def get_latest_cta_tweet():
-    """Get the latest problems accoring to CTA Twitter"""
+    """Get the latest problems accoring to CTA Twitter (or the configured alert feed) - Returns (alert, changed)"""
     print("Making Twitter API Call...")
-    headers = {"Authorization": twitter_api_key}
-    cta_user_id = "342782636"
-    try:
-        api_response = requests.get(twitter_tweets_url.format(cta_user_id),
-                                    headers=headers)
-        tweets_json = json.loads(api_response.content)
-    except:  # pylint: disable=bare-except
-        print("Error in API Call to Twitter")
-    tweet_counter = 0
-    found_tweet = False
-    # All status Tweets start with an Open Bracket - Hoping to filter out some of the other garbage
-    while found_tweet is False:
-        found_tweet = str(
-            tweets_json["data"][tweet_counter]["text"]).startswith('[')
-        latest_tweet = tweets_json["data"][tweet_counter]["text"]
-        tweet_counter += 1
-    return latest_tweet
-
-
-def parse_api_response(api_response_input):
-    """Turns XML Response into a useable format"""
-    root = ET.fromstring(api_response_input.content)
-    return root
-
-
-def minutes_between(date_1, date_2):
-    """Takes the difference between two times and returns the minutes"""
-    date_1 = datetime.strptime(date_1, "%Y%m%d %H:%M:%S")
-    date_2 = datetime.strptime(date_2, "%Y%m%d %H:%M:%S")
-    difference = date_2 - date_1
-    difference_in_minutes = int(difference / timedelta(minutes=1))
+    return alert_feed.fetch()
+
+
+def choose_alert_feed():
+    """Sets up the alert feed named in settings.json - Only replaced when its settings change"""
+    global alert_feed, ALERT_FEED_SETTINGS  # pylint: disable=global-statement
+    feed_name = settings["tweet-tracker"].get("feed", "twitter")
+    feed_settings = (feed_name, twitter_tweets_url,
+                     settings["tweet-tracker"].get("cta-alerts-api-url"))
+    if feed_settings != ALERT_FEED_SETTINGS:
+        alert_feed = create_alert_feed(feed_name,
+                                       settings["tweet-tracker"],
+                                       twitter_api_key,
+                                       FETCH_TIMEOUTS["twitter"],
+                                       transport=http_transport)
+        ALERT_FEED_SETTINGS = feed_settings
+
+
+def minutes_between(epoch_1, epoch_2):
+    """Takes the difference between two epoch times and returns the minutes"""
+    difference_in_minutes = int((epoch_2 - epoch_1) / 60)
     return difference_in_minutes
 
 
-def add_train_station_to_json(station_name):
-    """Function is called if a new station is identified per API Call"""
-    station_information = {}
-    arrival_information["trains"][station_name] = station_information
-
+def shorten_bus_destination(destination_name):
+    """Shortens street names in a bus destination"""
+    return BUS_DESTINATION_RULES.apply(destination_name)
 
-def add_train_stop_to_json(eta, stop_id):
-    """Function is called if a new train stop is identified per API Call"""
-    stop_information = {}
-    station_name = eta.find('staNm').text
 
-    stop_information["full_name"] = eta.find(
-        'rt').text + " Line to " + eta.find('destNm').text
-    stop_information["destination_name"] = eta.find('destNm').text
-    stop_information["route"] = eta.find('rt').text
-    stop_information["stop-id"] = eta.find('stpId').text
-    stop_information["estimated_times"] = []
+def train_arrival_times(stop_id, train_etas):
+    """Replaces the stored Train ETA's for a stop with a fresh response"""
+    arrivals_store.replace_train_arrivals(stop_id, train_etas)
+    if prediction_history is not None:
+        prediction_history.record_train_etas(stop_id, train_etas)
 
-    arrival_information["trains"][station_name][stop_id] = stop_information
 
-
-def add_bus_stop_to_json(prd, stop_id):
-    """Function is called if a new bus stop is identified per API Call"""
-    bus_to_replace = {
-        " St": '',
-        " Rd": "",
-        " Ave": "",
-        "Town Center": "Twn Ctr"
-    }
-    stop_information = {}
-    for key, value in bus_to_replace.items():
-        destination_name = re.sub(r"\b" + key + r"\b", value,
-                                  prd.find('des').text)
-    stop_information["full_name"] = prd.find(
-        'rt').text + " to " + destination_name
-    stop_information["destination_name"] = destination_name
-    stop_information["route"] = prd.find('rt').text
-    stop_information["stop_name"] = prd.find('stpnm').text
-    stop_information["estimated_times"] = []
-
-    arrival_information["buses"][stop_id] = stop_information
-
-
-def train_arrival_times(train_api_response):
-    """Takes each Train ETA (if exists) and appends to list"""
-    for eta in train_api_response.iter('eta'):
-        train_stop_id = eta.find('destNm').text
-        train_station_name = eta.find('staNm').text
-
-        if train_station_name not in arrival_information["trains"]:
-            add_train_station_to_json(train_station_name)
-
-        if train_stop_id in arrival_information["trains"][train_station_name]:
-            add_train_eta_to_array(eta, train_station_name, train_stop_id)
-        else:
-            add_train_stop_to_json(eta, train_stop_id)
-            add_train_eta_to_array(eta, train_station_name, train_stop_id)
-
-
-def add_train_eta_to_array(eta, station_name, stop_id):
-    """Parses API Result from Train Tracker API and adds ETA's to a list"""
-    if eta.find('isSch').text == "0":
-        if eta.find('isApp').text == "1":
-            arrival_information["trains"][station_name][stop_id][
-                "estimated_times"].append("Due $")
-        else:
-            prediction = eta.find('prdt').text
-            arrival = eta.find('arrT').text
-            estimated_time = str(minutes_between(prediction, arrival))
-            (arrival_information["trains"][station_name][stop_id]
-             ["estimated_times"].append(estimated_time + "min $"))
-    else:
-        if eta.find('isApp').text == "1":
-            arrival_information["trains"][station_name][stop_id][
-                "estimated_times"].append("Due %")
-        else:
-            prediction = eta.find('prdt').text
-            arrival = eta.find('arrT').text
-            estimated_time = str(minutes_between(prediction, arrival))
-            (arrival_information["trains"][station_name][stop_id]
-             ["estimated_times"].append(estimated_time + "min %"))
-
-
-def bus_eta_times(bus_api_response):
-    """Takes each Bus ETA (if exists) and appends to list"""
-    if bus_api_response.find('error') is None:
-        for prd in bus_api_response.iter('prd'):
-            stop_id = prd.find('stpid').text
-            if stop_id in arrival_information["buses"]:
-                add_bus_eta_to_array(prd, stop_id)
-            else:
-                add_bus_stop_to_json(prd, stop_id)
-                add_bus_eta_to_array(prd, stop_id)
-
-
-def add_bus_eta_to_array(prd, stop_id):
-    """Parses API Result from Bus Tracker API and adds ETA's to a list"""
-    if prd.find('prdctdn').text == "DUE":
-        arrival_information["buses"][stop_id]["estimated_times"].append(
-            "Due $")
-    elif prd.find('prdctdn').text == "DLY":
-        arrival_information["buses"][stop_id]["estimated_times"].append(
-            "Dlyed %")
-    else:
-        (arrival_information["buses"][stop_id]["estimated_times"].append(
-            prd.find('prdctdn').text + "min $"))
+def open_gtfs_index():
+    """The GTFS timetable, opened the first time it's needed - None if it hasn't been built"""
+    global gtfs_index, gtfs_index_path  # pylint: disable=global-statement
+    if gtfs_index is None and gtfs_index_path and os.path.exists(
+            gtfs_index_path):
+        from gtfs_index import GtfsIndex  # pylint: disable=import-outside-toplevel
+        try:
+            gtfs_index = GtfsIndex(gtfs_index_path)
+        except (OSError, ValueError) as error:
+            print("Unable to open the GTFS index " + gtfs_index_path + ": " +
+                  str(error))
+            gtfs_index_path = ''
+    return gtfs_index
+
+
+def scheduled_train_arrival_times(train_sources):
+    """Shows the timetable for train stops Train Tracker couldn't refresh, once their arrivals are stale
+
+    train_sources is [(source_name, stop_id)]. Scheduled departures are marked %
+    like Train Tracker's own scheduled arrivals, and aren't recorded to the
+    prediction history. They're shown until the retry is overdue."""
+    if not train_sources or open_gtfs_index() is None:
+        return
+    now = datetime.now()
+    for source_name, stop_id in train_sources:
+        if not arrivals_store.train_stop_is_stale(stop_id):
+            continue
+        stop = gtfs_index.stop(stop_id)
+        if stop is None:
+            continue
+        # A platform can serve more than one destination
+        departures = gtfs_index.scheduled_departures(stop_id,
+                                                     after=now,
+                                                     count=MAX_ETAS_SHOWN * 2)
+        arrivals_store.replace_train_arrivals(stop_id, [
+            TrainEta(stop.station_name, stop_id, departure.route_id,
+                     departure.headsign, now, departure.departure_time,
+                     False, True, False) for departure in departures
+        ])
+        arrivals_store.expect_refresh(
+            "train", [stop_id],
+            refresh_scheduler.seconds_until_due(source_name) +
+            STALE_GRACE_SECONDS)
+        print("Train Tracker unavailable - Showing the timetable for " +
+              stop.station_name + " (" + stop_id + ")")
+
+
+def bus_eta_times(stop_ids, bus_predictions, requested_pairs):
+    """Replaces the stored Bus ETA's for the requested stops with a fresh response"""
+    # A batched call returns every stop x route combination - Keep only configured pairs
+    configured_predictions = [
+        prd for prd in bus_predictions
+        if (prd.stop_id, prd.route) in requested_pairs
+    ]
+    if prediction_history is not None:
+        prediction_history.record_bus_predictions(stop_ids,
+                                                  configured_predictions)
+    arrivals_store.replace_bus_arrivals(stop_ids, [
+        prd._replace(
+            destination_name=shorten_bus_destination(prd.destination_name))
+        for prd in configured_predictions
+    ])
 
 
 def divvy_process_station_stats(station_stats, station_information):
     """Takes Station Information and Stats from API Call and gets needed information"""
-    divvy_to_replace = settings["divvy-tracker"]["street-names-to-remove"]
-    for station in station_information['data']['stations']:
-        station_id = station['station_id']
-        if station_id in divvy_station_ids:
-            found_station_information = {}
+    # Both feeds arrive already filtered down to the configured stations
+    for station_id, station in station_information['stations'].items():
+        station_distance_long = None
+        if divvy_station_index is not None:
+            station_distance_long = divvy_station_index.distance_from_home(
+                station_id)
+        if station_distance_long is None:
+            # geopy is slow to import and only needed until the station index is built
+            from geopy import distance  # pylint: disable=import-outside-toplevel
             station_distance_long = distance.distance(
                 (home_latitude, home_longitude),
                 (station['lat'], station['lon'])).miles
-            station_distance_short = str(round(station_distance_long,
-                                               2)) + "mi"
-            station_name = station['name']
-            station_type = station['station_type']
-            for key, value in divvy_to_replace.items():
-                station_name = re.sub(r"\b" + key + r"\b", value, station_name)
-            for key, value in divvy_to_replace.items():
-                station_type = re.sub(r"\b" + key + r"\b", value, station_type)
-            found_station_information["station_name"] = station_name
-            found_station_information["capacity"] = str(station['capacity'])
-            found_station_information["distance"] = "Type: " + station_type + " | Distance: " + station_distance_short
-            found_station_information["bike_numbers"] = []
-            arrival_information["bicycles"][
-                station['station_id']] = found_station_information
-
-    for station in station_stats['data']['stations']:
-        if station['station_id'] in divvy_station_ids:
-            arrival_information["bicycles"][
-                station['station_id']]["bike_numbers"].append(
-                    str(station['num_ebikes_available']) + " ebikes")
-            arrival_information["bicycles"][
-                station['station_id']]["bike_numbers"].append(
-                    str(station['num_bikes_available']) + " classic")
+        arrivals_store.update_bike_station(
+            station_id, divvy_name_rules.apply(station['name']),
+            divvy_name_rules.apply(station['station_type']),
+            station_distance_long)
+
+    for station_id, station in station_stats['stations'].items():
+        arrivals_store.update_bike_counts(station_id,
+                                          station['num_ebikes_available'],
+                                          station['num_bikes_available'])
+    if prediction_history is not None:
+        prediction_history.record_bike_counts(station_stats['stations'])
+
+
+def update_divvy_station_index(station_information_changed):
+    """Re-indexes every Divvy station when the Station Information feed's set of stations changes"""
+    global divvy_station_index  # pylint: disable=global-statement
+    if divvy_station_index is not None and not station_information_changed:
+        return
+    all_stations = get_divvy_feed_cache(
+        divvy_station_information_url,
+        DIVVY_STATION_INFORMATION_CACHE_FILE).read_all_stations(
+            ("lat", "lon"))
+    if not all_stations:
+        return
+    if divvy_station_index is not None and set(all_stations) == set(
+            divvy_station_index.station_ids):
+        return
+    # numpy comes in with the index, so it isn't imported until Divvy needs it
+    from station_index import StationIndex  # pylint: disable=import-outside-toplevel
+    divvy_station_index = StationIndex(
+        {
+            station_id: (station["lat"], station["lon"])
+            for station_id, station in all_stations.items()
+        }, float(home_latitude), float(home_longitude))
+    print("Indexed " + str(len(all_stations)) + " Divvy Stations")
+
+
+def choose_divvy_stations():
+    """Uses the nearest-stations closest Divvy stations to home if set - Returns True if they changed"""
+    global divvy_station_ids  # pylint: disable=global-statement,global-variable-undefined
+    nearest_count = settings["divvy-tracker"].get("nearest-stations", 0)
+    if not nearest_count:
+        chosen_station_ids = settings["divvy-tracker"]["station-ids"]
+    elif divvy_station_index is not None:
+        chosen_station_ids = [
+            station_id for station_id, _ in
+            divvy_station_index.nearest_to_home(nearest_count)
+        ]
+    else:
+        # The closest stations are picked once Station Information has been fetched
+        return False
+    stations_changed = chosen_station_ids != divvy_station_ids
+    divvy_station_ids = chosen_station_ids
+    return stations_changed
 
 
 def create_string_of_items(items):
@@ -270,266 +478,560 @@ def create_string_of_items(items):
         if string_count == 0:
             string = item
             string_count += 1
-        elif string_count > 0 and string_count < 3:
+        elif string_count > 0 and string_count < MAX_ETAS_SHOWN:
             string = string + ", " + item
             string_count += 1
     return string
 
 
-def rouge_station_cleanup(arrival_information_input):
-    """Used to cleanup structure of any stations that are no longer requested"""
-    for station in arrival_information_input['trains'].copy():
-        for train in arrival_information_input['trains'][station].copy():
-            if arrival_information['trains'][station][train][
-                    'stop-id'] not in train_station_stop_ids:
-                print(
-                    "No longer tracking Stop ID: " +
-                    arrival_information['trains'][station][train]['stop-id'] +
-                    " - Removing")
-                del arrival_information['trains'][station][train]
-    return arrival_information_input
-
-
-def information_output_to_display(arrival_information_input_unclean):
-    """Used to create structure for use when outputting data to e-ink epd"""
-    arrival_information_input = rouge_station_cleanup(
-        arrival_information_input_unclean)
-    display_information_output = []
-    for station in arrival_information_input['trains'].copy():
-        for train in arrival_information_input['trains'][station].copy():
-            if arrival_information['trains'][station][train][
-                    "estimated_times"] != []:
-                display_information_output.append({
-                    'line_1':
-                    station,
-                    'line_2':
-                    (arrival_information['trains'][station][train]['route'] +
-                     " Line to " + arrival_information['trains'][station]
-                     [train]['destination_name']),
-                    'line_3':
-                    create_string_of_items(
-                        arrival_information['trains'][station][train]
-                        ["estimated_times"]),
-                    'item_type':
-                    "train",
-                })
-            else:
-                display_information_output.append({
-                    'line_1':
-                    station,
-                    'line_2':
-                    (arrival_information['trains'][station][train]['route'] +
-                     " Line to " + arrival_information['trains'][station]
-                     [train]['destination_name']),
-                    'line_3':
-                    "No arrivals found :(",
-                    'item_type':
-                    "train",
-                })
-            if arrival_information['trains'][station][train][
-                    'destination_name'] in train_dest_do_not_persist and arrival_information[
-                        'trains'][station][train]["estimated_times"] == []:
-                print("No arrivals found - Deleting Non-Persistant Station: " +
-                      arrival_information['trains'][station][train]
-                      ['destination_name'])
-                del arrival_information['trains'][station][train]
-            else:
-                arrival_information['trains'][station][train][
-                    "estimated_times"] = []
-
-    for bus in arrival_information['buses']:
-        if arrival_information['buses'][bus]["estimated_times"] != []:
-            display_information_output.append({
-                'line_1':
-                arrival_information['buses'][bus]["stop_name"],
-                'line_2':
-                arrival_information['buses'][bus]["full_name"],
-                'line_3':
-                create_string_of_items(
-                    arrival_information['buses'][bus]["estimated_times"]),
-                'item_type':
-                "bus"
-            })
-        else:
-            display_information_output.append({
-                'line_1':
-                arrival_information['buses'][bus]["stop_name"],
-                'line_2':
-                arrival_information['buses'][bus]["full_name"],
-                'line_3':
-                "No arrivals found :(",
-                'item_type':
-                "bus"
-            })
-        arrival_information['buses'][bus]["estimated_times"] = []
-
-    for station in arrival_information["bicycles"]:
-        display_information_output.append({
+def format_arrival(arrival, item_type, seconds_since_update):
+    """Turns a stored arrival into what is shown - $ is a live prediction, % is scheduled/delayed
+
+    The countdown is extrapolated from the prediction by how long ago it was fetched,
+    so it keeps ticking down between API calls."""
+    if item_type == "bus" and arrival.is_delayed:
+        return "Dlyed %"
+    marker = "%" if arrival.is_scheduled else "$"
+    minutes_away = minutes_between(
+        arrival.predicted_epoch + seconds_since_update, arrival.arrival_epoch)
+    if (arrival.is_approaching
+            and seconds_since_update < 60) or minutes_away <= 0:
+        return "Due " + marker
+    return str(minutes_away) + "min " + marker
+
+
+def format_display_item(item):
+    """Builds the three display lines for a stored train stop, bus stop or Divvy station"""
+    if item.item_type == "bicycle":
+        bike_numbers = []
+        if item.ebikes_available is not None:
+            bike_numbers.append(str(item.ebikes_available) + " ebikes")
+            bike_numbers.append(str(item.classic_available) + " classic")
+        return {
             'line_1':
-            str(arrival_information["bicycles"][station]
-                ["station_name"]).replace("Ave", ""),
+            str(item.station_name).replace("Ave", ""),
             'line_2':
-            arrival_information["bicycles"][station]["distance"],
-            'line_3':
-            create_string_of_items(
-                arrival_information["bicycles"][station]["bike_numbers"]),
+            "Type: " + item.station_type + " | Distance: " +
+            str(round(item.distance_miles, 2)) + "mi",
+            'line_3': ("~" if time.time() > item.stale_at else "") +
+            create_string_of_items(bike_numbers),
             'item_type':
-            "bicycle"
-        })
-        arrival_information["bicycles"][station]["bike_numbers"] = []
-    return display_information_output
-
-
-def information_to_display(status):
-    """Used to create structure for use when outputting data to e-ink epd"""
-    loop_count = 0
-    while loop_count < len(status):
-        image = Image.new('1', (epd.height, epd.width),
-                          255)  # 255: clear the frame
-        draw = ImageDraw.Draw(image)
-
-        try:
-            image.paste(get_logo_for_display(status[loop_count]['item_type']),
-                        (225, 35))
+            item.item_type
+        }
+    seconds_since_update = time.time() - item.updated_at
+    if item.item_type == "train":
+        line_1 = item.station_name
+        line_2 = item.route + " Line to " + item.destination_name
+    else:
+        line_1 = item.stop_name
+        line_2 = item.route + " to " + item.destination_name
+    # Trains that have already left are dropped rather than shown as Due
+    estimated_times = [
+        format_arrival(arrival, item.item_type, seconds_since_update)
+        for arrival in item.arrivals
+        if arrival.arrival_epoch - arrival.predicted_epoch + 60 >
+        seconds_since_update
+    ][:MAX_ETAS_SHOWN]
+    line_3 = create_string_of_items(
+        estimated_times) if estimated_times else "No arrivals found :("
+    if time.time() > item.stale_at:
+        line_3 = "~" + line_3
+    return {
+        'line_1':
+        line_1,
+        'line_2':
+        line_2,
+        'line_3':
+        line_3,
+        'item_type':
+        item.item_type
+    }
 
-            # Store & Draw the location 1
-            item_1_line_1 = status[loop_count]['line_1']
-            draw.text((1, 1), item_1_line_1, font=bold_font, fill=0)
 
-            # Store & Draw the destination 1
-            item_1_line_2 = status[loop_count]['line_2']
-            draw.text((1, 20), item_1_line_2, font=standard_font, fill=0)
+def information_output_to_display():
+    """Drops anything stale or no longer configured and lists what should be displayed"""
+    arrivals_store.evict(train_station_stop_ids, bus_stop_stop_ids,
+                         divvy_station_ids, train_dest_do_not_persist)
+    return arrivals_store.display_items(train_station_stop_ids,
+                                        bus_stop_stop_ids, divvy_station_ids)
 
-            # Store & Draw the ETA 1
-            item_1_line_3 = status[loop_count]['line_3']
-            draw.text((1, 38), item_1_line_3, font=standard_font, fill=0)
 
-        except:  # pylint: disable=bare-except
-            item_1_line_1 = ""
-            item_1_line_2 = ""
-            item_1_line_3 = ""
-        loop_count += 1
+def build_arrivals_page_template():
+    """Blank arrivals page with the divider between the two items"""
+    image = Image.new('1', display_backend.size, 255)  # 255: clear the frame
+    draw = ImageDraw.Draw(image)
+    draw.line((0, 61, 250, 61), fill=0, width=3)
+    return image
 
-        draw.line((0, 61, 250, 61), fill=0, width=3)
 
-        try:
-            image.paste(get_logo_for_display(status[loop_count]['item_type']),
+def build_tweet_page_template(heading):
+    """Blank tweet page with the header and Twitter icon"""
+    twitter_image = Image.new('1', display_backend.size, 255)  # 255: clear the frame
+    render_cache.draw_text(twitter_image, (0, 0), heading, bold_font)
+    twitter_image.paste(render_cache.icon(icon_twitter, corner_image_size),
                         (225, 97))
-
-            # Store & Draw the location 1
-            item_2_line_1 = status[loop_count]['line_1']
-            draw.text((1, 65), item_2_line_1, font=bold_font, fill=0)
-
-            # Store & Draw the destination 1
-            item_2_line_2 = status[loop_count]['line_2']
-            draw.text((1, 84), item_2_line_2, font=standard_font, fill=0)
-
-            # Store & Draw the ETA 1
-            item_2_line_3 = status[loop_count]['line_3']
-            draw.text((1, 102), item_2_line_3, font=standard_font, fill=0)
-        except:  # pylint: disable=bare-except
-            item_2_line_1 = ""
-            item_2_line_2 = ""
-            item_2_line_3 = ""
-        loop_count += 1
-        print(item_1_line_1, "\n", item_1_line_2, "\n", item_1_line_3, "\n",
-              "------------------------", "\n", item_2_line_1, "\n",
-              item_2_line_2, "\n", item_2_line_3, "\n",
-              "------------------------")
-
-        # Send to Display
-        epd.display(epd.getbuffer(image))
-
-        # Wait a respectable amount of time so the display can refresh
-        print("Sleeping 4 Seconds")
-        time.sleep(4)
-
-
-def tweet_output_to_display():
-    """Used to output the latest CTA Tweet to the Display"""
-    tweet_text = re.sub(
-        r'http\S+|( |(?<![a-zA-Z]))[M][o][r][e][:]( |(?![a-zA-Z]))', '',
-        str(get_latest_cta_tweet()))
-    tweet_text_wrapped = textwrap.wrap(tweet_text, width=25)
-    tweet_length = len(tweet_text_wrapped)
-    total_tweet_pages = math.ceil(tweet_length / 4)
-    icon_twitter = Image.open("/home/pi/ctapi/icons/twitter.png")
-    printed_lines = 0
-    current_tweet_page = 1
-    while printed_lines != len(
-            tweet_text_wrapped) and enable_twitter_lookup == "True":
-        twitter_image = Image.new('1', (epd.height, epd.width),
-                                  255)  # 255: clear the frame
-        twitter_draw = ImageDraw.Draw(twitter_image)
-        # Store & Draw the header
-        tweet_line_1 = "Latest Tweet from @CTA"
-        twitter_draw.text((0, 0), tweet_line_1, font=bold_font, fill=0)
-
+    return twitter_image
+
+
+# Where each of the two items on an arrivals page goes - Logo, then lines 1-3
+ARRIVALS_PAGE_SLOTS = (((225, 35), (1, 1), (1, 20), (1, 38)),
+                       ((225, 97), (1, 65), (1, 84), (1, 102)))
+# Text is kept clear of the icons (left, top, right, bottom)
+ARRIVALS_PAGE_ICONS = tuple(
+    (logo_x, logo_y, logo_x + corner_image_size[0],
+     logo_y + corner_image_size[1])
+    for (logo_x, logo_y), *_ in ARRIVALS_PAGE_SLOTS)
+TWEET_PAGE_ICONS = ((225, 97, 225 + corner_image_size[0],
+                     97 + corner_image_size[1]), )
+TWEET_LINE_POSITIONS = ((0, 20), (0, 40), (0, 60), (0, 80))
+
+
+def layout_arrivals_page(page_items):
+    """Formats the lines for one page of up to two items and plans how each fits on the page"""
+    page_lines = []
+    for item, (_, line_1_position, line_2_position,
+               line_3_position) in zip(page_items, ARRIVALS_PAGE_SLOTS):
+        item_lines = format_display_item(item)
+        # Only worked out again when one of the item's lines has changed
+        item_lines['fitted'] = layout_engine.plan_item(
+            ((line_1_position, bold_font), (line_2_position, standard_font),
+             (line_3_position, standard_font)),
+            (item_lines['line_1'], item_lines['line_2'],
+             item_lines['line_3']), ARRIVALS_PAGE_ICONS)
+        page_lines.append(item_lines)
+    return page_lines
+
+
+def render_arrivals_page(page_lines):
+    """Draws one page of up to two planned items"""
+    image = render_cache.template("arrivals", build_arrivals_page_template)
+    for item_lines, (logo_position, *_) in zip(page_lines,
+                                               ARRIVALS_PAGE_SLOTS):
+        image.paste(get_logo_for_display(item_lines['item_type']),
+                    logo_position)
+        for fitted_line in item_lines['fitted']:
+            render_cache.draw_text(
+                image, fitted_line.position,
+                layout_engine.visible_text(fitted_line, marquee_step),
+                fitted_line.font)
+    return image
+
+
+def information_to_display():
+    """Pages through the arrivals, drawing every page from the newest snapshot"""
+    global marquee_step  # pylint: disable=global-statement
+    # Lines too long to fit scroll along a bit each pass
+    marquee_step += MARQUEE_STEP_CHARACTERS
+    loop_count = 0
+    while loop_count < len(snapshot_publisher.latest()["items"]):
+        # The fetch thread may have published fresher data since the last page
+        page_items = snapshot_publisher.latest()["items"][loop_count:loop_count
+                                                          + 2]
+        loop_count += 2
+        data_age = data_age_tracker.record(
+            [item.updated_at for item in page_items])
+        if data_age is not None:
+            metrics.observe("ctapi_data_age_seconds",
+                            data_age,
+                            buckets=DATA_AGE_BUCKETS)
+        # Lines are only formatted now, as the page is drawn
+        with metrics.time_stage("layout"):
+            page_lines = layout_arrivals_page(page_items)
+        with metrics.time_stage("render"):
+            image = render_arrivals_page(page_lines)
+
+        printed_lines = [
+            page_lines[item_number][line_name]
+            if item_number < len(page_lines) else ""
+            for item_number in range(2)
+            for line_name in ("line_1", "line_2", "line_3")
+        ]
+        print(printed_lines[0], "\n", printed_lines[1], "\n",
+              printed_lines[2], "\n", "------------------------", "\n",
+              printed_lines[3], "\n", printed_lines[4], "\n",
+              printed_lines[5], "\n", "------------------------")
+        if data_age is not None:
+            print("Data Age: " + str(round(data_age, 1)) + "s")
+
+        # Send to Display - Unchanged pages are skipped
+        show_frame(image)
+
+
+def build_alert_pages(latest_alert):
+    """Wraps, paginates and renders an alert - Returns [(page image, page lines)]"""
+    tweet_text = TWEET_CLEANUP_PATTERN.sub('', str(latest_alert.text))
+    # Each line is wrapped to the width it has - The last one stops short of the icon
+    tweet_text_wrapped = layout_engine.wrap(tweet_text, tweet_font, [
+        layout_engine.available_width(line_position, tweet_font,
+                                      TWEET_PAGE_ICONS)
+        for line_position in TWEET_LINE_POSITIONS
+    ])
+    total_tweet_pages = math.ceil(len(tweet_text_wrapped) / 4)
+    alert_pages = []
+    for page_number in range(total_tweet_pages):
+        # Header and icon come with the template
+        twitter_image = render_cache.template(
+            "tweet:" + latest_alert.heading,
+            lambda: build_tweet_page_template(latest_alert.heading))
+        page_lines = [latest_alert.heading]
         # Store & Draw Tweet
-        try:
-            tweet_line_2 = tweet_text_wrapped[printed_lines]
-            printed_lines += 1
-            twitter_draw.text((0, 20), tweet_line_2, font=tweet_font, fill=0)
-        except:  # pylint: disable=bare-except
-            tweet_line_2 = ""
-        try:
-            tweet_line_3 = tweet_text_wrapped[printed_lines]
-            printed_lines += 1
-            twitter_draw.text((0, 40), tweet_line_3, font=tweet_font, fill=0)
-        except:  # pylint: disable=bare-except
-            tweet_line_3 = ""
-        try:
-            tweet_line_4 = tweet_text_wrapped[printed_lines]
-            printed_lines += 1
-            twitter_draw.text((0, 60), tweet_line_4, font=tweet_font, fill=0)
-        except:  # pylint: disable=bare-except
-            tweet_line_4 = ""
-        try:
-            tweet_line_5 = tweet_text_wrapped[printed_lines]
-            printed_lines += 1
-            twitter_draw.text((0, 80), tweet_line_5, font=tweet_font, fill=0)
-        except:  # pylint: disable=bare-except
-            tweet_line_5 = ""
-        try:
-            tweet_line_6 = "Page " + str(current_tweet_page) + " / " + str(
-                total_tweet_pages)
-            twitter_draw.text((0, 100), tweet_line_6, font=tweet_font, fill=0)
-        except:  # pylint: disable=bare-except
-            tweet_line_6 = ""
-        icon_twitter = icon_twitter.resize(corner_image_size)
-        twitter_image.paste(icon_twitter, (225, 97))
-
-        print(tweet_line_1, "\n", tweet_line_2, "\n", tweet_line_3, "\n",
-              tweet_line_4, "\n", tweet_line_5, "\n", tweet_line_6)
-
-        current_tweet_page += 1
-
-        # Send to Display
-        epd.display(epd.getbuffer(twitter_image))
-
-        # Wait a respectable amount of time so the display can refresh
-        print("Sleeping 4 Seconds")
-        time.sleep(4)
+        for line_number, tweet_line in enumerate(
+                tweet_text_wrapped[page_number * 4:page_number * 4 + 4]):
+            render_cache.draw_text(twitter_image,
+                                   TWEET_LINE_POSITIONS[line_number],
+                                   tweet_line, tweet_font)
+            page_lines.append(tweet_line)
+        page_lines.extend([""] * (5 - len(page_lines)))
+        page_lines.append("Page " + str(page_number + 1) + " / " +
+                          str(total_tweet_pages))
+        render_cache.draw_text(twitter_image, (0, 100), page_lines[-1],
+                               tweet_font)
+        alert_pages.append((twitter_image, page_lines))
+    return alert_pages
+
+
+def tweet_output_to_display(latest_tweet):
+    """Used to output the latest CTA Tweet to the Display - Pages are only re-rendered for a new alert"""
+    if enable_twitter_lookup != "True":
+        return
+    if alert_pages_cache["alert"] != latest_tweet:
+        alert_pages_cache["pages"] = build_alert_pages(latest_tweet)
+        alert_pages_cache["alert"] = latest_tweet
+    for twitter_image, page_lines in alert_pages_cache["pages"]:
+        print(*page_lines, sep=" \n ")
+
+        # Send to Display - Unchanged pages are skipped
+        show_frame(twitter_image)
+
+
+def show_frame(image):
+    """Sends a page to the display and records what kind of refresh it took"""
+    frame_pipeline.show(image)
+    metrics.increment("ctapi_display_refreshes_total",
+                      refresh=frame_pipeline.last_refresh_type)
+    if frame_pipeline.last_refresh_type != "skipped":
+        # Only the panel update is timed, not the time the page is held up
+        metrics.observe("ctapi_stage_seconds",
+                        frame_pipeline.last_refresh_seconds,
+                        stage="display")
+        metrics.log_event("display_refresh",
+                          refresh=frame_pipeline.last_refresh_type,
+                          seconds=round(frame_pipeline.last_refresh_seconds,
+                                        4))
 
 
 def get_logo_for_display(icon_type):
     """Used to identify the correct icon to go with the line on display"""
     if icon_type == "train":
-        icon_resized = icon_train.resize(corner_image_size)
+        icon_resized = render_cache.icon(icon_train, corner_image_size)
     elif icon_type == "bus":
-        icon_resized = icon_bus.resize(corner_image_size)
+        icon_resized = render_cache.icon(icon_bus, corner_image_size)
     elif icon_type == "bicycle":
-        icon_resized = icon_bicycle.resize(corner_image_size)
+        icon_resized = render_cache.icon(icon_bicycle, corner_image_size)
     return icon_resized
 
 
-print("Welcome to TrainTracker, Python/RasPi Edition!")
-while True:  # Where the magic happens
-    # Settings
-    file = open(file='/home/pi/ctapi/settings.json',
-                mode='r',
-                encoding='utf-8')
-    settings = json.load(file)
+def timed_api_call(api_call, *args):
+    """Runs a single API call and returns the result with how long it took"""
+    call_start = time.monotonic()
+    result = api_call(*args)
+    return result, time.monotonic() - call_start
+
+
+def plan_fetch_jobs():
+    """Lists every enabled API call as (source name, source type, api call, args)"""
+    fetch_jobs = []
+    if train_station_stop_ids != "" and enable_train_tracker == "True":
+        for train_stop_id_to_check in train_station_stop_ids:
+            fetch_jobs.append(("Train " + train_stop_id_to_check, "train",
+                               train_api_call_to_cta,
+                               (train_stop_id_to_check, )))
+    if bus_stop_stop_ids != "" and enable_bus_tracker == "True":
+        for planned_call in plan_bus_api_calls(bus_stop_stop_ids,
+                                               bus_stop_route_ids):
+            fetch_jobs.append(
+                ("Bus " + ",".join(planned_call["stops"]), "bus",
+                 bus_api_call_to_cta,
+                 (",".join(planned_call["stops"]),
+                  ",".join(planned_call["routes"]), planned_call["top"])))
+    if divvy_station_ids != "" and enable_divvy_station_check == "True":
+        fetch_jobs.append(("Divvy Status", "divvy-status",
+                           divvy_api_call_station_status, ()))
+        fetch_jobs.append(("Divvy Information", "divvy-information",
+                           divvy_api_call_station_information, ()))
+    if enable_twitter_lookup == "True":
+        fetch_jobs.append(("Twitter", "twitter", get_latest_cta_tweet, ()))
+    return fetch_jobs
+
+
+def get_refresh_seconds(source_type):
+    """Refresh interval for a source type - From settings.json if set there"""
+    settings_section = {
+        "train": "train-tracker",
+        "bus": "bus-tracker",
+        "divvy-status": "divvy-tracker",
+        "divvy-information": "divvy-tracker",
+        "twitter": "tweet-tracker"
+    }[source_type]
+    settings_key = {
+        "divvy-status": "status-refresh-seconds",
+        "divvy-information": "information-refresh-seconds"
+    }.get(source_type, "refresh-seconds")
+    return settings[settings_section].get(settings_key,
+                                          DEFAULT_REFRESH_SECONDS[source_type])
+
+
+def schedule_sources():
+    """Registers every enabled source with the scheduler"""
+    source_intervals = {}
+    for source_name, source_type, _, _ in plan_fetch_jobs():
+        refresh_seconds = get_refresh_seconds(source_type)
+        source_intervals[source_name] = (refresh_seconds,
+                                         refresh_seconds * REFRESH_JITTER)
+    refresh_scheduler.set_sources(source_intervals)
+
+    adaptive_sources = {
+        source_name: API_ENDPOINTS[source_type]
+        for source_name, source_type, _, _ in plan_fetch_jobs()
+        if source_type in ADAPTIVE_SOURCE_TYPES
+    }
+    polling_policy.set_sources(adaptive_sources, {
+        source_name: source_intervals[source_name][0]
+        for source_name in adaptive_sources
+    })
+    for source_type, settings_section in (("train", "train-tracker"),
+                                          ("bus", "bus-tracker")):
+        polling_policy.set_budget(
+            API_ENDPOINTS[source_type], settings[settings_section].get(
+                "daily-request-budget",
+                DEFAULT_DAILY_REQUEST_BUDGETS[source_type]))
+
+
+def fetch_sources(source_names):
+    """Fires the named API calls at once and merges the results into the arrivals store"""
+    global DIVVY_PROCESSED_STATION_IDS, LATEST_CTA_TWEET  # pylint: disable=global-statement
+    fetch_jobs = []
+    unrefreshed_train_sources = []
+    for fetch_job in plan_fetch_jobs():
+        if fetch_job[0] not in source_names:
+            continue
+        endpoint = API_ENDPOINTS[fetch_job[1]]
+        if fetch_job[0] in running_fetches:
+            if not running_fetches[fetch_job[0]].done():
+                # A second call would share the first one's feed cache (and its .tmp file)
+                print(fetch_job[0] + " is still running - Trying again later")
+                refresh_scheduler.retry_in(fetch_job[0],
+                                           api_circuit_breaker.base_delay)
+                if fetch_job[1] == "train":
+                    unrefreshed_train_sources.append(
+                        (fetch_job[0], fetch_job[3][0]))
+                continue
+            del running_fetches[fetch_job[0]]
+        if api_circuit_breaker.allow(endpoint):
+            fetch_jobs.append(fetch_job)
+        else:
+            # Keep serving what we have until the endpoint can be probed again
+            refresh_scheduler.retry_in(
+                fetch_job[0],
+                api_circuit_breaker.seconds_until_allowed(endpoint))
+            if fetch_job[1] == "train":
+                unrefreshed_train_sources.append(
+                    (fetch_job[0], fetch_job[3][0]))
+    bus_requested_pairs = set(zip(bus_stop_stop_ids, bus_stop_route_ids))
+
+    futures = {}
+    with metrics.time_stage("fetch"):
+        for source_name, source_type, api_call, args in fetch_jobs:
+            futures[source_name] = fetch_executor.submit(
+                timed_api_call, api_call, *args)
+            if source_type in ADAPTIVE_SOURCE_TYPES:
+                polling_policy.record_request(API_ENDPOINTS[source_type])
+        if futures:
+            wait(futures.values(), timeout=max(FETCH_TIMEOUTS.values()) + 1)
+
+    # Results are merged in configured order so the display order stays stable
+    fetch_timings = {}
+    failed_sources = []
+    succeeded_endpoints = set()
+    divvy_counts_refreshed = False
+    for source_name, source_type, api_call, args in fetch_jobs:
+        future = futures[source_name]
+        endpoint = API_ENDPOINTS[source_type]
+        metrics.increment("ctapi_api_calls_total", endpoint=endpoint)
+        if not future.done():
+            print("Timed out waiting on " + source_name)
+            running_fetches[source_name] = future
+            record_api_failure(source_name, endpoint, "timeout")
+            fetch_timings[source_name] = None
+            failed_sources.append((source_name, source_type))
+            continue
+        try:
+            result, fetch_timings[source_name] = future.result()
+        except Exception as error:  # pylint: disable=broad-except
+            print("Error in API Call to " + source_name + ": " + str(error))
+            record_api_failure(source_name, endpoint, "error", error)
+            fetch_timings[source_name] = None
+            failed_sources.append((source_name, source_type))
+            continue
+        metrics.observe("ctapi_api_call_seconds",
+                        fetch_timings[source_name],
+                        endpoint=endpoint)
+        try:
+            if source_type == "train":
+                with metrics.time_stage("parse"):
+                    train_etas = decode_train_etas(result.content)
+                with metrics.time_stage("aggregate"):
+                    train_arrival_times(args[0], train_etas)
+            elif source_type == "bus":
+                with metrics.time_stage("parse"):
+                    bus_predictions = decode_bus_predictions(result.content)
+                with metrics.time_stage("aggregate"):
+                    bus_eta_times(args[0].split(","), bus_predictions,
+                                  bus_requested_pairs)
+            elif source_type in ("divvy-status", "divvy-information"):
+                divvy_feeds[source_type] = result
+                if source_type == "divvy-status":
+                    # Unchanged counts are still confirmed fresh
+                    arrivals_store.confirm_bike_counts()
+                else:
+                    update_divvy_station_index(result[1])
+                    if choose_divvy_stations():
+                        # Re-filter the saved Station Information and get Status for the new stations
+                        divvy_feeds[source_type] = (
+                            divvy_api_call_station_information()[0], True)
+                        divvy_feeds.pop("divvy-status", None)
+                        refresh_scheduler.retry_in("Divvy Status", 0)
+            elif source_type == "twitter":
+                # The feed keeps its last alert, so nothing new still returns it
+                LATEST_CTA_TWEET = result[0]
+        except Exception as error:  # pylint: disable=broad-except
+            print("Error parsing response from " + source_name + ": " +
+                  str(error))
+            record_api_failure(source_name, endpoint, "parse", error)
+            failed_sources.append((source_name, source_type))
+            continue
+        metrics.log_event("api_call",
+                          source=source_name,
+                          endpoint=endpoint,
+                          outcome="ok",
+                          seconds=round(fetch_timings[source_name], 4))
+        if source_type in ADAPTIVE_SOURCE_TYPES:
+            stop_ids = [args[0]] if source_type == "train" else args[0].split(",")
+            refresh_scheduler.mark_refreshed(
+                source_name,
+                interval=polling_policy.next_interval(
+                    source_name,
+                    arrivals_store.nearest_arrival_seconds(
+                        source_type, stop_ids)))
+            # Stale once the next poll is overdue, however long polling waits
+            arrivals_store.expect_refresh(
+                source_type, stop_ids,
+                refresh_scheduler.seconds_until_due(source_name) +
+                STALE_GRACE_SECONDS)
+        else:
+            refresh_scheduler.mark_refreshed(source_name)
+            if source_type == "divvy-status":
+                divvy_counts_refreshed = True
+        succeeded_endpoints.add(API_ENDPOINTS[source_type])
+
+    # One failure per endpoint per round, so many stops on one API don't trip the breaker at once
+    for endpoint in succeeded_endpoints:
+        api_circuit_breaker.record_success(endpoint)
+    retry_delays = {}
+    for source_name, source_type in failed_sources:
+        endpoint = API_ENDPOINTS[source_type]
+        if endpoint not in retry_delays:
+            if endpoint in succeeded_endpoints:
+                retry_delays[endpoint] = api_circuit_breaker.base_delay
+            else:
+                retry_delays[endpoint] = api_circuit_breaker.record_failure(
+                    endpoint)
+        refresh_scheduler.retry_in(source_name, retry_delays[endpoint])
+        if source_type == "train":
+            unrefreshed_train_sources.extend(
+                (source_name, args[0]) for job_name, _, _, args in fetch_jobs
+                if job_name == source_name)
+    scheduled_train_arrival_times(unrefreshed_train_sources)
+
+    if "divvy-status" in divvy_feeds and "divvy-information" in divvy_feeds:
+        station_stats, station_stats_changed = divvy_feeds["divvy-status"]
+        station_information, station_information_changed = divvy_feeds[
+            "divvy-information"]
+        # Only re-process when a feed actually changed or the configured stations did
+        if (station_stats_changed or station_information_changed
+                or DIVVY_PROCESSED_STATION_IDS != divvy_station_ids):
+            try:
+                with metrics.time_stage("aggregate"):
+                    divvy_process_station_stats(station_stats,
+                                                station_information)
+                DIVVY_PROCESSED_STATION_IDS = list(divvy_station_ids)
+                divvy_counts_refreshed = True
+            except Exception as error:  # pylint: disable=broad-except
+                print("Error processing Divvy stations: " + str(error))
+        # A change is only processed once
+        divvy_feeds["divvy-status"] = (station_stats, False)
+        divvy_feeds["divvy-information"] = (station_information, False)
+    if divvy_counts_refreshed and "Divvy Status" in refresh_scheduler.intervals:
+        arrivals_store.expect_refresh(
+            "bicycle", divvy_station_ids,
+            refresh_scheduler.seconds_until_due("Divvy Status") +
+            STALE_GRACE_SECONDS)
+    return fetch_timings
+
+
+def record_api_failure(source_name, endpoint, kind, error=None):
+    """Counts a failed API call - kind is timeout, error (the request failed) or parse"""
+    metrics.increment("ctapi_api_errors_total", endpoint=endpoint, kind=kind)
+    metrics.log_event("api_call",
+                      source=source_name,
+                      endpoint=endpoint,
+                      outcome=kind,
+                      error=None if error is None else repr(error))
+
+
+def print_fetch_report(fetch_timings, fetch_stage_time, cycle_time):
+    """Prints how long each API call took against the total cycle time"""
+    print("Fetch Stage: " + str(round(fetch_stage_time, 2)) +
+          "s | Total Cycle: " + str(round(cycle_time, 2)) + "s")
+    for source_name, fetch_time in fetch_timings.items():
+        if fetch_time is None:
+            print("  " + source_name + ": failed")
+        else:
+            print("  " + source_name + ": " + str(round(fetch_time, 2)) +
+                  "s (" + str(round(fetch_time / cycle_time * 100)) + "%)")
+
+
+def start_display(restored_frame=None):
+    """Sets up the configured display backend - Only the waveshare backend touches hardware
+
+    A frame restored from before a restart is still on the panel, so it isn't
+    cleared and a first page identical to it isn't redrawn."""
+    global display_backend, frame_pipeline, layout_engine  # pylint: disable=global-statement
+    display_backend = create_display_backend(display_backend_name,
+                                             display_output_directory)
+    layout_engine = LayoutEngine(
+        display_backend.size,
+        abbreviations=AbbreviationRules(DISPLAY_ABBREVIATIONS))
+    if (restored_frame is not None
+            and restored_frame.size != display_backend.size):
+        restored_frame = None
+    display_backend.start(clear=restored_frame is None)
+    frame_pipeline = FramePipeline(display_backend,
+                                   full_refresh_every=FULL_REFRESH_EVERY,
+                                   page_hold_seconds=page_hold_seconds)
+    if restored_frame is not None:
+        frame_pipeline.restore(restored_frame)
+
+
+def apply_settings(settings_input):
+    """Copies settings.json into the variables the rest of ctapi reads"""
+    # pylint: disable=global-statement,global-variable-undefined
+    global settings, train_tracker_url, bus_tracker_url, divvy_station_information_url
+    global divvy_station_status_url, twitter_tweets_url, enable_train_tracker
+    global train_station_stop_ids, train_dest_do_not_persist, enable_bus_tracker
+    global bus_stop_stop_ids, bus_stop_route_ids, enable_divvy_station_check
+    global divvy_station_ids, enable_twitter_lookup, divvy_name_rules
+    settings = settings_input
 
     # API URL's
     train_tracker_url = settings["train-tracker"]["api-url"]
@@ -551,39 +1053,353 @@ while True:  # Where the magic happens
     enable_divvy_station_check = settings["divvy-tracker"]["enabled"]
     divvy_station_ids = settings["divvy-tracker"]["station-ids"]
     enable_twitter_lookup = settings["tweet-tracker"]["enabled"]
+    # Every street name rule compiled into one pattern - Station names are only shortened once each
+    divvy_name_rules = AbbreviationRules(
+        settings["divvy-tracker"]["street-names-to-remove"])
+    choose_divvy_stations()
+    choose_alert_feed()
+
+
+def validate_settings(settings_input):
+    """Checks settings.json has everything ctapi needs - Returns a list of problems"""
+    if not isinstance(settings_input, dict):
+        return ["Settings must be a JSON object"]
+    settings_problems = []
+    required_keys = {
+        "train-tracker":
+        ["enabled", "station-ids", "do-not-persist-stations", "api-url"],
+        "bus-tracker": ["enabled", "stop-ids", "route-ids", "api-url"],
+        "divvy-tracker": [
+            "enabled", "station-ids", "api-station-information-url",
+            "api-station-status-url", "street-names-to-remove"
+        ],
+        "tweet-tracker": ["enabled", "api-url"]
+    }
+    for section, keys in required_keys.items():
+        if not isinstance(settings_input.get(section), dict):
+            settings_problems.append("Missing section " + section)
+            continue
+        for key in keys:
+            if key not in settings_input[section]:
+                settings_problems.append("Missing " + section + "." + key)
+        if settings_input[section].get("enabled") not in (None, "True",
+                                                          "False"):
+            settings_problems.append(section +
+                                     ".enabled must be \"True\" or \"False\"")
+        for key, value in settings_input[section].items():
+            if key.endswith("refresh-seconds") and (
+                    not isinstance(value, (int, float)) or value <= 0):
+                settings_problems.append(section + "." + key +
+                                         " must be a positive number")
+        if "daily-request-budget" in settings_input[section] and (
+                not isinstance(settings_input[section]["daily-request-budget"],
+                               int)
+                or settings_input[section]["daily-request-budget"] <= 0):
+            settings_problems.append(section +
+                                     ".daily-request-budget must be a positive whole number")
+    if settings_problems:
+        return settings_problems
+    nearest_count = settings_input["divvy-tracker"].get("nearest-stations", 0)
+    if not isinstance(nearest_count, int) or nearest_count < 0:
+        settings_problems.append(
+            "divvy-tracker.nearest-stations must be a whole number (0 to use station-ids)"
+        )
+    alert_feed_name = settings_input["tweet-tracker"].get("feed", "twitter")
+    if alert_feed_name not in ALERT_FEEDS:
+        settings_problems.append("tweet-tracker.feed must be one of " +
+                                 ", ".join(ALERT_FEEDS))
+    elif (alert_feed_name == "cta-alerts" and
+          "cta-alerts-api-url" not in settings_input["tweet-tracker"]):
+        settings_problems.append(
+            "Missing tweet-tracker.cta-alerts-api-url (needed for the cta-alerts feed)")
+    for section, key in (("train-tracker", "station-ids"),
+                         ("bus-tracker", "stop-ids"), ("bus-tracker",
+                                                       "route-ids"),
+                         ("divvy-tracker", "station-ids")):
+        # A bare string would pass as a list of one-character strings
+        if not isinstance(settings_input[section][key], list) or not all(
+                isinstance(item, str) for item in settings_input[section][key]):
+            settings_problems.append(section + "." + key +
+                                     " must be a list of strings")
+    street_names = settings_input["divvy-tracker"]["street-names-to-remove"]
+    if not isinstance(street_names, dict) or not all(
+            isinstance(street_name, str) and isinstance(replacement, str)
+            for street_name, replacement in street_names.items()):
+        settings_problems.append(
+            "divvy-tracker.street-names-to-remove must map each street name to its replacement"
+        )
+    if settings_problems:
+        return settings_problems
+    if len(settings_input["bus-tracker"]["stop-ids"]) != len(
+            settings_input["bus-tracker"]["route-ids"]):
+        settings_problems.append(
+            "bus-tracker.stop-ids and bus-tracker.route-ids must contain an equal number of items"
+        )
+    # A stop's routes are all fetched in one call
+    bus_stop_routes = {}
+    for stop_id, route_id in zip(settings_input["bus-tracker"]["stop-ids"],
+                                 settings_input["bus-tracker"]["route-ids"]):
+        bus_stop_routes.setdefault(stop_id, set()).add(route_id)
+    for stop_id, routes_at_stop in bus_stop_routes.items():
+        if len(routes_at_stop) > BUS_BATCH_MAX_ROUTES:
+            settings_problems.append("bus-tracker stop " + stop_id +
+                                     " can have at most " +
+                                     str(BUS_BATCH_MAX_ROUTES) + " routes")
+    return settings_problems
+
+
+def refresh_sources(due_sources):
+    """Refreshes the sources that are due and publishes a new snapshot for the display"""
+    cycle_start = time.monotonic()
+    api_timings = fetch_sources(due_sources)
+    fetch_stage_end = time.monotonic()
+    with metrics.time_stage("aggregate"):
+        display_items = information_output_to_display()
+    snapshot_publisher.publish(display_items, LATEST_CTA_TWEET)
+    print_fetch_report(api_timings, fetch_stage_end - cycle_start,
+                       time.monotonic() - cycle_start)
+    metrics.log_event("refresh",
+                      sources=due_sources,
+                      items=len(display_items),
+                      fetch_seconds=round(fetch_stage_end - cycle_start, 4),
+                      cycle_seconds=round(time.monotonic() - cycle_start, 4))
+    polling_policy.print_usage_report()
+    report_transport_stats()
+
+
+def report_transport_stats():
+    """Prints and exports requests, handshakes and bytes per upstream host"""
+    http_transport.print_report()
+    for host, host_stats in http_transport.snapshot().items():
+        metrics.set_counter("ctapi_http_requests_total",
+                            host_stats["requests"],
+                            host=host)
+        metrics.set_counter("ctapi_http_connections_total",
+                            host_stats["connections"],
+                            host=host)
+        metrics.set_counter("ctapi_http_connect_seconds_total",
+                            round(host_stats["connect_seconds"], 6),
+                            host=host)
+        metrics.set_counter("ctapi_http_wire_bytes_total",
+                            host_stats["wire_bytes"],
+                            host=host)
+
+
+def apply_changed_settings(settings_watcher, current_settings):
+    """Applies settings.json if it changed and is valid - Returns the new settings, None if nothing was applied
+
+    Settings that can't be checked or applied are reported and current_settings
+    (if there are any yet) are put back, so one bad edit can't stop the loop."""
+    try:
+        new_settings = settings_watcher.check_for_changes()
+        if new_settings is not None:
+            apply_settings(new_settings)
+        return new_settings
+    except Exception as error:  # pylint: disable=broad-except
+        print("Unable to apply settings - Keeping the previous ones: " +
+              str(error))
+        if current_settings is not None:
+            apply_settings(current_settings)
+        return None
+
+
+def fetch_loop():
+    """Producer - Keeps settings current and refreshes each source when it is due"""
+    settings_watcher = SettingsWatcher(settings_file_path, validate_settings)
+    current_settings = None
+    while True:
+        # Settings are only re-read when settings.json changes
+        new_settings = apply_changed_settings(settings_watcher,
+                                              current_settings)
+        if new_settings is not None:
+            current_settings = new_settings
+            schedule_sources()
+        if current_settings is None:
+            time.sleep(SETTINGS_CHECK_SECONDS)
+            continue
+
+        due_sources = refresh_scheduler.due_sources()
+        if due_sources:
+            try:
+                with metrics.time_stage("refresh"):
+                    refresh_sources(due_sources)
+            except Exception as error:  # pylint: disable=broad-except
+                print("Error refreshing " + ", ".join(due_sources) + ": " +
+                      str(error))
+
+        if ctapi_mode == "server":
+            save_warm_state_if_due()
+
+        # Sleep until the next source is due, waking up to check for settings changes
+        time.sleep(
+            min(refresh_scheduler.seconds_until_next_due(),
+                SETTINGS_CHECK_SECONDS))
+
+
+def arrivals_server_query(since_version):
+    """What a client display asks the arrivals server for - Only its own configured items"""
+    return {
+        "since":
+        since_version,
+        "train-stop-ids":
+        ",".join(train_station_stop_ids)
+        if enable_train_tracker == "True" else "",
+        "bus-stop-ids":
+        ",".join(bus_stop_stop_ids) if enable_bus_tracker == "True" else "",
+        "divvy-station-ids":
+        ",".join(divvy_station_ids)
+        if enable_divvy_station_check == "True" else "",
+        "tweet":
+        enable_twitter_lookup
+    }
+
 
-    if (not REFRESH_DISPLAY) or (time.monotonic() - REFRESH_DISPLAY) > 2:
+def subscribe_loop():
+    """Client producer - Keeps settings current and takes every new snapshot from the arrivals server"""
+    settings_watcher = SettingsWatcher(settings_file_path, validate_settings)
+    current_settings = None
+    since_version = 0
+    while True:
+        new_settings = apply_changed_settings(settings_watcher,
+                                              current_settings)
+        if new_settings is not None:
+            current_settings = new_settings
+            # Changed stops need a fresh snapshot rather than waiting for the next one
+            since_version = 0
+        if current_settings is None:
+            time.sleep(SETTINGS_CHECK_SECONDS)
+            continue
+
+        try:
+            api_response = http_transport.get(
+                arrivals_server_url + "/snapshot",
+                params=arrivals_server_query(since_version),
+                timeout=ARRIVALS_LONG_POLL_SECONDS + 5)
+            api_response.raise_for_status()
+            if api_response.status_code == 204:
+                api_circuit_breaker.record_success("Arrivals Server")
+                continue
+            snapshot = api_response.json()
+        # requests' errors are all OSErrors - Catching those keeps requests out of startup
+        except (OSError, ValueError) as error:
+            print("Error reaching the Arrivals Server: " + str(error))
+            time.sleep(api_circuit_breaker.record_failure("Arrivals Server"))
+            continue
+        api_circuit_breaker.record_success("Arrivals Server")
+        since_version = snapshot["version"]
+        snapshot_publisher.publish(
+            [item_from_dict(item) for item in snapshot["items"]],
+            alert_from_dict(snapshot["latest_tweet"]))
+
+
+def display_loop():
+    """Consumer - Pages through the newest snapshot for as long as ctapi runs"""
+    snapshot_publisher.wait_for_snapshot()
+    while True:
         current_time_console = "The Current Time is: " + \
             datetime.strftime(datetime.now(), "%H:%M")
         print("\n" + current_time_console)
+        information_to_display()
+        latest_cta_tweet = snapshot_publisher.latest()["latest_tweet"]
+        if latest_cta_tweet is not None:
+            tweet_output_to_display(latest_cta_tweet)
+        data_age = data_age_tracker.summary()
+        if data_age["max"] is not None:
+            print("Data Age - Average: " + str(round(data_age["average"], 1)) +
+                  "s | Worst: " + str(round(data_age["max"], 1)) + "s")
+        save_warm_state_if_due()
+        time.sleep(DISPLAY_REFRESH_SECONDS)
+
+
+def restore_warm_state():
+    """Puts back the arrivals and alert saved before a restart - Returns the frame that was on the display"""
+    global LATEST_CTA_TWEET  # pylint: disable=global-statement
+    if not warm_state_file_path:
+        return None
+    warm_state = load_warm_state(warm_state_file_path, ARRIVALS_TTL_SECONDS)
+    if warm_state is None:
+        return None
+    items, latest_alert, frame, state_age = warm_state
+    arrivals_store.restore(items)
+    LATEST_CTA_TWEET = latest_alert
+    # Shown straight away, counting down from when each item was last updated
+    snapshot_publisher.publish(items, latest_alert)
+    print("Restored " + str(len(items)) + " items saved " +
+          str(round(state_age)) + "s ago")
+    return frame
+
+
+def save_warm_state_if_due():
+    """Saves the newest snapshot and the frame on the display every WARM_STATE_SAVE_SECONDS"""
+    global warm_state_saved_at  # pylint: disable=global-statement
+    snapshot = snapshot_publisher.latest()
+    if not warm_state_file_path or snapshot is None:
+        return
+    if (warm_state_saved_at is not None and
+            time.monotonic() - warm_state_saved_at < WARM_STATE_SAVE_SECONDS):
+        return
+    warm_state_saved_at = time.monotonic()
+    try:
+        save_warm_state(
+            warm_state_file_path, snapshot["items"], snapshot["latest_tweet"],
+            frame_pipeline.last_frame if frame_pipeline is not None else None)
+    except OSError as error:
+        print("Unable to save the warm state to " + warm_state_file_path +
+              ": " + str(error))
 
-        if train_station_stop_ids != "" and enable_train_tracker == "True":
-            for train_stop_id_to_check in train_station_stop_ids:
-                try:
-                    response = train_api_call_to_cta(train_stop_id_to_check)
-                except:  # pylint: disable=bare-except
-                    print("Error in API Call to Train Tracker")
-
-        if bus_stop_stop_ids != "" and enable_bus_tracker == "True":
-            BUS_COUNT = 0
-            for bus_stop_id in bus_stop_stop_ids:
-                try:
-                    bus_api_call_to_cta(bus_stop_id,
-                                        bus_stop_route_ids[BUS_COUNT])
-                    BUS_COUNT += 1
-                except:  # pylint: disable=bare-except
-                    print("Error in API Call to Bus Tracker")
-
-        if divvy_station_ids != "" and enable_divvy_station_check == "True":
-            try:
-                divvy_process_station_stats(
-                    divvy_api_call_station_status(),
-                    divvy_api_call_station_information())
-            except:  # pylint: disable=bare-except
-                print("Error in API Call to Divvy Tracker")
 
-        information_to_display(
-            information_output_to_display(arrival_information))
-        tweet_output_to_display()
+def start_monitoring():
+    """Opens the structured log and, if METRICS_PORT is set, the metrics endpoint"""
+    metrics.set_gauge("ctapi_up_since_seconds", round(time.time()))
+    try:
+        metrics.start_structured_log(log_file_path)
+    except OSError as error:
+        print("Unable to open the log file " + log_file_path + ": " +
+              str(error))
+    if metrics_port:
+        MetricsServer(metrics, port=int(metrics_port)).start()
+    metrics.log_event("start", mode=ctapi_mode)
+
+
+def start_history():
+    """Starts recording every prediction to HISTORY_DATABASE, unless it is set to ''"""
+    global prediction_history  # pylint: disable=global-statement
+    if not history_database_path:
+        return
+    # sqlite3 is only imported when the history is turned on
+    import sqlite3  # pylint: disable=import-outside-toplevel
+    from history_store import PredictionHistory  # pylint: disable=import-outside-toplevel
+    try:
+        prediction_history = PredictionHistory(history_database_path)
+        prediction_history.start()
+    except (OSError, sqlite3.Error) as error:
+        print("Unable to open the prediction history " +
+              history_database_path + ": " + str(error))
+        prediction_history = None
+
+
+def main():
+    """Where the magic happens"""
+    print("Welcome to TrainTracker, Python/RasPi Edition!")
+    restored_frame = restore_warm_state()
+    start_monitoring()
+    if ctapi_mode == "server":
+        # One fetch loop for every display in the building - No display of its own
+        ArrivalsServer(snapshot_publisher,
+                       port=arrivals_server_port,
+                       wait_seconds=ARRIVALS_LONG_POLL_SECONDS).start()
+        start_history()
+        fetch_loop()
+        return
+    start_display(restored_frame)
+    if ctapi_mode == "client":
+        producer = subscribe_loop
+    else:
+        start_history()
+        producer = fetch_loop
+    threading.Thread(target=producer, name="fetch", daemon=True).start()
+    display_loop()
+
 
-        REFRESH_DISPLAY = time.monotonic()
+if __name__ == "__main__":
+    main()
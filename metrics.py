@@ -0,0 +1,251 @@
+"""Counters, latency histograms and a structured log for monitoring ctapi boards"""
+import json
+import logging
+import os
+import threading
+import time  # Used to Time Each Stage
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# Upper bounds (seconds) of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DATA_AGE_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+METRIC_HELP = {
+    "ctapi_stage_seconds": "Time spent in each stage of the loop",
+    "ctapi_stage_errors_total": "Exceptions raised by each stage of the loop",
+    "ctapi_api_call_seconds": "Time taken by each successful API call",
+    "ctapi_api_calls_total": "API calls made by endpoint",
+    "ctapi_api_errors_total": "Failed API calls by endpoint and kind",
+    "ctapi_data_age_seconds": "Age of the oldest item on each page shown",
+    "ctapi_display_refreshes_total": "Display refreshes by type",
+    "ctapi_http_requests_total": "HTTP requests by upstream host",
+    "ctapi_http_connections_total": "New connections (TCP/TLS handshakes) by upstream host",
+    "ctapi_http_connect_seconds_total": "Time spent opening connections by upstream host",
+    "ctapi_http_wire_bytes_total": "Bytes received over the wire (before gzip is undone) by upstream host",
+    "ctapi_up_since_seconds": "When ctapi started (epoch seconds)"
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count - The Prometheus histogram shape"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Adds one observation"""
+        for bucket_number, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[bucket_number] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Every counter, gauge and histogram ctapi keeps - Safe to update from any thread
+
+    Metrics are keyed by name and a tuple of (label, value) pairs and exported as
+    Prometheus text or JSON. Each event is also written to the structured log if
+    one is set up with start_structured_log()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.event_log = None
+
+    def increment(self, name, amount=1, **labels):
+        """Adds amount to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_counter(self, name, value, **labels):
+        """Sets a counter that is kept somewhere else to its running total"""
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] = value
+
+    def set_gauge(self, name, value, **labels):
+        """Sets a gauge to value"""
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Adds value to a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def time_stage(self, stage):
+        """Times the with block as stage, counting it as an error if it raises"""
+        stage_start = time.monotonic()
+        try:
+            yield
+        except Exception as error:
+            self.increment("ctapi_stage_errors_total", stage=stage)
+            self.log_event("stage_error", stage=stage, error=repr(error))
+            raise
+        finally:
+            self.observe("ctapi_stage_seconds",
+                         time.monotonic() - stage_start,
+                         stage=stage)
+
+    def start_structured_log(self, log_file_path, max_bytes=1048576,
+                             backup_count=5):
+        """Writes every event as one JSON line to log_file_path, rotating at max_bytes"""
+        log_directory = os.path.dirname(log_file_path)
+        if log_directory:
+            os.makedirs(log_directory, exist_ok=True)
+        log_handler = RotatingFileHandler(log_file_path,
+                                          maxBytes=max_bytes,
+                                          backupCount=backup_count,
+                                          encoding='utf-8')
+        log_handler.setFormatter(logging.Formatter("%(message)s"))
+        self.event_log = logging.getLogger("ctapi.events")
+        self.event_log.setLevel(logging.INFO)
+        self.event_log.propagate = False
+        self.event_log.addHandler(log_handler)
+
+    def log_event(self, event, **fields):
+        """Writes {"time", "event", ...fields} to the structured log"""
+        if self.event_log is None:
+            return
+        fields.update({"time": round(time.time(), 3), "event": event})
+        self.event_log.info(json.dumps(fields, default=str))
+
+    def prometheus_text(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        described = set()
+
+        def describe(name, metric_type):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append("# HELP " + name + " " + METRIC_HELP[name])
+                lines.append("# TYPE " + name + " " + metric_type)
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                describe(name, "counter")
+                lines.append(name + label_text(labels) + " " + str(value))
+            for (name, labels), value in sorted(self.gauges.items()):
+                describe(name, "gauge")
+                lines.append(name + label_text(labels) + " " + str(value))
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                describe(name, "histogram")
+                for upper_bound, bucket_count in zip(histogram.buckets,
+                                                     histogram.bucket_counts):
+                    lines.append(name + "_bucket" +
+                                 label_text(labels + (("le", upper_bound), )) +
+                                 " " + str(bucket_count))
+                lines.append(name + "_bucket" +
+                             label_text(labels + (("le", "+Inf"), )) + " " +
+                             str(histogram.count))
+                lines.append(name + "_sum" + label_text(labels) + " " +
+                             str(round(histogram.total, 6)))
+                lines.append(name + "_count" + label_text(labels) + " " +
+                             str(histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def as_json(self):
+        """Every metric as a JSON document"""
+
+        def entries(metrics, value_of):
+            return [
+                dict(labels, name=name, value=value_of(value))
+                for (name, labels), value in sorted(metrics.items())
+            ]
+
+        with self.lock:
+            return json.dumps({
+                "counters":
+                entries(self.counters, lambda value: value),
+                "gauges":
+                entries(self.gauges, lambda value: value),
+                "histograms":
+                entries(
+                    self.histograms, lambda histogram: {
+                        "buckets": dict(
+                            zip(map(str, histogram.buckets),
+                                histogram.bucket_counts)),
+                        "sum": histogram.total,
+                        "count": histogram.count
+                    })
+            })
+
+
+def label_text(labels):
+    """{label="value",...} for a tuple of (label, value) pairs"""
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        label + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') +
+        '"' for label, value in labels) + "}"
+
+
+def metrics_response(registry, request_path):
+    """(status, body, content type) for GET /metrics or /metrics.json - None for any other path"""
+    if request_path == "/metrics":
+        return (200, registry.prometheus_text().encode("utf-8"),
+                "text/plain; version=0.0.4")
+    if request_path == "/metrics.json":
+        return 200, registry.as_json().encode("utf-8"), "application/json"
+    return None
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json on a background thread"""
+
+    def __init__(self, registry, host="0.0.0.0", port=9750):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.http_server = None
+
+    def start(self):
+        """Starts serving"""
+        self.http_server = ThreadingHTTPServer((self.host, self.port),
+                                               MetricsRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.registry = self.registry
+        threading.Thread(target=self.http_server.serve_forever,
+                         name="metrics-server",
+                         daemon=True).start()
+        print("Serving metrics on http://" + self.host + ":" +
+              str(self.http_server.server_address[1]) + "/metrics")
+
+    def stop(self):
+        """Stops serving"""
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Answers GET /metrics and /metrics.json for MetricsServer"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Sends the current metrics"""
+        response = metrics_response(self.server.registry, self.path)
+        if response is None:
+            self.send_error(404)
+            return
+        status, body, content_type = response
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Scrapes aren't logged"""
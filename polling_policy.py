@@ -0,0 +1,121 @@
+"""Adaptive polling intervals that keep each CTA API key within its daily request budget"""
+import time  # Used to Track the Budget Day
+from datetime import datetime, timedelta
+
+
+class PollingPolicy:
+    """Decides how long to wait before polling a stop again
+
+    A stop is polled more often when its next arrival is close and less often when
+    it is far away. Stops with nothing predicted (Bus Tracker answers with an
+    <error>, Train Tracker with no <eta>) are left for max_interval. On top of
+    that, no endpoint is polled faster than its remaining daily budget can pay for
+    until local midnight, when CTA resets the count."""
+
+    def __init__(self, min_interval=20, max_interval=600, lead_fraction=0.25):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.lead_fraction = lead_fraction
+        self.daily_budgets = {}  # endpoint -> requests per day
+        self.requests_today = {}  # endpoint -> requests made since midnight
+        self.budget_day = None
+        self.source_intervals = {}  # source_name -> (endpoint, interval)
+
+    def set_budget(self, endpoint, daily_budget):
+        """Limits endpoint to daily_budget requests a day - None removes the limit"""
+        if daily_budget is None:
+            self.daily_budgets.pop(endpoint, None)
+        else:
+            self.daily_budgets[endpoint] = daily_budget
+
+    def set_sources(self, source_endpoints, default_intervals):
+        """Registers {source_name: endpoint} - New sources start at their default interval"""
+        self.source_intervals = {
+            source_name: (endpoint,
+                          self.source_intervals.get(
+                              source_name,
+                              (endpoint, default_intervals[source_name]))[1])
+            for source_name, endpoint in source_endpoints.items()
+        }
+
+    def record_request(self, endpoint, now=None):
+        """Counts one request against endpoint's budget for today"""
+        self.roll_over_day(now)
+        self.requests_today[endpoint] = self.requests_today.get(endpoint,
+                                                                0) + 1
+
+    def roll_over_day(self, now=None):
+        """Starts a fresh count at local midnight"""
+        today = time.localtime(time.time() if now is None else now)[:3]
+        if today != self.budget_day:
+            self.budget_day = today
+            self.requests_today = {}
+
+    def next_interval(self, source_name, nearest_arrival_seconds, now=None):
+        """Seconds until source_name should be polled again, given how far away its next arrival is
+
+        None for a source that was never registered."""
+        if source_name not in self.source_intervals:
+            return None
+        endpoint, _ = self.source_intervals[source_name]
+        if nearest_arrival_seconds is None:
+            interval = self.max_interval
+        else:
+            interval = min(
+                max(nearest_arrival_seconds * self.lead_fraction,
+                    self.min_interval), self.max_interval)
+        interval = max(interval, self.budget_interval(endpoint, now))
+        self.source_intervals[source_name] = (endpoint, interval)
+        return interval
+
+    def budget_interval(self, endpoint, now=None):
+        """Shortest interval every source on endpoint can poll at without running out before midnight"""
+        if endpoint not in self.daily_budgets:
+            return 0
+        self.roll_over_day(now)
+        seconds_left = seconds_until_midnight(now)
+        requests_left = self.daily_budgets[endpoint] - self.requests_today.get(
+            endpoint, 0)
+        if requests_left <= 0:
+            return seconds_left
+        source_count = sum(1 for source_endpoint, _ in
+                           self.source_intervals.values()
+                           if source_endpoint == endpoint)
+        return seconds_left * max(source_count, 1) / requests_left
+
+    def projected_usage(self, now=None):
+        """{endpoint: (requests so far, projected requests by midnight, daily budget)}"""
+        self.roll_over_day(now)
+        seconds_left = seconds_until_midnight(now)
+        projected = {}
+        for endpoint, interval in self.source_intervals.values():
+            projected[endpoint] = projected.get(endpoint,
+                                                0) + seconds_left / interval
+        return {
+            endpoint: (self.requests_today.get(endpoint, 0),
+                       round(self.requests_today.get(endpoint, 0) +
+                             projected_requests),
+                       self.daily_budgets.get(endpoint))
+            for endpoint, projected_requests in projected.items()
+        }
+
+    def print_usage_report(self, now=None):
+        """Prints today's requests and where each endpoint is headed by midnight"""
+        for endpoint, (used, projected,
+                       budget) in self.projected_usage(now).items():
+            usage_line = ("  " + endpoint + " - Used Today: " + str(used) +
+                          " | Projected: " + str(projected))
+            if budget is not None:
+                usage_line += (" of " + str(budget) + " (" +
+                               str(round(projected / budget * 100)) + "%)")
+                if projected > budget:
+                    usage_line += " - Over Budget, Slowing Down"
+            print(usage_line)
+
+
+def seconds_until_midnight(now=None):
+    """Seconds left in the local day"""
+    current_time = datetime.fromtimestamp(time.time() if now is None else now)
+    midnight = datetime.combine(current_time.date() + timedelta(days=1),
+                                datetime.min.time())
+    return (midnight - current_time).total_seconds()
@@ -0,0 +1,73 @@
+"""Caches for the pieces of each e-ink page that rarely change"""
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+
+class RenderCache:
+    """Keeps pre-scaled 1-bit icons, page templates and rendered text bitmaps
+
+    Station names, routes and headers repeat page after page, so once a string has
+    been rendered in a font it is kept as a 1-bit mask and pasted from then on.
+    Text bitmaps are bounded by max_text_bitmaps and evicted least recently used."""
+
+    def __init__(self, max_text_bitmaps=256):
+        self.max_text_bitmaps = max_text_bitmaps
+        self.icons = {}
+        self.templates = {}
+        self.text_bitmaps = OrderedDict()
+        self.text_hits = 0
+        self.text_misses = 0
+
+    def icon(self, icon_path, icon_size):
+        """Returns the icon at icon_path scaled to icon_size and converted to 1-bit, loading it once"""
+        icon_key = (icon_path, icon_size)
+        if icon_key not in self.icons:
+            with Image.open(icon_path) as icon_image:
+                self.icons[icon_key] = icon_image.resize(icon_size).convert(
+                    '1')
+        return self.icons[icon_key]
+
+    def template(self, template_name, build_template):
+        """Returns a copy of a static page, calling build_template() the first time only"""
+        if template_name not in self.templates:
+            self.templates[template_name] = build_template()
+        return self.templates[template_name].copy()
+
+    def text_mask(self, font, text):
+        """Returns (1-bit mask, offset) of text drawn in font, or None for blank text"""
+        text_key = (font, text)
+        if text_key in self.text_bitmaps:
+            self.text_bitmaps.move_to_end(text_key)
+            self.text_hits += 1
+            return self.text_bitmaps[text_key]
+        self.text_misses += 1
+        text_box = font.getbbox(text)
+        # Glyphs like "j" can reach left of/above the anchor - Keep that offset with the bitmap
+        offset = (min(text_box[0], 0), min(text_box[1], 0))
+        if text_box[2] <= text_box[0] or text_box[3] <= text_box[1]:
+            text_bitmap = None
+        else:
+            text_bitmap = Image.new(
+                '1', (text_box[2] - offset[0], text_box[3] - offset[1]), 0)
+            ImageDraw.Draw(text_bitmap).text((-offset[0], -offset[1]),
+                                             text,
+                                             font=font,
+                                             fill=255)
+            text_bitmap = (text_bitmap, offset)
+        self.text_bitmaps[text_key] = text_bitmap
+        if len(self.text_bitmaps) > self.max_text_bitmaps:
+            self.text_bitmaps.popitem(last=False)
+        return text_bitmap
+
+    def draw_text(self, image, position, text, font):
+        """Draws text in black onto image at position, same as ImageDraw.text(fill=0)"""
+        text_bitmap = self.text_mask(font, text)
+        if text_bitmap is not None:
+            text_mask, offset = text_bitmap
+            left = position[0] + offset[0]
+            top = position[1] + offset[1]
+            image.paste(
+                0,
+                (left, top, left + text_mask.width, top + text_mask.height),
+                text_mask)
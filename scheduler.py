@@ -0,0 +1,108 @@
+"""Per-source refresh scheduling and settings.json reloading"""
+import json
+import os
+import random
+import time  # Used to Track Deadlines
+
+
+class RefreshScheduler:
+    """Keeps a deadline per source so each one refreshes at its own interval
+
+    Sources are registered with an interval and jitter (seconds) every time the
+    settings are applied. The main loop asks which sources are due, refreshes
+    them, and sleeps until the next deadline instead of spinning."""
+
+    def __init__(self):
+        self.intervals = {}
+        self.next_due = {}
+
+    def set_sources(self, source_intervals):
+        """Replaces the registered sources with {source_name: (interval, jitter)}
+
+        Sources that were already registered keep their deadline, new ones are due now."""
+        self.intervals = dict(source_intervals)
+        self.next_due = {
+            source_name: self.next_due.get(source_name, 0)
+            for source_name in self.intervals
+        }
+
+    def due_sources(self, now=None):
+        """Every source whose deadline has passed"""
+        now = time.monotonic() if now is None else now
+        return [
+            source_name for source_name, due_time in self.next_due.items()
+            if due_time <= now
+        ]
+
+    def mark_refreshed(self, source_name, now=None, interval=None):
+        """Schedules the next refresh of source_name one interval (plus jitter) from now
+
+        interval overrides the registered interval for this refresh only, and the
+        jitter is scaled to match."""
+        if source_name not in self.intervals:
+            return
+        now = time.monotonic() if now is None else now
+        registered_interval, jitter = self.intervals[source_name]
+        if interval is not None:
+            jitter = jitter * interval / registered_interval
+        else:
+            interval = registered_interval
+        self.next_due[source_name] = now + interval + random.uniform(
+            0, jitter)
+
+    def retry_in(self, source_name, retry_delay, now=None):
+        """Schedules source_name to be tried again after retry_delay seconds"""
+        if source_name not in self.intervals:
+            return
+        now = time.monotonic() if now is None else now
+        self.next_due[source_name] = now + retry_delay
+
+    def seconds_until_due(self, source_name, now=None):
+        """How long until source_name is next refreshed - None if it isn't registered"""
+        if source_name not in self.next_due:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0, self.next_due[source_name] - now)
+
+    def seconds_until_next_due(self, now=None):
+        """How long the loop can sleep before something needs doing"""
+        if not self.next_due:
+            return 1
+        now = time.monotonic() if now is None else now
+        return max(0, min(self.next_due.values()) - now)
+
+
+class SettingsWatcher:
+    """Re-reads settings.json only when its modification time changes"""
+
+    def __init__(self, settings_file_path, validate_settings):
+        self.settings_file_path = settings_file_path
+        self.validate_settings = validate_settings
+        self.last_modified = None
+
+    def check_for_changes(self):
+        """Returns the new settings if the file changed and is valid, otherwise None"""
+        try:
+            modified_time = os.stat(self.settings_file_path).st_mtime_ns
+        except OSError as error:
+            print("Unable to read settings: " + str(error))
+            return None
+        if modified_time == self.last_modified:
+            return None
+        self.last_modified = modified_time
+        try:
+            with open(file=self.settings_file_path, mode='r',
+                      encoding='utf-8') as file:
+                settings = json.load(file)
+        except (OSError, ValueError) as error:
+            print("Unable to load settings - Keeping the previous ones: " +
+                  str(error))
+            return None
+        settings_problems = self.validate_settings(settings)
+        if settings_problems:
+            print("Invalid settings - Keeping the previous ones:")
+            for settings_problem in settings_problems:
+                print("  " + settings_problem)
+            return None
+        print("Loaded settings from " + self.settings_file_path)
+        return settings
@@ -0,0 +1,84 @@
+"""Hands arrivals snapshots from the fetch thread to the display thread"""
+import threading
+import time  # Used to Measure Data Age
+from collections import deque
+
+
+class SnapshotPublisher:
+    """Holds the newest display snapshot - The fetch thread publishes, the display reads
+
+    A snapshot is never changed after it is published - The store swaps in new
+    records rather than changing the ones a snapshot holds - so the display can
+    keep using one while the next is being built."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.snapshot = None
+        self.version = 0
+
+    def publish(self, items, latest_tweet):
+        """Replaces the current snapshot with the given display items and tweet"""
+        with self.condition:
+            self.version += 1
+            self.snapshot = {
+                "version": self.version,
+                "published_at": time.time(),
+                "items": items,
+                "latest_tweet": latest_tweet
+            }
+            self.condition.notify_all()
+
+    def latest(self):
+        """The newest snapshot, or None if nothing has been published yet"""
+        return self.snapshot
+
+    def wait_for_snapshot(self, timeout=None):
+        """Blocks until at least one snapshot has been published"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.snapshot is not None,
+                                    timeout=timeout)
+        return self.snapshot
+
+    def wait_for_newer(self, version, timeout=None):
+        """Blocks until there is a snapshot other than version - Returns None on timeout
+
+        Any other version counts as newer, so a client still holding a version from
+        before a restart gets the current snapshot straight away."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.snapshot is not None and self.snapshot["version"]
+                != version,
+                timeout=timeout)
+            if self.snapshot is None or self.snapshot["version"] == version:
+                return None
+            return self.snapshot
+
+
+class DataAgeTracker:
+    """Keeps how old the data was each time a page was put on the display"""
+
+    def __init__(self, window_size=200):
+        self.samples = deque(maxlen=window_size)
+        self.last_age = None
+
+    def record(self, updated_times):
+        """Records the age of the oldest item on a page, given when each item was last updated"""
+        updated_times = [
+            updated_time for updated_time in updated_times
+            if updated_time is not None
+        ]
+        if not updated_times:
+            return None
+        self.last_age = time.time() - min(updated_times)
+        self.samples.append(self.last_age)
+        return self.last_age
+
+    def summary(self):
+        """Last, average and worst data age (seconds) over the recent window"""
+        if not self.samples:
+            return {"last": None, "average": None, "max": None}
+        return {
+            "last": self.last_age,
+            "average": sum(self.samples) / len(self.samples),
+            "max": max(self.samples)
+        }
@@ -0,0 +1,161 @@
+"""Grid index and vectorized distances for finding the Divvy stations closest to home"""
+import math
+
+try:
+    import numpy
+except ImportError:  # numpy is optional - The plain Python path is still fast enough for one query
+    numpy = None
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LATITUDE = 69.05
+# About 0.7 x 0.5 miles in Chicago - A handful of stations per cell downtown
+GRID_CELL_DEGREES = 0.01
+# Searching more rings than this costs more than measuring every station
+MAX_GRID_RINGS = 25
+
+
+def haversine_miles(latitude, longitude, latitudes, longitudes):
+    """Great-circle distance in miles from one point to every point in latitudes/longitudes
+
+    With numpy this is one vectorized pass over the arrays, otherwise a list."""
+    if numpy is None:
+        origin_latitude = math.radians(latitude)
+        distances = []
+        for point_latitude, point_longitude in zip(latitudes, longitudes):
+            point_latitude = math.radians(point_latitude)
+            half_chord = (math.sin((point_latitude - origin_latitude) / 2)**2 +
+                          math.cos(origin_latitude) * math.cos(point_latitude) *
+                          math.sin(math.radians(point_longitude - longitude) /
+                                   2)**2)
+            distances.append(2 * EARTH_RADIUS_MILES *
+                             math.asin(math.sqrt(half_chord)))
+        return distances
+    origin_latitude = math.radians(latitude)
+    point_latitudes = numpy.radians(latitudes)
+    half_chord = (numpy.sin((point_latitudes - origin_latitude) / 2)**2 +
+                  math.cos(origin_latitude) * numpy.cos(point_latitudes) *
+                  numpy.sin(numpy.radians(longitudes - longitude) / 2)**2)
+    return 2 * EARTH_RADIUS_MILES * numpy.arcsin(numpy.sqrt(half_chord))
+
+
+def ring_cells(center_row, center_column, ring):
+    """The grid cells exactly ring cells away from the center cell"""
+    if ring == 0:
+        return [(center_row, center_column)]
+    cells = []
+    for offset in range(-ring, ring + 1):
+        cells.append((center_row - ring, center_column + offset))
+        cells.append((center_row + ring, center_column + offset))
+    for offset in range(-ring + 1, ring):
+        cells.append((center_row + offset, center_column - ring))
+        cells.append((center_row + offset, center_column + ring))
+    return cells
+
+
+def grid_cell(latitude, longitude):
+    """The grid cell a point falls in"""
+    return (math.floor(latitude / GRID_CELL_DEGREES),
+            math.floor(longitude / GRID_CELL_DEGREES))
+
+
+class StationIndex:
+    """Every Divvy station's location, bucketed into a lat/lon grid
+
+    Built from the station_information feed whenever its set of stations changes.
+    Distances from home are worked out for every station in one pass when the
+    index is built and kept, so a station's distance is never recomputed."""
+
+    def __init__(self, station_locations, home_latitude, home_longitude):
+        """station_locations is {station_id: (latitude, longitude)}"""
+        self.station_ids = list(station_locations)
+        self.position = {
+            station_id: position
+            for position, station_id in enumerate(self.station_ids)
+        }
+        latitudes = [
+            station_locations[station_id][0] for station_id in self.station_ids
+        ]
+        longitudes = [
+            station_locations[station_id][1] for station_id in self.station_ids
+        ]
+        if numpy is not None:
+            latitudes = numpy.array(latitudes, dtype=float)
+            longitudes = numpy.array(longitudes, dtype=float)
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.grid = {}  # (row, column) -> [position, ...]
+        for position in range(len(self.station_ids)):
+            self.grid.setdefault(
+                grid_cell(float(latitudes[position]),
+                          float(longitudes[position])), []).append(position)
+        self.home_distances = haversine_miles(home_latitude, home_longitude,
+                                              latitudes, longitudes)
+        self.home = (home_latitude, home_longitude)
+
+    def distance_from_home(self, station_id):
+        """Miles from home to a station, None if the station isn't in the feed"""
+        if station_id not in self.position:
+            return None
+        return float(self.home_distances[self.position[station_id]])
+
+    def nearest(self, latitude, longitude, count):
+        """The count closest stations to a point as [(station_id, miles)], closest first
+
+        Grid cells are searched in rings around the point's cell, stopping once
+        everything outside the rings searched so far must be further away than the
+        count-th closest station found. A point far from every station falls back
+        to one pass over all of them."""
+        if (latitude, longitude) == self.home:
+            return self.nearest_to_home(count)
+        center_row, center_column = grid_cell(latitude, longitude)
+        miles_per_degree_longitude = MILES_PER_DEGREE_LATITUDE * math.cos(
+            math.radians(min(abs(latitude) + 1, 89)))
+        found = []  # (miles, position)
+        for ring in range(MAX_GRID_RINGS):
+            ring_positions = []
+            for row, column in ring_cells(center_row, center_column, ring):
+                ring_positions.extend(self.grid.get((row, column), ()))
+            if ring_positions:
+                found.extend(
+                    zip(self.distances_to(latitude, longitude,
+                                          ring_positions), ring_positions))
+            if len(found) == len(self.station_ids):
+                break
+            # Anything in a cell outside this ring is at least this far away
+            closest_unsearched = (ring * GRID_CELL_DEGREES *
+                                  miles_per_degree_longitude)
+            found.sort()
+            if len(found) >= count and found[count - 1][0] <= closest_unsearched:
+                break
+        else:
+            found = sorted(
+                zip(
+                    self.distances_to(latitude, longitude,
+                                      range(len(self.station_ids))),
+                    range(len(self.station_ids))))
+        found.sort()
+        return [(self.station_ids[position], miles)
+                for miles, position in found[:count]]
+
+    def distances_to(self, latitude, longitude, positions):
+        """Miles from a point to the stations at positions"""
+        positions = list(positions)
+        if numpy is None:
+            return haversine_miles(
+                latitude, longitude,
+                [self.latitudes[position] for position in positions],
+                [self.longitudes[position] for position in positions])
+        return haversine_miles(latitude, longitude, self.latitudes[positions],
+                               self.longitudes[positions]).tolist()
+
+    def nearest_to_home(self, count):
+        """The count closest stations to home - Answered from the distances worked out at build"""
+        if numpy is None:
+            closest = sorted(range(len(self.station_ids)),
+                             key=self.home_distances.__getitem__)[:count]
+        else:
+            closest = numpy.argsort(self.home_distances,
+                                    kind="stable")[:count].tolist()
+        return [(self.station_ids[position],
+                 float(self.home_distances[position]))
+                for position in closest]
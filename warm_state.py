@@ -0,0 +1,73 @@
+"""Warm state - What was on the board, kept on disk so a restart can put it straight back"""
+import base64
+import json
+import os
+import time  # Used to Check How Old the Saved State Is
+
+from PIL import Image
+
+from alert_feeds import alert_from_dict, alert_to_dict
+from arrivals_store import item_from_dict, item_to_dict
+
+# Bumped whenever the file layout changes - Older files are ignored
+WARM_STATE_VERSION = 2
+
+
+def save_warm_state(state_file_path, items, latest_alert, frame=None):
+    """Saves the display items, alert and frame on the display to state_file_path
+
+    The state is written to a temporary file, flushed to the card and swapped in
+    with os.replace, so a power cut leaves either the old file or the new one."""
+    state_directory = os.path.dirname(state_file_path)
+    if state_directory:
+        os.makedirs(state_directory, exist_ok=True)
+    warm_state = {
+        "version": WARM_STATE_VERSION,
+        "saved_at": time.time(),
+        "items": [item_to_dict(item) for item in items],
+        "latest_alert": alert_to_dict(latest_alert),
+        "frame": None
+    }
+    if frame is not None:
+        # A 1-bit 250x122 frame is under 4 KiB
+        warm_state["frame"] = {
+            "mode": frame.mode,
+            "size": list(frame.size),
+            "data": base64.b64encode(frame.tobytes()).decode("ascii")
+        }
+    temporary_file_path = state_file_path + ".tmp"
+    with open(temporary_file_path, mode='w',
+              encoding='utf-8') as temporary_file:
+        json.dump(warm_state, temporary_file, separators=(",", ":"))
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_file_path, state_file_path)
+
+
+def load_warm_state(state_file_path, max_age_seconds):
+    """(items, latest alert, frame or None, seconds since it was saved) - None if there's nothing usable
+
+    Items keep the time they were last updated, so their arrivals count down from
+    there and are marked stale like any other old data."""
+    try:
+        with open(state_file_path, mode='r',
+                  encoding='utf-8') as state_file:
+            warm_state = json.load(state_file)
+        if warm_state.get("version") != WARM_STATE_VERSION:
+            return None
+        state_age = time.time() - warm_state["saved_at"]
+        if not 0 <= state_age <= max_age_seconds:
+            return None
+        items = [item_from_dict(item) for item in warm_state["items"]]
+        latest_alert = alert_from_dict(warm_state["latest_alert"])
+        frame = None
+        if warm_state["frame"] is not None:
+            frame = Image.frombytes(
+                warm_state["frame"]["mode"], tuple(warm_state["frame"]["size"]),
+                base64.b64decode(warm_state["frame"]["data"]))
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        if not isinstance(error, FileNotFoundError):
+            print("Ignoring the saved state in " + state_file_path + ": " +
+                  str(error))
+        return None
+    return items, latest_alert, frame, state_age